@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""Diff two run_benchmarks.py result files and flag regressions."""
+
+import argparse
+import json
+import sys
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare two benchmark result JSON files')
+    parser.add_argument('baseline', help='Results JSON from the reference commit')
+    parser.add_argument('candidate', help='Results JSON to compare against the baseline')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='Relative slowdown counted as a regression (default: 0.10 = 10%%)')
+    args = parser.parse_args()
+
+    with open(args.baseline) as f:
+        base = json.load(f)
+    with open(args.candidate) as f:
+        cand = json.load(f)
+
+    print(f"Baseline:  {base['meta'].get('revision')} ({base['meta'].get('timestamp')})")
+    print(f"Candidate: {cand['meta'].get('revision')} ({cand['meta'].get('timestamp')})\n")
+    print(f"{'benchmark':<40}{'base s':>12}{'cand s':>12}{'change':>10}")
+
+    regressions = 0
+    for name in sorted(set(base["results"]) | set(cand["results"])):
+        if name not in base["results"] or name not in cand["results"]:
+            where = "baseline" if name in base["results"] else "candidate"
+            print(f"{name:<40}{'(only in ' + where + ')':>34}")
+            continue
+        old = base["results"][name]["min_s"]
+        new = cand["results"][name]["min_s"]
+        change = (new - old) / old if old else 0.0
+        flag = ""
+        if change > args.threshold:
+            flag = "  ❌ regression"
+            regressions += 1
+        elif change < -args.threshold:
+            flag = "  ✅ faster"
+        print(f"{name:<40}{old:>12.4f}{new:>12.4f}{change:>+10.1%}{flag}")
+
+    print(f"\n{regressions} regression(s) beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""A local stand-in for the OpenAI chat completions endpoint with fixed latency.
+
+Point the scripts at it with:
+
+    OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=fake python ...
+
+Answers are canned per task (a UPOS tag, a label, a head word, a JSON map of
+head words for packed prompts, "no", or a well-formed CoNLL-U parse or JSON
+token records for oneshot prompts) so the scripts run their normal post-processing paths.
+
+Prompt caching is simulated the way the API reports it: a prompt whose first
+N tokens (whitespace words here) match an earlier prompt, with N a multiple of
+--cache_block (128) and at least --cache_min_tokens (1024), reports N as
+usage.prompt_tokens_details.cached_tokens and answers proportionally faster.
+
+With n > 1 and a temperature above 0, some samples (about temperature / 3 of
+them, chosen deterministically per prompt) answer "other" instead, so
+self-consistency voting sees disagreement.
+
+stream=True is answered with server-sent chunks of about one token each,
+--stream_chunk_ms apart, and a usage chunk when stream_options asks for it; a
+client that closes the connection stops the stream.  --bad_answer_rate makes
+that share of oneshot CoNLL-U answers (chosen deterministically per prompt)
+open with prose, sit in a code fence or skip a token id, to exercise early
+aborts.
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def canned_answer(prompt: str) -> str:
+    if "Universal POS" in prompt or "UPOS tag" in prompt:
+        return "NOUN"
+    if "dependency label" in prompt:
+        return "nsubj"
+    if "Return corrected records for only tokens" in prompt:
+        ids = [int(i) for i in re.findall(r"\d+", prompt.rsplit("only tokens", 1)[1].split("keeping")[0])]
+        return json.dumps({"tokens": [
+            {"id": i, "form": "_", "lemma": "_", "upos": "NOUN", "head": 0 if i == 1 else 1, "deprel": "root" if i == 1 else "dep"}
+            for i in ids]})
+    if "one record per token" in prompt:
+        words = re.findall(r"(\d+):(\S+)", prompt.rsplit("Tokens:", 1)[1])
+        return json.dumps({"tokens": [
+            {"id": int(i), "form": w, "lemma": w.lower(), "upos": "NOUN", "head": 0 if i == "1" else 1,
+             "deprel": "root" if i == "1" else "dep"}
+            for i, w in words]})
+    if "CoNLL-U format" in prompt and "Sentence:" in prompt:
+        words = prompt.rsplit("Sentence:", 1)[1].split()
+        return "\n".join(
+            f"{i}\t{w}\t_\tNOUN\t_\t_\t{0 if i == 1 else 1}\t{'root' if i == 1 else 'dep'}\t_\t_"
+            for i, w in enumerate(words, 1)
+        )
+    if "JSON object mapping each item number" in prompt:
+        sentences = re.findall(r'^(\d+)\. Sentence: "(.*)"$', prompt, re.M)
+        return json.dumps({n: (text.split() + ["saw"] * 3)[2].strip(".,").lower() for n, text in sentences})
+    if "attach to syntactically" in prompt:
+        return "saw"
+    if "Do you see any errors" in prompt:
+        return "no"
+    if "Respond with only its number" in prompt:
+        return "0" if "token 1 " in prompt else "1"
+    if "modify" in prompt:
+        return "root"
+    return "ok"
+
+
+def fake_logprobs(answer: str, top_k: int) -> dict:
+    """Logprobs for the first answer token: the answer itself plus a few weaker numeric alternatives."""
+    first = answer.split()[0] if answer.split() else ""
+    alternatives = [first] + [str(i) for i in range(top_k + 1) if str(i) != first][:top_k - 1]
+    top = [{"token": tok, "logprob": -0.05 - 2.0 * rank, "bytes": list(tok.encode())}
+           for rank, tok in enumerate(alternatives)]
+    return {"content": [{"token": first, "logprob": -0.05, "bytes": list(first.encode()), "top_logprobs": top}]}
+
+
+def spoil(answer: str, prompt: str) -> str:
+    """A oneshot CoNLL-U answer gone wrong in one of the ways models get it wrong."""
+    lines = answer.split("\n")
+    kind = random.Random(prompt).randrange(3)
+    if kind == 0:
+        return "Sure! Here is the dependency parse of the sentence in CoNLL-U format:\n\n" + answer
+    if kind == 1:
+        return "```conllu\n" + answer + "\n```"
+    return "\n".join(lines[:1] + lines[2:]) if len(lines) > 2 else answer + "\n\nThis parse follows UD guidelines."
+
+
+def cached_prefix(server, words) -> int:
+    """Longest cached block-aligned prefix of this prompt, then remember its own prefixes."""
+    block = server.cache_block
+    blocks = len(words) // block
+    keys = [hash(tuple(words[:b * block])) for b in range(1, blocks + 1)]
+    with server.count_lock:
+        hit = next((b for b in range(blocks, 0, -1) if keys[b - 1] in server.prefixes), 0) * block
+        server.prefixes.update(keys)
+    return hit if hit >= server.cache_min_tokens else 0
+
+
+def make_handler(latency_s: float):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+            with self.server.count_lock:
+                self.server.request_count += 1
+            words = prompt.split()
+            cached = cached_prefix(self.server, words)
+            time.sleep(latency_s * (1 - 0.5 * cached / len(words)) if words else latency_s)
+
+            answer = canned_answer(prompt)
+            if ("CoNLL-U format" in prompt and self.server.bad_answer_rate
+                    and random.Random(f"bad|{prompt}").random() < self.server.bad_answer_rate):
+                answer = spoil(answer, prompt)
+            n = body.get("n", 1) or 1
+            temperature = body.get("temperature") or 0
+            answers = [answer if not temperature or random.Random(f"{prompt}|{i}").random() >= temperature / 3
+                       else "other" for i in range(n)]
+            usage = {
+                "prompt_tokens": len(words),
+                "completion_tokens": sum(len(sample.split()) for sample in answers),
+                "total_tokens": len(words) + sum(len(sample.split()) for sample in answers),
+                "prompt_tokens_details": {"cached_tokens": cached},
+            }
+            if body.get("stream"):
+                include_usage = (body.get("stream_options") or {}).get("include_usage")
+                self.stream(body.get("model", "fake"), answers[0], usage if include_usage else None)
+                return
+            payload = {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model", "fake"),
+                "choices": [
+                    {"index": i, "message": {"role": "assistant", "content": sample}, "finish_reason": "stop",
+                     "logprobs": fake_logprobs(sample, body.get("top_logprobs") or 1) if body.get("logprobs") else None}
+                    for i, sample in enumerate(answers)
+                ],
+                "usage": usage,
+            }
+            data = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def stream(self, model: str, answer: str, usage):
+            """Send the answer as server-sent chunks until done or the client hangs up."""
+            def chunk(delta, finish_reason=None, usage=None):
+                return {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": model, "usage": usage,
+                        "choices": [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]}
+
+            pieces = re.findall(r"\s*(?:\w+|[^\w\s])|\s+", answer)
+            events = ([chunk({"role": "assistant", "content": ""})] + [chunk({"content": piece}) for piece in pieces]
+                      + [chunk({}, "stop")] + ([chunk(None, usage=dict(usage, completion_tokens=len(pieces)))]
+                                               if usage else []))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            try:
+                for event in events:
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+                    self.wfile.flush()
+                    if event["choices"] and event["choices"][0]["delta"].get("content"):
+                        time.sleep(self.server.stream_chunk_s)
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                with self.server.count_lock:
+                    self.server.streams_cancelled += 1
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def start_server(port: int = 0, latency_ms: float = 50.0, cache_min_tokens: int = 1024,
+                 cache_block: int = 128, stream_chunk_ms: float = 5.0,
+                 bad_answer_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Start the server on a background thread; port 0 picks a free port."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(latency_ms / 1000.0))
+    server.request_count = 0
+    server.prefixes = set()
+    server.cache_min_tokens = cache_min_tokens
+    server.cache_block = cache_block
+    server.stream_chunk_s = stream_chunk_ms / 1000.0
+    server.bad_answer_rate = bad_answer_rate
+    server.streams_cancelled = 0
+    server.count_lock = threading.Lock()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake OpenAI chat completions endpoint')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency_ms', type=float, default=50.0, help='Fixed latency added to every request')
+    parser.add_argument('--cache_min_tokens', type=int, default=1024,
+                        help='Shortest prompt prefix the simulated prompt cache reuses (default: 1024, as the API)')
+    parser.add_argument('--cache_block', type=int, default=128,
+                        help='Granularity of the simulated prompt cache in tokens (default: 128, as the API)')
+    parser.add_argument('--stream_chunk_ms', type=float, default=5.0,
+                        help='Delay between streamed chunks (default: 5)')
+    parser.add_argument('--bad_answer_rate', type=float, default=0.0,
+                        help='Share of oneshot CoNLL-U answers that are malformed (default: 0)')
+    args = parser.parse_args()
+
+    server = start_server(args.port, args.latency_ms, args.cache_min_tokens, args.cache_block,
+                          args.stream_chunk_ms, args.bad_answer_rate)
+    print(f"Fake OpenAI endpoint on http://127.0.0.1:{server.server_address[1]}/v1 "
+          f"(latency {args.latency_ms:.0f} ms). Ctrl-C to stop.")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
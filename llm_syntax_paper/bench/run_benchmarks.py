@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""Time the non-LLM hot paths on synthetic treebanks and write the results as JSON.
+
+Example:
+    python bench/run_benchmarks.py --sizes 1k,100k,1m --output bench/results/HEAD.json
+    python bench/compare_results.py bench/results/base.json bench/results/HEAD.json
+"""
+
+import argparse
+import contextlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Callable, Dict, List
+
+import numpy as np
+
+from synth_treebank import (parse_size, synth_sentences, write_deprel_log, write_pp_examples,
+                            write_tag_log, write_treebank)
+from fake_openai_server import start_server
+
+MST_MAX_TOKENS = 50_000
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+def load_script(relative_path: str):
+    """Import one of the experiment scripts as a module, by path."""
+    path = os.path.join(ROOT, relative_path)
+    name = os.path.splitext(os.path.basename(path))[0]
+    # Scripts import their sibling modules (e.g. reranker/risk_gate.py) as top-level modules.
+    if os.path.dirname(path) not in sys.path:
+        sys.path.insert(0, os.path.dirname(path))
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def time_it(func: Callable, repeat: int) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def record(results: Dict, name: str, times: List[float], units: int, unit: str = "tokens"):
+    best = min(times)
+    results[name] = {
+        "seconds": [round(t, 6) for t in times],
+        "min_s": round(best, 6),
+        "mean_s": round(sum(times) / len(times), 6),
+        unit: units,
+        f"{unit}_per_s": round(units / best, 1) if best else None,
+    }
+    print(f"  {name:<40} min {best:9.4f}s  ({results[name][f'{unit}_per_s']} {unit}/s)")
+
+
+def memory_per_token(func: Callable, n_tokens: int) -> float:
+    """Bytes still allocated per token once func() has returned its result."""
+    tracemalloc.start()
+    result = func()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size / n_tokens
+
+
+def bench_loaders(label: str, treebank: str, n_tokens: int, repeat: int, results: Dict):
+    """Stanza's flattened conll2dict dicts against the slotted common.sentence objects."""
+    from stanza.utils.conll import CoNLL
+    from common.sentence import load_sentences
+
+    def conll2dict():
+        doc = CoNLL.conll2dict(input_file=treebank)
+        return [sentence for doc_sentences in doc for sentence in doc_sentences]
+
+    for name, func in (("conll2dict", conll2dict), ("load_sentences", lambda: load_sentences(treebank))):
+        key = f"{name}/{label}"
+        record(results, key, time_it(func, repeat), n_tokens)
+        results[key]["bytes_per_token"] = round(memory_per_token(func, n_tokens), 1)
+        print(f"  {'':<40} {results[key]['bytes_per_token']:9.1f} bytes/token")
+
+
+def stanza_like_words(rows):
+    """Objects with the attributes analyze_attachment reads from Stanza words."""
+    words, offset = [], 0
+    for tid, form, _, _, _, head, _ in rows:
+        words.append(SimpleNamespace(id=tid, text=form, head=head, start_char=offset, end_char=offset + len(form)))
+        offset += len(form) + 1
+    return words
+
+
+def bench_size(label: str, n_tokens: int, workdir: str, repeat: int, results: Dict):
+    tags = load_script('python/preliminary/ask_chatgpt_tags.py')
+    oneshot = load_script('python/preliminary/ask_chatgpt_oneshot.py')
+    reranker = load_script('python/reranker/gptapi_as_reranker.py')
+    eval_tags = load_script('eval/evluate_chatgpt_tags.py')
+    eval_deps = load_script('eval/evluate_chatgpt_deps.py')
+
+    treebank = os.path.join(workdir, f"synth_{label}.conllu")
+    write_treebank(treebank, n_tokens)
+    print(f"\n📏 {label} ({n_tokens} tokens)")
+
+    record(results, f"load_conll_file/{label}", time_it(lambda: tags.load_conll_file(treebank), repeat), n_tokens)
+    bench_loaders(label, treebank, n_tokens, repeat, results)
+
+    sentences = tags.load_conll_file(treebank)
+    for sentence in sentences:
+        for token in sentence:
+            token['chatgpt_upos'] = token.get('upos', '_')
+    out_path = os.path.join(workdir, f"saved_{label}.conllu")
+    record(results, f"save_results/{label}", time_it(lambda: tags.save_results(sentences, out_path), repeat), n_tokens)
+
+    gold = oneshot.load_conll_sentences(treebank)
+    with open(treebank) as f:
+        pred_blocks = [block for block in f.read().split("\n\n") if block.strip()]
+    record(results, f"evaluate_conllu/{label}",
+           time_it(lambda: oneshot.evaluate_conllu(gold, pred_blocks), repeat), n_tokens)
+
+    inputs = []
+    for rows in synth_sentences(n_tokens):
+        words = stanza_like_words(rows)
+        text = " ".join(w.text for w in words)
+        span = words[len(words) // 2:len(words) // 2 + 3]
+        phrase = text[span[0].start_char:span[-1].end_char]
+        inputs.append((words, phrase, text))
+
+    def run_analyze():
+        for words, phrase, text in inputs:
+            reranker.analyze_attachment(words, phrase, text)
+    record(results, f"analyze_attachment/{label}", time_it(run_analyze, repeat), n_tokens)
+
+    # Tree decoding of peaked, log-probability-like arc scores; capped since it is per sentence.
+    mst = load_script('python/common/mst.py')
+    matrices = []
+    for rows in synth_sentences(min(n_tokens, MST_MAX_TOKENS)):
+        ids = np.arange(len(rows) + 1)
+        scores = -10.0 - 0.01 * np.abs(ids[:, None] - ids[None, :])
+        for tid, _, _, _, _, head, _ in rows:
+            scores[head, tid] = -0.1
+            scores[(tid * 7) % (len(rows) + 1), tid] = max(scores[(tid * 7) % (len(rows) + 1), tid], -1.5)
+        matrices.append(scores)
+    for name in ("chu_liu_edmonds", "eisner"):
+        decode = getattr(mst, name)
+        record(results, f"{name}/{label}", time_it(lambda: [decode(m) for m in matrices], repeat),
+               len(matrices), unit="sentences")
+
+    tag_log = os.path.join(workdir, f"tags_{label}.log")
+    deps_log = os.path.join(workdir, f"deps_{label}.log")
+    write_tag_log(tag_log, n_tokens)
+    write_deprel_log(deps_log, n_tokens)
+    record(results, f"evaluate_tagging_log/{label}",
+           time_it(lambda: eval_tags.evaluate_tagging(tag_log), repeat), n_tokens)
+    record(results, f"evaluate_dependencies_log/{label}",
+           time_it(lambda: eval_deps.evaluate_dependencies(deps_log), repeat), n_tokens)
+
+
+E2E_SCRIPTS = {
+    "tags": lambda corpus, pp, out: ["python/preliminary/ask_chatgpt_tags.py", corpus,
+                                     "--live_run", "--output_file", out],
+    "oneshot": lambda corpus, pp, out: ["python/preliminary/ask_chatgpt_oneshot.py", "--gold_file", corpus,
+                                        "--live_run", "--output_file", out],
+    "pp-gpt": lambda corpus, pp, out: ["python/systematic_pp/gptapi_against_gpt.py", pp,
+                                       "--live_run", "--output_base", out + ".d"],
+}
+
+
+def bench_end_to_end(scripts: List[str], n_tokens: int, latency_ms: float, workdir: str, results: Dict):
+    server = start_server(0, latency_ms)
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    env = dict(os.environ, OPENAI_BASE_URL=base_url, OPENAI_API_KEY="fake")
+
+    corpus = os.path.join(workdir, "e2e.conllu")
+    pp = os.path.join(workdir, "e2e_pp.json")
+    write_treebank(corpus, n_tokens)
+    write_pp_examples(pp, max(n_tokens // 10, 1))
+
+    print(f"\n🌐 end-to-end against fake endpoint ({latency_ms:.0f} ms latency, {n_tokens} tokens)")
+    try:
+        for name in scripts:
+            out = os.path.join(workdir, f"e2e_{name}.out")
+            calls_before = server.request_count
+            start = time.perf_counter()
+            proc = subprocess.run([sys.executable] + E2E_SCRIPTS[name](corpus, pp, out),
+                                  cwd=ROOT, env=env, capture_output=True, text=True)
+            elapsed = time.perf_counter() - start
+            calls = server.request_count - calls_before
+            if proc.returncode != 0:
+                print(f"  ❌ {name} failed:\n{proc.stderr[-2000:]}")
+                continue
+            results[f"e2e/{name}"] = {
+                "seconds": [round(elapsed, 6)],
+                "min_s": round(elapsed, 6),
+                "mean_s": round(elapsed, 6),
+                "calls": calls,
+                "latency_ms": latency_ms,
+                "overhead_per_call_ms": round((elapsed / calls * 1000 - latency_ms) if calls else 0.0, 3),
+            }
+            print(f"  e2e/{name:<36} {elapsed:9.3f}s  ({calls} calls, "
+                  f"{results[f'e2e/{name}']['overhead_per_call_ms']} ms/call beyond latency)")
+    finally:
+        server.shutdown()
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the non-LLM hot paths on synthetic treebanks')
+    parser.add_argument('--sizes', default='1k,100k,1m', help='Comma-separated token counts (default: 1k,100k,1m)')
+    parser.add_argument('--repeat', type=int, default=3, help='Repetitions per benchmark below 1M tokens')
+    parser.add_argument('--e2e', default='tags,oneshot,pp-gpt',
+                        help=f'End-to-end scripts to run ({",".join(E2E_SCRIPTS)}); empty to skip')
+    parser.add_argument('--e2e_tokens', type=int, default=40,
+                        help='Corpus size for end-to-end runs (the scripts sleep between calls)')
+    parser.add_argument('--latency_ms', type=float, default=50.0, help='Fake endpoint latency')
+    parser.add_argument('--output', required=True, help='Where to write the results JSON')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for label in [s.strip() for s in args.sizes.split(',') if s.strip()]:
+            n_tokens = parse_size(label)
+            repeat = args.repeat if n_tokens < 1_000_000 else 1
+            bench_size(label, n_tokens, workdir, repeat, results)
+
+        scripts = [s.strip() for s in args.e2e.split(',') if s.strip()]
+        if scripts:
+            bench_end_to_end(scripts, args.e2e_tokens, args.latency_ms, workdir, results)
+
+    payload = {
+        "meta": {
+            "revision": git_revision(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(payload, f, indent=2)
+    print(f"\n✅ Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""Generate synthetic treebanks and logs for benchmarking the non-LLM hot paths."""
+
+import argparse
+import json
+import random
+from typing import List, Tuple
+
+UPOS_VOCAB = {
+    "DET": ["the", "a", "this", "every"],
+    "NOUN": ["man", "telescope", "painting", "girl", "umbrella", "museum", "label", "artwork", "park", "tray"],
+    "VERB": ["saw", "served", "admired", "filmed", "visited", "liked", "found", "carried"],
+    "ADP": ["with", "in", "on", "of", "at", "near"],
+    "ADJ": ["old", "silver", "leather", "quiet", "famous"],
+    "PRON": ["he", "she", "they", "it"],
+    "PUNCT": [".", ","],
+}
+DEPRELS = {
+    "DET": "det", "NOUN": "obj", "VERB": "root", "ADP": "case",
+    "ADJ": "amod", "PRON": "nsubj", "PUNCT": "punct",
+}
+XPOS = {"DET": "DT", "NOUN": "NN", "VERB": "VBD", "ADP": "IN", "ADJ": "JJ", "PRON": "PRP", "PUNCT": "."}
+UPOS_TAGS = list(UPOS_VOCAB)
+
+
+def synth_sentence(rng: random.Random, length: int) -> List[Tuple]:
+    """Return rows (id, form, lemma, upos, xpos, head, deprel) forming a valid tree."""
+    tags = [rng.choice(UPOS_TAGS) for _ in range(length)]
+    root = rng.randrange(length)
+    tags[root] = "VERB"
+    attached = [root]
+    heads = [0] * length
+    order = [i for i in range(length) if i != root]
+    rng.shuffle(order)
+    for i in order:
+        heads[i] = rng.choice(attached) + 1
+        attached.append(i)
+
+    rows = []
+    for i, tag in enumerate(tags):
+        form = rng.choice(UPOS_VOCAB[tag])
+        deprel = "root" if i == root else DEPRELS[tag] if tag != "VERB" else "conj"
+        rows.append((i + 1, form, form, tag, XPOS[tag], heads[i], deprel))
+    return rows
+
+
+def synth_sentences(n_tokens: int, seed: int = 13, min_len: int = 5, max_len: int = 30):
+    rng = random.Random(seed)
+    produced = 0
+    while produced < n_tokens:
+        length = min(rng.randint(min_len, max_len), max(n_tokens - produced, 1))
+        yield synth_sentence(rng, length)
+        produced += length
+
+
+def format_rows(rows: List[Tuple]) -> str:
+    # No comment lines: the preliminary loaders flatten conll2dict's comment lists in with the sentences.
+    lines = []
+    for tid, form, lemma, upos, xpos, head, deprel in rows:
+        lines.append(f"{tid}\t{form}\t{lemma}\t{upos}\t{xpos}\t_\t{head}\t{deprel}\t_\t_")
+    return "\n".join(lines) + "\n\n"
+
+
+def write_treebank(path: str, n_tokens: int, seed: int = 13):
+    with open(path, "w") as f:
+        for rows in synth_sentences(n_tokens, seed):
+            f.write(format_rows(rows))
+
+
+def write_tag_log(path: str, n_tokens: int, seed: int = 13):
+    """Log lines in the format ask_chatgpt_tags.py emits and evluate_chatgpt_tags*.py parse."""
+    rng = random.Random(seed)
+    with open(path, "w") as f:
+        for rows in synth_sentences(n_tokens, seed):
+            for _, form, _, upos, _, _, _ in rows:
+                pred = upos if rng.random() < 0.9 else rng.choice(UPOS_TAGS)
+                f.write(f"Token: {form} | Gold UPOS: {upos} | ChatGPT: {pred}\n")
+
+
+def write_deprel_log(path: str, n_tokens: int, seed: int = 13):
+    """Log lines in the format ask_chatgpt_rels.py emits and evluate_chatgpt_deps.py parses."""
+    rng = random.Random(seed)
+    labels = list(set(DEPRELS.values()))
+    with open(path, "w") as f:
+        for rows in synth_sentences(n_tokens, seed):
+            for _, form, _, _, _, head, deprel in rows:
+                pred = deprel if rng.random() < 0.8 else rng.choice(labels)
+                f.write(f"Token: {form} | Head: {head} | Gold Label: {deprel} | ChatGPT: {pred}\n")
+
+
+def write_pp_examples(path: str, n_examples: int, seed: int = 13):
+    """A systematic_pp style JSON list with one ambiguous phrase per sentence."""
+    rng = random.Random(seed)
+    examples = []
+    for _ in range(n_examples):
+        verb = rng.choice(UPOS_VOCAB["VERB"])
+        obj = rng.choice(UPOS_VOCAB["NOUN"])
+        prep = rng.choice(UPOS_VOCAB["ADP"])
+        pobj = rng.choice(UPOS_VOCAB["NOUN"])
+        phrase = f"{prep} the {pobj}"
+        examples.append({
+            "sentence": f"The {rng.choice(UPOS_VOCAB['NOUN'])} {verb} the {obj} {phrase}.",
+            "ambiguous_phrase": phrase,
+            "correct_attachment": rng.choice([verb, obj]),
+        })
+    with open(path, "w") as f:
+        json.dump(examples, f, indent=2)
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    scale = {"k": 1_000, "m": 1_000_000}.get(text[-1], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Write a synthetic CoNLL-U treebank')
+    parser.add_argument('size', help='Number of tokens, e.g. 1k, 100k, 1m')
+    parser.add_argument('output_file', help='Output .conllu path')
+    parser.add_argument('--seed', type=int, default=13)
+    args = parser.parse_args()
+
+    write_treebank(args.output_file, parse_size(args.size), args.seed)
+    print(f"✅ Wrote {args.size} tokens to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,5 @@
 #!/usr/bin/env python3
 
-from stanza.utils.conll import CoNLL
 import argparse
 
 def format_sentence(sentence):
@@ -8,6 +7,7 @@ def format_sentence(sentence):
     return ' '.join(token['text'] for token in sentence)
 
 def load_conll_file(file_path: str):
+    from stanza.utils.conll import CoNLL
     docs = CoNLL.conll2dict(input_file=file_path)
     doc = docs[0]
     print('doc', doc)
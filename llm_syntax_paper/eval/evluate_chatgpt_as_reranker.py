@@ -1,5 +1,10 @@
 import json
 import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
+from common.tracing import add_trace_argument, setup_tracing, span
 
 def is_chatgpt_right(correct: bool, chatgpt_response: str) -> bool:
     response = chatgpt_response.strip().lower()
@@ -11,12 +16,20 @@ def is_chatgpt_right(correct: bool, chatgpt_response: str) -> bool:
 def main():
     parser = argparse.ArgumentParser(description="Evaluate ChatGPT's judgments on syntactic attachment.")
     parser.add_argument("input_file", help="Path to the results JSONL file.")
+    add_trace_argument(parser)
     args = parser.parse_args()
+    setup_tracing(args.trace)
 
-    with open(args.input_file) as f:
+    with span("load"), open(args.input_file) as f:
         results = [json.loads(line) for line in f]
 
-    total = len(results)
+    # With several --encoding values each example has one row per encoding; the
+    # top-level totals count every example once, using the first encoding.
+    encodings = list(dict.fromkeys(r.get("encoding", "conllu") for r in results))
+    primary = encodings[0] if encodings else "conllu"
+    counted = [r for r in results if r.get("encoding", "conllu") == primary]
+
+    total = len(counted)
     correct_preds = 0
     correct_when_parser_correct = 0
     correct_when_parser_incorrect = 0
@@ -25,7 +38,7 @@ def main():
 
     for result in results:
         print("=" * 80)
-        print(f"Example {result['index']}")
+        print(f"Example {result['index']}" + (f" ({result.get('encoding', 'conllu')})" if len(encodings) > 1 else ""))
         print(f"Sentence: {result['sentence']}")
         print(f"Ambiguous Phrase: {result['ambiguous_phrase']}")
         print(f"Expected Head: {result['expected_head']}")
@@ -35,17 +48,18 @@ def main():
         chatgpt_response = result["chatgpt_response"]
         chatgpt_correct = is_chatgpt_right(parser_correct, chatgpt_response)
 
-        if parser_correct:
-            parser_correct_total += 1
-            if chatgpt_correct:
-                correct_when_parser_correct += 1
-        else:
-            parser_incorrect_total += 1
-            if chatgpt_correct:
-                correct_when_parser_incorrect += 1
+        if result.get("encoding", "conllu") == primary:
+            if parser_correct:
+                parser_correct_total += 1
+                if chatgpt_correct:
+                    correct_when_parser_correct += 1
+            else:
+                parser_incorrect_total += 1
+                if chatgpt_correct:
+                    correct_when_parser_incorrect += 1
 
-        if chatgpt_correct:
-            correct_preds += 1
+            if chatgpt_correct:
+                correct_preds += 1
 
         parser_status = "✅ Correct" if parser_correct else "❌ Incorrect"
         chatgpt_status = "✅ ChatGPT Right" if chatgpt_correct else "❌ ChatGPT Wrong"
@@ -55,7 +69,7 @@ def main():
 
     # Summary statistics
     print("=" * 80)
-    print("Evaluation Summary:")
+    print("Evaluation Summary:" + (f" (encoding {primary}; others below)" if len(encodings) > 1 else ""))
     print(f"Total Examples: {total}")
     print(f"Parser Correct: {parser_correct_total}")
     print(f"Parser Incorrect: {parser_incorrect_total}")
@@ -66,6 +80,17 @@ def main():
         print(f"ChatGPT Accuracy when Parser Incorrect: {correct_when_parser_incorrect}/{parser_incorrect_total} = {correct_when_parser_incorrect / parser_incorrect_total:.2%}")
     print(f"Overall ChatGPT Accuracy: {correct_preds}/{total} = {correct_preds / total:.2%}")
 
+    if any("encoding" in r for r in results):
+        print()
+        print("Per-Encoding Summary:")
+        for encoding in sorted({r.get("encoding", "conllu") for r in results}):
+            subset = [r for r in results if r.get("encoding", "conllu") == encoding]
+            right = sum(1 for r in subset if is_chatgpt_right(r["correct"], r["chatgpt_response"]))
+            tokens = [r["prompt_tokens"] for r in subset if "prompt_tokens" in r]
+            mean_tokens = f"{sum(tokens) / len(tokens):.1f}" if tokens else "n/a"
+            print(f"  {encoding:<10} accuracy {right}/{len(subset)} = {right / len(subset):.2%}, "
+                  f"prompt tokens/example {mean_tokens}")
+
 if __name__ == "__main__":
     main()
 
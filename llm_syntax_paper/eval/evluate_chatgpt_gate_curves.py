@@ -0,0 +1,90 @@
+import json
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python', 'reranker'))
+from risk_gate import select_for_llm
+from evluate_chatgpt_as_reranker import is_chatgpt_right
+
+DEFAULT_FRACTIONS = "0.05,0.1,0.2,0.3,0.5,0.75,1.0"
+
+
+def gate_curve(results, fractions, cost_per_call):
+    """Replay the gate at each fraction; gated-out parses count as a "no" judgment."""
+    risks = [r["risk"] for r in results]
+    parser_incorrect_total = sum(1 for r in results if not r["correct"])
+    rows = []
+
+    for fraction in fractions:
+        forwarded = select_for_llm(risks, fraction)
+        right = flagged = false_alarms = unknown = 0
+
+        for idx, r in enumerate(results):
+            if idx in forwarded:
+                if not r.get("sent_to_llm", True):
+                    unknown += 1
+                response = r["chatgpt_response"]
+            else:
+                response = "no"
+
+            if is_chatgpt_right(r["correct"], response):
+                right += 1
+            if response.strip().lower() != "no":
+                if r["correct"]:
+                    false_alarms += 1
+                else:
+                    flagged += 1
+
+        rows.append({
+            "fraction": fraction,
+            "calls": len(forwarded),
+            "coverage": len(forwarded) / len(results),
+            "accuracy": right / len(results),
+            "errors_caught": flagged / parser_incorrect_total if parser_incorrect_total else None,
+            "false_alarms": false_alarms,
+            "cost": len(forwarded) * cost_per_call,
+            "unknown": unknown,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coverage/accuracy/cost curves for the reranker risk gate.")
+    parser.add_argument("input_file", help="Reranker results JSONL (best run with --gate_fraction 1.0).")
+    parser.add_argument("--fractions", default=DEFAULT_FRACTIONS, help="Comma-separated gate fractions to replay.")
+    parser.add_argument("--cost_per_call", type=float, default=0.0, help="Dollar cost of one reranker call.")
+    parser.add_argument("--encoding", default="conllu",
+                        help="Which prompt encoding's results to replay when the run compared several.")
+    parser.add_argument("--output_json", help="Optionally write the curve rows to this file.")
+    args = parser.parse_args()
+
+    with open(args.input_file) as f:
+        results = [json.loads(line) for line in f]
+    results = [r for r in results if r.get("encoding", "conllu") == args.encoding]
+
+    if not results or any("risk" not in r for r in results):
+        print("❌ Input has no risk scores; rerun the reranker with this version of the scripts.")
+        sys.exit(1)
+
+    fractions = [float(x) for x in args.fractions.split(",")]
+    rows = gate_curve(results, fractions, args.cost_per_call)
+
+    print(f"Examples: {len(results)}  Parser incorrect: {sum(1 for r in results if not r['correct'])}")
+    print(f"{'fraction':>9}{'calls':>7}{'coverage':>10}{'accuracy':>10}{'caught':>9}{'false+':>8}{'cost $':>9}")
+    for row in rows:
+        caught = f"{row['errors_caught']:.0%}" if row["errors_caught"] is not None else "-"
+        print(f"{row['fraction']:>9.2f}{row['calls']:>7}{row['coverage']:>10.0%}{row['accuracy']:>10.2%}"
+              f"{caught:>9}{row['false_alarms']:>8}{row['cost']:>9.4f}")
+
+    if any(row["unknown"] for row in rows):
+        print("\n⚠️  Some fractions forward parses the original run gated out; those keep a \"no\" "
+              "judgment, so rows above the run's own gate fraction are not exact.")
+
+    if args.output_json:
+        with open(args.output_json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
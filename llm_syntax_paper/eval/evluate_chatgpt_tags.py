@@ -1,6 +1,11 @@
+import os
 import re
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
+from common.tracing import setup_tracing, traced
+
+@traced("evaluate")
 def evaluate_tagging(log_file_path):
     pattern = r"Token: (.+?) \| Gold UPOS: (\w+) \| ChatGPT: (\w+)"
     total = 0
@@ -22,6 +27,7 @@ def evaluate_tagging(log_file_path):
     print(f"Accuracy: {accuracy:.2f}%")
 
 if __name__ == "__main__":
+    setup_tracing()
     if len(sys.argv) != 2:
         print("Usage: python eval_tags.py <log_file_path>")
         sys.exit(1)
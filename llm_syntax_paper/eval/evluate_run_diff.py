@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""Token-level diff of two annotation runs.
+
+Streams two CoNLL-U outputs (or two JSONL result files) in lockstep and
+compares every prediction: the upos/head/deprel columns and each MISC key
+(ChatGPTUPOS, ChatGPTDeprel, ChatGPTHead, ...) for CoNLL-U, every non-key
+field for JSONL.  Changes are counted per field, by label transition, and by
+their effect on the gold match:
+
+  fixed        old prediction wrong, new one right
+  broke        old prediction right, new one wrong
+  still wrong  both wrong, but different
+  no gold      no gold value for the field
+
+Gold for the MISC predictions is the run's own copy of the gold columns
+(the scripts keep them), or the columns of --gold when given; the columns
+themselves are only scored against --gold.
+
+CoNLL-U sentences are paired by their '# sent_id' (or '# text') comment when
+both runs have one, and by position otherwise.  A sentence one run failed on
+(a comment-only block such as '# FAILED TO PARSE') is counted as failed in
+that run, not dropped, so it does not shift the sentences after it; one that
+only a single run has is reported as unmatched, and pairing resumes at the
+next sentence both have.
+
+Only counters (and sentences waiting to be paired) are kept, so memory does
+not grow with the files; --changes_file writes one JSON record per changed
+token as it goes, and lines that are identical in both runs are only counted,
+not parsed.
+
+Examples (run from llm_syntax_paper/):
+    python eval/evluate_run_diff.py old/examples25.conllu.ask_chatgpt_rels.py.conllu \\
+        data/output/preliminary/examples25.conllu.ask_chatgpt_rels.py.conllu
+    python eval/evluate_run_diff.py run1.conllu run2.conllu --gold dev.conllu --changes_file changes.jsonl
+    python eval/evluate_run_diff.py old.gptapi.jsonl new.gptapi.jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+from collections import Counter, defaultdict
+from itertools import zip_longest
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python'))
+from common.conllu import parse_misc, parse_token
+from common.tracing import add_trace_argument, setup_tracing, span
+
+COLUMN_FIELDS = ["upos", "head", "deprel"]
+COLUMN_INDEX = [("upos", 3), ("head", 6), ("deprel", 7)]
+
+# MISC prediction -> the gold column it is scored against ("head_word": the form of the gold head, or "root").
+MISC_GOLD = {
+    "ChatGPTUPOS": "upos",
+    "ChatGPTDeprel": "deprel",
+    "ChatGPTHeadId": "head",
+    "ChatGPTHead": "head_word",
+}
+
+# Fields whose values are token positions or words rather than labels: no transition table.
+OPEN_FIELDS = {"head", "ChatGPTHeadId", "ChatGPTHead", "predicted_head", "chatgpt_response"}
+
+# JSONL: fields that identify an item, and prediction -> gold field.
+DEFAULT_KEY_FIELDS = "index,sentence,ambiguous_phrase,encoding"
+DEFAULT_JSONL_GOLD = "predicted_head=expected_head"
+
+EFFECTS = ["fixed", "broke", "still wrong", "no gold"]
+
+
+def setup_args():
+    parser = argparse.ArgumentParser(description='Diff the per-token predictions of two annotation runs')
+    parser.add_argument('old_file', help='Earlier run (CoNLL-U or JSONL)')
+    parser.add_argument('new_file', help='Later run of the same items (paired by # sent_id / # text, else by position)')
+    parser.add_argument('--gold', help='CoNLL-U gold file; otherwise MISC predictions are scored against the '
+                                       'old run\'s own columns')
+    parser.add_argument('--fields', help='Comma-separated fields to compare (default: all)')
+    parser.add_argument('--changes_file', help='Write one JSON record per changed token/field to this file')
+    parser.add_argument('--top', type=int, default=10, help='Label transitions to list per field (default: 10)')
+    parser.add_argument('--key_fields', default=DEFAULT_KEY_FIELDS,
+                        help=f'JSONL: fields that must match to align two records (default: {DEFAULT_KEY_FIELDS})')
+    parser.add_argument('--jsonl_gold', default=DEFAULT_JSONL_GOLD,
+                        help=f'JSONL: prediction=gold field pairs (default: {DEFAULT_JSONL_GOLD})')
+    add_trace_argument(parser)
+    return parser.parse_args()
+
+
+def is_jsonl(path: str) -> bool:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                return line.lstrip().startswith("{")
+    return False
+
+
+def gold_value(column: str, token: Dict, forms: List[str]) -> Optional[str]:
+    if column == "head_word":
+        head = token["head"]
+        if head is None:
+            return None
+        return "root" if head == 0 else forms[head - 1] if head <= len(forms) else None
+    value = token[column]
+    return None if value in (None, "_") else str(value)
+
+
+class Block(NamedTuple):
+    index: int             # position in the file
+    key: Optional[Tuple]   # (sent_id or text, occurrence), None without either comment
+    lines: List[str]       # word lines, unparsed; empty for a failed (comment-only) sentence
+
+
+def read_blocks(path: str) -> Iterator[Block]:
+    """Each sentence's word lines (comments, multiword ranges and empty nodes dropped) and pairing key."""
+    seen = Counter()
+    index = 0
+    lines, ids = [], {}
+
+    def block():
+        name = ids.get("sent_id") or ids.get("text")
+        key = None
+        if name is not None:
+            seen[name] += 1
+            key = (name, seen[name])
+        return Block(index, key, lines)
+
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                if lines or ids.get("comment"):
+                    yield block()
+                    index += 1
+                lines, ids = [], {}
+            elif line.startswith("#"):
+                name, sep, value = line[1:].partition("=")
+                if sep and name.strip() in ("sent_id", "text"):
+                    ids[name.strip()] = value.strip()
+                ids["comment"] = True
+            elif line[0].isdigit() and line.split("\t", 1)[0].isdigit():
+                lines.append(line)
+    if lines or ids.get("comment"):
+        yield block()
+
+
+def align(old_blocks: Iterable[Block], new_blocks: Iterable[Block]) -> Iterator[Tuple[Optional[Block], Optional[Block]]]:
+    """Pair the sentences of two runs; a sentence only one run has comes with None.
+
+    Sentences are paired by position while their keys agree (or either lacks one).
+    On a key mismatch both wait until the other run reaches the same key; the
+    waiting sentences the other run skipped past are reported unmatched.
+    """
+    pending: Tuple[Dict, Dict] = ({}, {})
+
+    def alone(side: int, block: Block):
+        return (block, None) if side == 0 else (None, block)
+
+    for pair in zip_longest(old_blocks, new_blocks):
+        if (not pending[0] and not pending[1] and None not in pair
+                and (pair[0].key is None or pair[1].key is None or pair[0].key == pair[1].key)):
+            yield pair
+            continue
+        for side, block in enumerate(pair):
+            if block is None:
+                continue
+            if block.key is None:
+                yield alone(side, block)
+                continue
+            other = pending[1 - side]
+            if block.key not in other:
+                pending[side][block.key] = block
+                continue
+            for key in list(other):
+                match = other.pop(key)
+                if key == block.key:
+                    yield (block, match) if side == 0 else (match, block)
+                    break
+                yield alone(1 - side, match)
+    for side in (0, 1):
+        for block in pending[side].values():
+            yield alone(side, block)
+
+
+def present_fields(line: str) -> List[str]:
+    """The fields token_values() would return for a word line, without building the values."""
+    parts = line.rstrip("\n").split("\t")
+    fields = [field for field, i in COLUMN_INDEX if parts[i] != "_"]
+    if parts[9] != "_":
+        fields.extend(key for key, _, value in (item.partition("=") for item in parts[9].split("|"))
+                      if value not in ("", "None"))
+    return fields
+
+
+def token_values(token: Dict) -> Dict[str, str]:
+    values = {field: str(token[field]) for field in COLUMN_FIELDS if token[field] not in (None, "_")}
+    for key, value in parse_misc(token["misc"]).items():
+        if value not in ("", "None"):
+            values[key] = value
+    return values
+
+
+def same_label(field: str, a: str, b: str) -> bool:
+    # Answers are compared the way the evaluators do: UPOS and labels case-insensitively.
+    return a.lower() == b.lower() if field in MISC_GOLD or field in ("upos", "deprel") else a == b
+
+
+class RunDiff:
+    def __init__(self, fields: Optional[set] = None, changes=None):
+        self.fields = fields
+        self.changes = changes
+        self.items = 0
+        self.tokens = 0
+        self.changed_tokens = 0
+        self.misaligned = 0
+        self.unmatched = Counter()
+        self.failed = Counter()
+        self.compared = Counter()
+        self.changed = Counter()
+        self.effects = defaultdict(Counter)
+        self.transitions = defaultdict(Counter)
+
+    def failure(self, item: int, run: str):
+        """An item whose parse failed in one run (run is "old" or "new")."""
+        self.failed[run] += 1
+        if self.changes is not None:
+            self.changes.write(json.dumps({"item": item, "field": "parse", "effect": f"failed in {run}"}) + "\n")
+
+    def unchanged(self, fields: List[str]):
+        """Count a token whose predictions are identical in both runs."""
+        self.tokens += 1
+        self.compared.update(fields if self.fields is None else [f for f in fields if f in self.fields])
+
+    def compare(self, item: int, token_id, form: str, old: Dict[str, str], new: Dict[str, str],
+                gold: Callable[[str], Optional[str]]):
+        """Compare the predictions of one token (or JSONL record); gold(field) is only asked for changed fields."""
+        self.tokens += 1
+        token_changed = False
+        for field in old.keys() | new.keys():
+            if self.fields is not None and field not in self.fields:
+                continue
+            self.compared[field] += 1
+            a, b = old.get(field), new.get(field)
+            if a is not None and b is not None and same_label(field, a, b):
+                continue
+            if a is None and b is None:
+                continue
+            token_changed = True
+            self.changed[field] += 1
+            if field not in OPEN_FIELDS:
+                self.transitions[field][(a or "-", b or "-")] += 1
+            g = gold(field)
+            if g is None:
+                effect = "no gold"
+            else:
+                was_right = a is not None and same_label(field, a, g)
+                is_right = b is not None and same_label(field, b, g)
+                effect = "fixed" if is_right else "broke" if was_right else "still wrong"
+            self.effects[field][effect] += 1
+            if self.changes is not None:
+                self.changes.write(json.dumps({"item": item, "id": token_id, "form": form, "field": field,
+                                               "old": a, "new": b, "gold": g, "effect": effect}) + "\n")
+        self.changed_tokens += token_changed
+
+    def report(self, old_file: str, new_file: str, unit: str, top: int) -> List[str]:
+        share = self.changed_tokens / self.tokens * 100 if self.tokens else 0.0
+        lines = [f"🔀 {old_file} → {new_file}",
+                 f"   {self.items} items, {self.tokens} {unit}; {self.changed_tokens} {unit} changed ({share:.1f}%)"]
+        if self.failed:
+            lines.append(f"   failed in old only: {self.failed['old']}, failed in new only: {self.failed['new']}")
+        if self.unmatched:
+            lines.append(f"⚠️  unmatched items: {self.unmatched['old']} only in old, {self.unmatched['new']} only in new")
+        if self.misaligned:
+            lines.append(f"⚠️  {self.misaligned} items skipped: different tokens/keys in the two runs")
+        lines.append(f"   {'field':<18}{'compared':>10}{'changed':>9}" + "".join(f"{e:>13}" for e in EFFECTS))
+        for field in sorted(self.compared):
+            effects = self.effects[field]
+            lines.append(f"   {field:<18}{self.compared[field]:>10}{self.changed[field]:>9}"
+                         + "".join(f"{effects[e]:>13}" for e in EFFECTS))
+        for field in sorted(self.transitions):
+            pairs = ", ".join(f"{a}→{b} {n}" for (a, b), n in self.transitions[field].most_common(top))
+            lines.append(f"   {field} transitions: {pairs}")
+        return lines
+
+
+def diff_conllu(old_file: str, new_file: str, gold_file: Optional[str], diff: RunDiff):
+    gold_stream = read_blocks(gold_file) if gold_file else None
+    gold_ahead: Dict[int, List[str]] = {}  # gold sentences read past while pairs arrive out of order
+
+    def gold_for(index: int) -> Optional[List[str]]:
+        while index not in gold_ahead:
+            block = next(gold_stream, None)
+            if block is None:
+                return None
+            gold_ahead[block.index] = block.lines
+        return gold_ahead.pop(index)
+
+    for old_block, new_block in align(read_blocks(old_file), read_blocks(new_file)):
+        if old_block is None or new_block is None:
+            diff.unmatched["old" if new_block is None else "new"] += 1
+            continue
+        item = old_block.index
+        old, new = old_block.lines, new_block.lines
+        gold_lines = gold_for(item) if gold_stream is not None else None
+        if not old or not new:
+            diff.items += 1
+            if old or new:
+                diff.failure(item, "new" if old else "old")
+            continue
+        if gold_file is not None and len(gold_lines or ()) != len(old):
+            diff.misaligned += 1
+            continue
+        if old == new:
+            diff.items += 1
+            for line in old:
+                diff.unchanged(present_fields(line))
+            continue
+        old_words = [parse_token(line) for line in old]
+        new_words = [parse_token(line) for line in new]
+        gold_words = [parse_token(line) for line in gold_lines] if gold_lines is not None else None
+        if [t["form"] for t in old_words] != [t["form"] for t in new_words]:
+            diff.misaligned += 1
+            continue
+        diff.items += 1
+        reference = gold_words if gold_words is not None else old_words
+        forms = [t["form"] for t in reference]
+        for i, (a, b, line_a, line_b) in enumerate(zip(old_words, new_words, old, new)):
+            if line_a == line_b:
+                diff.unchanged(present_fields(line_a))
+                continue
+
+            def gold(field, token=reference[i]):
+                if field in MISC_GOLD:
+                    return gold_value(MISC_GOLD[field], token, forms)
+                return gold_value(field, token, forms) if gold_words is not None and field in COLUMN_FIELDS else None
+
+            diff.compare(item, a["id"], a["form"], token_values(a), token_values(b), gold)
+
+
+def iter_jsonl(path: str) -> Iterator[Dict]:
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def record_values(record: Dict, skip: set) -> Dict[str, str]:
+    return {key: value if isinstance(value, str) else json.dumps(value)
+            for key, value in record.items() if key not in skip and value is not None}
+
+
+def diff_jsonl(old_file: str, new_file: str, key_fields: List[str], gold_fields: Dict[str, str], diff: RunDiff):
+    skip = set(key_fields) | set(gold_fields.values())
+    for item, (old, new) in enumerate(zip_longest(iter_jsonl(old_file), iter_jsonl(new_file))):
+        if old is None or new is None or any(old.get(k) != new.get(k) for k in key_fields):
+            diff.misaligned += 1
+            continue
+        diff.items += 1
+        gold = {field: str(old[source]) for field, source in gold_fields.items() if old.get(source) is not None}
+        label = old.get("ambiguous_phrase") or old.get("sentence") or ""
+        diff.compare(item, old.get("index", item), label, record_values(old, skip), record_values(new, skip),
+                     gold.get)
+
+
+def main():
+    args = setup_args()
+    setup_tracing(args.trace)
+
+    jsonl = is_jsonl(args.old_file)
+    if jsonl != is_jsonl(args.new_file):
+        print("❌ Both runs must be CoNLL-U or both JSONL")
+        sys.exit(1)
+    if jsonl and args.gold:
+        print("❌ --gold applies to CoNLL-U runs; JSONL results carry their gold fields (--jsonl_gold)")
+        sys.exit(1)
+
+    fields = set(f.strip() for f in args.fields.split(",") if f.strip()) if args.fields else None
+    changes = open(args.changes_file, "w", encoding="utf-8") if args.changes_file else None
+    diff = RunDiff(fields, changes)
+    try:
+        with span("diff"):
+            if jsonl:
+                key_fields = [k.strip() for k in args.key_fields.split(",") if k.strip()]
+                gold_fields = dict(pair.split("=", 1) for pair in args.jsonl_gold.split(",") if "=" in pair)
+                diff_jsonl(args.old_file, args.new_file, key_fields, gold_fields, diff)
+            else:
+                diff_conllu(args.old_file, args.new_file, args.gold, diff)
+    finally:
+        if changes is not None:
+            changes.close()
+
+    for line in diff.report(args.old_file, args.new_file, "records" if jsonl else "tokens", args.top):
+        print(line)
+    if changes is not None:
+        print(f"✅ Wrote {sum(diff.changed.values())} change records to {args.changes_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""A small streaming CoNLL-U reader and writer that does not need Stanza.
+
+read_conllu() yields one (comments, tokens) pair per sentence without loading
+the whole file.  Tokens are dicts with the ten CoNLL-U columns under the keys
+id, form, lemma, upos, xpos, feats, head, deprel, deps and misc, where id is
+an int for ordinary words (multiword ranges and empty nodes keep their string
+id, e.g. "3-4" or "5.1"), head is an int or None, and "_" is kept as-is for
+the other columns.
+"""
+
+from typing import Dict, Iterator, List, Tuple
+
+COLUMNS = ["id", "form", "lemma", "upos", "xpos", "feats", "head", "deprel", "deps", "misc"]
+
+
+def parse_token(line: str) -> Dict:
+    parts = line.rstrip("\n").split("\t")
+    if len(parts) != 10:
+        raise ValueError(f"expected 10 tab-separated columns, got {len(parts)}: {line!r}")
+    token = dict(zip(COLUMNS, parts))
+    token["id"] = int(token["id"]) if token["id"].isdigit() else token["id"]
+    token["head"] = int(token["head"]) if token["head"].isdigit() else None
+    return token
+
+
+def is_word(token: Dict) -> bool:
+    """Ordinary words, as opposed to multiword ranges and empty nodes."""
+    return isinstance(token["id"], int)
+
+
+def parse_misc(misc: str) -> Dict[str, str]:
+    if not misc or misc == "_":
+        return {}
+    fields = {}
+    for item in misc.split("|"):
+        key, _, value = item.partition("=")
+        fields[key] = value
+    return fields
+
+
+def format_misc(fields: Dict[str, str]) -> str:
+    return "|".join(f"{k}={v}" if v != "" else k for k, v in fields.items()) or "_"
+
+
+def read_conllu(path: str) -> Iterator[Tuple[List[str], List[Dict]]]:
+    comments, tokens = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                if tokens:
+                    yield comments, tokens
+                comments, tokens = [], []
+            elif line.startswith("#"):
+                comments.append(line.rstrip("\n"))
+            else:
+                tokens.append(parse_token(line))
+    if tokens:
+        yield comments, tokens
+
+
+def format_token(token: Dict) -> str:
+    values = [token.get(col) for col in COLUMNS]
+    return "\t".join("_" if v is None else str(v) for v in values)
+
+
+def write_sentence(f, comments: List[str], tokens: List[Dict]):
+    for comment in comments:
+        f.write(comment + "\n")
+    for token in tokens:
+        f.write(format_token(token) + "\n")
+    f.write("\n")
@@ -0,0 +1,193 @@
+"""Near-duplicate elimination before paid annotation (MinHash + LSH).
+
+Scraped and LLM-generated sets contain many near-identical template
+sentences, and each one costs a full per-token fan-out of API calls.
+plan_dedup() streams the items once and groups them into clusters:
+
+  - exact duplicates (same text after lowercasing and whitespace folding)
+    join the cluster of the first occurrence, without a MinHash lookup;
+    they count as exact only when that occurrence is the representative;
+  - near duplicates join the first earlier representative whose estimated
+    word-shingle Jaccard similarity is at least the threshold, found through
+    LSH buckets over MinHash signatures, so each item is compared with a
+    handful of candidates rather than every representative.
+
+Only representatives are annotated.  With --dedup_project the labels of a
+representative are copied to its exact duplicates (same tokens, so the
+projection is safe); near duplicates are left out of the run.  The saved
+calls are reported before anything is sent.
+"""
+
+import hashlib
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64((1 << 32) - 1)
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.lower().split())
+
+
+def shingles(text: str, k: int = 3) -> np.ndarray:
+    """32-bit hashes of the word k-grams of a text (the whole text when it is shorter than k words)."""
+    words = re.findall(r"\w+|[^\w\s]", text.lower())
+    grams = {" ".join(words[i:i + k]) for i in range(max(1, len(words) - k + 1))}
+    return np.array([int.from_bytes(hashlib.blake2b(g.encode(), digest_size=4).digest(), "little")
+                     for g in grams], dtype=np.uint64)
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """(bands, rows) minimizing the false positive plus false negative probability mass around the threshold."""
+    grid = np.linspace(0.0, 1.0, 201)
+    best, best_error = (1, num_perm), float("inf")
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        candidate = 1 - (1 - grid ** rows) ** bands
+        error = (candidate[grid < threshold].sum() + (1 - candidate[grid >= threshold]).sum()) / len(grid)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class MinHashLSH:
+    """Streaming near-duplicate index over representatives."""
+
+    def __init__(self, threshold: float = 0.8, num_perm: int = 128, shingle_size: int = 3, seed: int = 1):
+        self.threshold = threshold
+        self.shingle_size = shingle_size
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(1, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.b = rng.randint(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.buckets: List[Dict[bytes, List[int]]] = [{} for _ in range(self.bands)]
+        self.signatures: Dict[int, np.ndarray] = {}
+
+    def signature(self, text: str) -> np.ndarray:
+        hashes = shingles(text, self.shingle_size)
+        # (a * x + b) mod p stays below 2**64 since a, b and x are 32-bit.
+        return (((hashes[:, None] * self.a[None, :] + self.b[None, :]) % _PRIME) & _MAX_HASH).min(axis=0)
+
+    def _band_keys(self, signature: np.ndarray) -> List[bytes]:
+        return [signature[i * self.rows:(i + 1) * self.rows].tobytes() for i in range(self.bands)]
+
+    def query(self, signature: np.ndarray) -> Optional[Tuple[int, float]]:
+        """The most similar indexed item at or above the threshold, with its estimated Jaccard similarity."""
+        candidates = set()
+        for bucket, key in zip(self.buckets, self._band_keys(signature)):
+            candidates.update(bucket.get(key, ()))
+        best = None
+        for key in sorted(candidates):
+            similarity = float((self.signatures[key] == signature).mean())
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (key, similarity)
+        return best
+
+    def insert(self, key: int, signature: np.ndarray):
+        self.signatures[key] = signature
+        for bucket, band in zip(self.buckets, self._band_keys(signature)):
+            bucket.setdefault(band, []).append(key)
+
+
+class DedupPlan:
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.representative: List[int] = []
+        self.exact: List[bool] = []
+        self.calls: List[int] = []
+
+    def is_representative(self, i: int) -> bool:
+        return self.representative[i] == i
+
+    def representatives(self, items: List) -> List:
+        return [item for i, item in enumerate(items) if self.is_representative(i)]
+
+    def saved_calls(self) -> int:
+        # Neither projected exact duplicates nor dropped near duplicates are queried.
+        return sum(c for i, c in enumerate(self.calls) if not self.is_representative(i))
+
+    def summary(self, project: bool, unit: str = "calls") -> str:
+        n = len(self.representative)
+        n_reps = sum(self.is_representative(i) for i in range(n))
+        n_exact = sum(self.exact)
+        n_near = n - n_reps - n_exact
+        total = sum(self.calls)
+        saved = self.saved_calls()
+        fate = "labels projected" if project else "dropped"
+        return (f"🧹 Dedup (Jaccard >= {self.threshold}): {n} items -> {n_reps} to annotate "
+                f"({n_exact} exact duplicates {fate}, {n_near} near duplicates dropped); "
+                f"saves {saved} of {total} {unit} ({saved / total * 100 if total else 0:.1f}%)")
+
+    def project(self, items: List[List[Dict]], project: bool) -> List[List[Dict]]:
+        """Items kept after annotation, in input order.
+
+        Each item is a list of token dicts that annotation filled in place.  Exact
+        duplicates receive the keys their representative gained, when projecting.
+        """
+        kept = []
+        for i, item in enumerate(items):
+            rep = self.representative[i]
+            if rep == i:
+                kept.append(item)
+            elif project and self.exact[i]:
+                for source, target in zip(items[rep], item):
+                    for key, value in source.items():
+                        target.setdefault(key, value)
+                kept.append(item)
+        return kept
+
+
+def plan_dedup(texts: Iterable[str], threshold: float, calls: Optional[Iterable[int]] = None,
+               num_perm: int = 128) -> DedupPlan:
+    """Assign every item to a cluster representative in one streaming pass."""
+    plan = DedupPlan(threshold)
+    index = MinHashLSH(threshold, num_perm)
+    # Normalized text of every item seen so far -> (its representative, whether that is the same text).
+    seen: Dict[str, Tuple[int, bool]] = {}
+    calls = iter(calls) if calls is not None else None
+    for i, text in enumerate(texts):
+        plan.calls.append(next(calls) if calls is not None else 1)
+        key = normalize(text)
+        if not key:
+            # Empty items cost nothing and have nothing to compare.
+            plan.representative.append(i)
+            plan.exact.append(False)
+            continue
+        if key in seen:
+            # A repeat of an earlier near duplicate stays a near duplicate of that item's representative.
+            rep, exact = seen[key]
+            plan.representative.append(rep)
+            plan.exact.append(exact)
+            continue
+        signature = index.signature(text)
+        match = index.query(signature)
+        if match is not None:
+            seen[key] = (match[0], False)
+            plan.representative.append(match[0])
+            plan.exact.append(False)
+            continue
+        seen[key] = (i, True)
+        index.insert(i, signature)
+        plan.representative.append(i)
+        plan.exact.append(False)
+    return plan
+
+
+def add_dedup_arguments(parser):
+    parser.add_argument('--dedup_threshold', type=float,
+                        help='Annotate only one representative per cluster of near-duplicate items '
+                             '(MinHash/LSH estimate of word-trigram Jaccard similarity >= this, e.g. 0.8)')
+    parser.add_argument('--dedup_project', action='store_true',
+                        help='Copy the representative\'s labels to its exact duplicates instead of dropping them')
+    parser.add_argument('--dedup_num_perm', type=int, default=128, help='MinHash permutations (default: 128)')
+
+
+def plan_dedup_sentences(sentences: List[List[Dict]], args) -> Optional[DedupPlan]:
+    """Dedup plan for CoNLL sentences queried once per token, or None when --dedup_threshold is not set."""
+    if args.dedup_threshold is None:
+        return None
+    return plan_dedup((" ".join(token['text'] for token in sentence) for sentence in sentences),
+                      args.dedup_threshold, (len(sentence) for sentence in sentences), args.dedup_num_perm)
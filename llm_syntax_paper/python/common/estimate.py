@@ -0,0 +1,148 @@
+"""Dry-run cost and wall-time estimates.
+
+In a dry run the scripts build every prompt exactly as a live run would and
+hand it to an Estimator instead of the API.  The estimator counts the prompt
+tokens locally (common.tokens), adds the answer length the script expects,
+and projects calls, tokens, dollars and wall-clock time per model under the
+configured concurrency and rate limits, so a corpus-scale job can be sized
+before anything is spent.  --show_prompts still prints every prompt.
+
+Wall time per model is the largest of three bounds:
+  - latency: calls * (latency + completion / output speed + the script's pause) / concurrency
+  - requests per minute: calls / rpm
+  - tokens per minute: (prompt + completion tokens) / tpm
+and models are assumed to run one after the other, as the scripts do.
+"""
+
+import os
+import sys
+from typing import Dict, List, Optional
+
+from common.tokens import count_message_tokens
+
+# USD per million (prompt, completion) tokens, from the public price list.
+PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4-turbo": (10.00, 30.00),
+    "gpt-4": (30.00, 60.00),
+    "gpt-3.5-turbo": (0.50, 1.50),
+}
+
+
+def format_cost(dollars: float) -> str:
+    return f"${dollars:,.2f}" if dollars >= 1 else f"${dollars:.4f}"
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(round(seconds))
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+    return f"{seconds}s"
+
+
+class Estimator:
+    def __init__(self, script: Optional[str] = None, concurrency: int = 1, rpm: Optional[float] = None,
+                 tpm: Optional[float] = None, latency_s: float = 0.6, output_tokens_per_s: float = 60.0,
+                 pause_s: float = 0.0, show_prompts: bool = False):
+        self.script = script or os.path.basename(sys.argv[0])
+        self.concurrency = max(1, concurrency)
+        self.rpm = rpm
+        self.tpm = tpm
+        self.latency_s = latency_s
+        self.output_tokens_per_s = output_tokens_per_s
+        self.pause_s = pause_s
+        self.show_prompts = show_prompts
+        self.models: Dict[str, Dict[str, int]] = {}
+
+    def add(self, model: str, messages: List[Dict], completion_tokens: int):
+        """Count one request that a live run would send."""
+        if self.show_prompts:
+            print("\n=== PROMPT THAT WOULD BE SENT ===")
+            for message in messages:
+                print(message["content"])
+            print("=== END PROMPT ===\n")
+        stats = self.models.setdefault(model, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+        stats["calls"] += 1
+        stats["prompt_tokens"] += count_message_tokens(messages, model)
+        stats["completion_tokens"] += completion_tokens
+
+    def add_prompt(self, model: str, prompt: str, completion_tokens: int, system_prompt: Optional[str] = None):
+        messages = [{"role": "user", "content": prompt}]
+        if system_prompt:
+            messages.insert(0, {"role": "system", "content": system_prompt})
+        self.add(model, messages, completion_tokens)
+
+    def cost(self, model: str) -> Optional[float]:
+        if model not in PRICES:
+            return None
+        prompt_price, completion_price = PRICES[model]
+        stats = self.models[model]
+        return (stats["prompt_tokens"] * prompt_price + stats["completion_tokens"] * completion_price) / 1e6
+
+    def wall_time(self, model: str) -> float:
+        stats = self.models[model]
+        calls = stats["calls"]
+        per_call = self.latency_s + self.pause_s
+        if calls:
+            per_call += stats["completion_tokens"] / calls / self.output_tokens_per_s
+        bounds = [calls * per_call / self.concurrency]
+        if self.rpm:
+            bounds.append(calls / self.rpm * 60)
+        if self.tpm:
+            bounds.append((stats["prompt_tokens"] + stats["completion_tokens"]) / self.tpm * 60)
+        return max(bounds)
+
+    def summary(self) -> List[str]:
+        lines = [f"💰 Dry-run estimate for {self.script}",
+                 f"   {'model':<16}{'calls':>10}{'prompt tok':>14}{'completion tok':>16}{'cost':>12}{'wall time':>12}"]
+        totals = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
+        total_cost, total_time, priced = 0.0, 0.0, True
+        for model, stats in self.models.items():
+            cost = self.cost(model)
+            seconds = self.wall_time(model)
+            for key in totals:
+                totals[key] += stats[key]
+            total_time += seconds
+            if cost is None:
+                priced = False
+            else:
+                total_cost += cost
+            lines.append(f"   {model:<16}{stats['calls']:>10,}{stats['prompt_tokens']:>14,}"
+                         f"{stats['completion_tokens']:>16,}{'?' if cost is None else format_cost(cost):>12}"
+                         f"{format_duration(seconds):>12}")
+        if len(self.models) > 1:
+            cost_text = format_cost(total_cost) + ("" if priced else "+?")
+            lines.append(f"   {'total':<16}{totals['calls']:>10,}{totals['prompt_tokens']:>14,}"
+                         f"{totals['completion_tokens']:>16,}{cost_text:>12}{format_duration(total_time):>12}")
+        if not self.models:
+            lines.append("   (no requests)")
+        limits = ", ".join(f"{value:g} {name}" for name, value in (("rpm", self.rpm), ("tpm", self.tpm)) if value)
+        lines.append(f"   assumes {self.concurrency} concurrent request(s), {self.latency_s:g}s latency + "
+                     f"{self.output_tokens_per_s:g} completion tok/s, {self.pause_s:g}s pause per call, "
+                     f"{limits or 'no rate limits'}")
+        return lines
+
+
+def add_estimate_arguments(parser):
+    group = parser.add_argument_group('dry-run estimate')
+    group.add_argument('--show_prompts', action='store_true', help='Dry run: also print every prompt')
+    group.add_argument('--concurrency', type=int, default=1,
+                       help='Dry run: requests in flight at once (default: 1, as the scripts run)')
+    group.add_argument('--rpm', type=float, help='Dry run: requests-per-minute limit of the account')
+    group.add_argument('--tpm', type=float, help='Dry run: tokens-per-minute limit of the account')
+    group.add_argument('--latency_s', type=float, default=0.6, help='Dry run: seconds per request before the answer '
+                                                                     '(default: 0.6)')
+    group.add_argument('--output_tokens_per_s', type=float, default=60.0,
+                       help='Dry run: completion tokens generated per second (default: 60)')
+
+
+def make_estimator(args, pause_s: float = 0.0) -> Estimator:
+    """Estimator configured from add_estimate_arguments() options; pause_s is the script's sleep per call."""
+    return Estimator(concurrency=args.concurrency, rpm=args.rpm, tpm=args.tpm, latency_s=args.latency_s,
+                     output_tokens_per_s=args.output_tokens_per_s, pause_s=pause_s,
+                     show_prompts=args.show_prompts)
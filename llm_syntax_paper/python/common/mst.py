@@ -0,0 +1,193 @@
+"""Maximum spanning tree decoding of arc score matrices.
+
+Scores are an (n+1) x (n+1) array with scores[h, d] the score of head h for
+dependent d; index 0 is the artificial root and tokens are 1..n.  Both
+decoders return an int array `heads` of length n+1 with heads[d] the chosen
+head of token d and heads[0] = -1, and both allow exactly one token under
+the root.
+
+  chu_liu_edmonds - non-projective trees
+  eisner          - projective trees
+"""
+
+import numpy as np
+
+NEG_INF = -np.inf
+
+
+def _find_cycle(heads: np.ndarray):
+    """Token ids of one cycle in a head array, or None."""
+    heads = heads.tolist()
+    state = [0] * len(heads)  # 0 = unvisited, 1 = on current path, 2 = done
+    state[0] = 2
+    for start in range(1, len(heads)):
+        path = []
+        node = start
+        while state[node] == 0:
+            state[node] = 1
+            path.append(node)
+            node = heads[node]
+        if state[node] == 1:
+            return np.array(path[path.index(node):])
+        for node in path:
+            state[node] = 2
+    return None
+
+
+def _cle(scores: np.ndarray) -> np.ndarray:
+    heads = scores.argmax(axis=0)
+    heads[0] = -1
+    cycle = _find_cycle(heads)
+    if cycle is None:
+        return heads
+
+    in_cycle = np.zeros(len(heads), dtype=bool)
+    in_cycle[cycle] = True
+    outside = np.flatnonzero(~in_cycle)  # includes the root at position 0
+    cycle_arcs = scores[heads[cycle], cycle]
+
+    # Entering the cycle at d from outside head h replaces d's cycle arc.
+    enter = scores[outside[:, None], cycle] - cycle_arcs[None, :]
+    best_enter = enter.argmax(axis=1)
+    # Leaving the cycle to outside dependent d uses the best cycle node as head.
+    leave = scores[cycle[:, None], outside]
+    best_leave = leave.argmax(axis=0)
+
+    m = len(outside)
+    contracted = np.full((m + 1, m + 1), NEG_INF)
+    contracted[:m, :m] = scores[outside[:, None], outside]
+    contracted[:m, m] = enter.max(axis=1)
+    contracted[m, :m] = leave.max(axis=0)
+    contracted[:, 0] = NEG_INF
+
+    sub_heads = _cle(contracted)
+
+    new_heads = heads.copy()
+    for j in range(1, m):
+        h = sub_heads[j]
+        new_heads[outside[j]] = cycle[best_leave[j]] if h == m else outside[h]
+    h = sub_heads[m]
+    new_heads[cycle[best_enter[h]]] = outside[h]
+    return new_heads
+
+
+def _is_projective(heads: np.ndarray) -> bool:
+    """Whether no two arcs cross (with the root arc included)."""
+    lo = np.minimum(heads[1:], np.arange(1, len(heads)))
+    hi = np.maximum(heads[1:], np.arange(1, len(heads)))
+    crossing = (lo[:, None] < lo[None, :]) & (lo[None, :] < hi[:, None]) & (hi[:, None] < hi[None, :])
+    return not crossing.any()
+
+
+def _tree_score(scores: np.ndarray, heads: np.ndarray) -> float:
+    return float(scores[heads[1:], np.arange(1, len(heads))].sum())
+
+
+def chu_liu_edmonds(scores: np.ndarray) -> np.ndarray:
+    """Highest-scoring non-projective tree with a single root child."""
+    scores = np.array(scores, dtype=float)
+    np.fill_diagonal(scores, NEG_INF)
+    scores[:, 0] = NEG_INF
+
+    heads = _cle(scores)
+    roots = np.flatnonzero(heads[1:] == 0) + 1
+    if len(roots) <= 1:
+        return heads
+
+    # Several tokens chose the root: re-decode once per candidate root child
+    # with every other root arc removed, and keep the best tree.
+    best, best_score = heads, NEG_INF
+    for r in roots:
+        constrained = scores.copy()
+        constrained[0, :] = NEG_INF
+        constrained[0, r] = scores[0, r]
+        candidate = _cle(constrained)
+        score = _tree_score(scores, candidate)
+        if score > best_score:
+            best, best_score = candidate, score
+    return best
+
+
+def eisner(scores: np.ndarray) -> np.ndarray:
+    """Highest-scoring projective tree with a single root child.
+
+    Span tables are kept twice, indexed by (start, width) and by (end, width),
+    so every split-point maximum for one width is a strided slice and all spans
+    of that width are filled at once.
+    """
+    scores = np.array(scores, dtype=float)
+    np.fill_diagonal(scores, NEG_INF)
+    scores[:, 0] = NEG_INF
+    size = scores.shape[0]
+
+    # The per-token argmax bounds every tree's score, so when it already is a
+    # projective tree with one root child it is the answer.
+    heads = scores.argmax(axis=0)
+    heads[0] = -1
+    if (heads[1:] == 0).sum() == 1 and _find_cycle(heads) is None and _is_projective(heads):
+        return heads
+
+    n = size - 1
+    # Direction 0 has its head at the right end, direction 1 at the left end.
+    c_start = np.full((2, size, size), NEG_INF)
+    c_end = np.full((2, size, size), NEG_INF)
+    i_start = np.full((2, size, size), NEG_INF)
+    i_end = np.full((2, size, size), NEG_INF)
+    c_start[:, :, 0] = c_end[:, :, 0] = 0.0
+    # Split points, stored as offsets from the span start.
+    c_split = np.zeros((2, size, size), dtype=int)
+    i_split = np.zeros((size, size), dtype=int)
+
+    for width in range(1, size):
+        m = size - width
+
+        # Incomplete spans: an arc between s and s+width over a split r in [s, t).
+        joined = c_start[1, :m, :width] + c_end[0, width:, width - 1::-1]
+        best = joined.argmax(axis=1)
+        best_val = joined[np.arange(m), best]
+        for direction, arc in ((0, np.diagonal(scores, -width)), (1, np.diagonal(scores, width))):
+            i_start[direction, :m, width] = i_end[direction, width:, width] = best_val + arc
+        i_split[:m, width] = best
+
+        # Complete left-facing spans: head t, split r in [s, t).
+        left = c_start[0, :m, :width] + i_end[0, width:, width:0:-1]
+        best = left.argmax(axis=1)
+        c_start[0, :m, width] = c_end[0, width:, width] = left[np.arange(m), best]
+        c_split[0, :m, width] = best
+
+        # Complete right-facing spans: head s, split r in (s, t].
+        right = i_start[1, :m, 1:width + 1] + c_end[1, width:, width - 1::-1]
+        best = right.argmax(axis=1)
+        c_start[1, :m, width] = c_end[1, width:, width] = right[np.arange(m), best]
+        c_split[1, :m, width] = best + 1
+
+        # A single root child: the root may only complete the whole sentence.
+        if width < n:
+            c_start[1, 0, width] = c_end[1, width, width] = NEG_INF
+
+    heads = np.full(size, -1, dtype=int)
+    stack = [(0, n, 1, True)]
+    while stack:
+        s, t, direction, is_complete = stack.pop()
+        if s == t:
+            continue
+        if is_complete:
+            r = s + c_split[direction, s, t - s]
+            if direction == 0:
+                stack.append((s, r, 0, True))
+                stack.append((r, t, 0, False))
+            else:
+                stack.append((s, r, 1, False))
+                stack.append((r, t, 1, True))
+        else:
+            r = s + i_split[s, t - s]
+            if direction == 0:
+                heads[s] = t
+            else:
+                heads[t] = s
+            stack.append((s, r, 1, True))
+            stack.append((r + 1, t, 0, True))
+    return heads
+
+
+DECODERS = {"cle": chu_liu_edmonds, "eisner": eisner}
@@ -0,0 +1,195 @@
+"""Stanza pipelines per language, loaded on first use and evicted LRU.
+
+PipelinePool.get(lang) downloads and builds the pipeline for a language code
+the first time it is asked for and keeps it resident.  At most max_models
+pipelines (and, with max_memory_mb, at most that many MB of model files) stay
+loaded; the least recently used one is dropped when a new language would go
+over the limit.  Memory is estimated from the sizes of the model, pretrain and
+charlm files each processor loaded, which is close to what they take in RAM.
+
+parse_stream() routes a mixed-language stream to the right pipeline in
+batches: items are buffered per language and a buffer is parsed in one call
+when it is full (or when too many items are waiting), and results come back
+in input order.  language_of_comments() reads a CoNLL-U '# lang = xx' (or
+'# language = xx') comment, for streams whose language is not a JSON field.
+"""
+
+import gc
+import logging
+import os
+import sys
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from common.tracing import span
+
+logger = logging.getLogger(__name__)
+
+_MODEL_FILE_KEYS = ("model_path", "pretrain_path", "forward_charlm_path", "backward_charlm_path")
+
+
+def language_of_comments(comments: List[str], default: Optional[str] = None) -> Optional[str]:
+    for comment in comments:
+        key, sep, value = comment.lstrip("#").partition("=")
+        if sep and key.strip() in ("lang", "language") and value.strip():
+            return value.strip()
+    return default
+
+
+def pipeline_footprint(nlp) -> int:
+    """Bytes of model files behind a loaded pipeline (shared files counted once)."""
+    paths = set()
+    for processor in getattr(nlp, "processors", {}).values():
+        config = getattr(processor, "config", None) or {}
+        for key in _MODEL_FILE_KEYS:
+            path = config.get(key)
+            if isinstance(path, str) and os.path.exists(path):
+                paths.add(os.path.realpath(path))
+    return sum(os.path.getsize(path) for path in paths)
+
+
+class PipelinePool:
+    def __init__(self, processors: str = 'tokenize,pos,lemma,depparse', max_models: int = 2,
+                 max_memory_mb: Optional[float] = None, pretokenized: bool = False, download: bool = True,
+                 **pipeline_kwargs):
+        self.processors = processors
+        self.max_models = max(1, max_models)
+        self.max_memory = max_memory_mb * 1024 * 1024 if max_memory_mb else None
+        self.pretokenized = pretokenized
+        self.download = download
+        self.pipeline_kwargs = pipeline_kwargs
+        self._loaded: "OrderedDict[str, Tuple[object, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.loads = 0
+        self.hits = 0
+        self.evictions = 0
+
+    def __contains__(self, lang: str) -> bool:
+        return lang in self._loaded
+
+    @property
+    def resident(self) -> List[str]:
+        """Loaded languages, least recently used first."""
+        return list(self._loaded)
+
+    @property
+    def memory(self) -> int:
+        return sum(size for _, size in self._loaded.values())
+
+    def _load(self, lang: str):
+        import stanza
+        with span("stanza_setup", lang=lang):
+            if self.download:
+                stanza.download(lang, processors=self.processors)
+            return stanza.Pipeline(lang=lang, processors=self.processors,
+                                   tokenize_pretokenized=self.pretokenized, **self.pipeline_kwargs)
+
+    def _evict(self, lang: str):
+        del self._loaded[lang]
+        self.evictions += 1
+        logger.info(f"♻️  Unloaded Stanza pipeline '{lang}'")
+        gc.collect()
+        torch = sys.modules.get("torch")
+        if torch is not None and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def get(self, lang: str):
+        """The pipeline for lang, loading it (and evicting LRU pipelines) if needed."""
+        with self._lock:
+            if lang in self._loaded:
+                self._loaded.move_to_end(lang)
+                self.hits += 1
+                return self._loaded[lang][0]
+            while len(self._loaded) >= self.max_models:
+                self._evict(next(iter(self._loaded)))
+            nlp = self._load(lang)
+            size = pipeline_footprint(nlp)
+            self._loaded[lang] = (nlp, size)
+            self.loads += 1
+            if self.max_memory is not None:
+                while len(self._loaded) > 1 and self.memory > self.max_memory:
+                    self._evict(next(iter(self._loaded)))
+            logger.info(f"📦 Loaded Stanza pipeline '{lang}' (~{size / 1024 / 1024:.0f} MB, "
+                        f"resident: {', '.join(self._loaded)})")
+            return nlp
+
+    def parse(self, lang: str, inputs: List) -> List[List]:
+        """Parse a batch of one language; per input, its list of Stanza sentences.
+
+        Inputs are raw strings, or word lists when the pool is pretokenized (one sentence each).
+        """
+        nlp = self.get(lang)
+        with span("stanza", lang=lang, batch=len(inputs)):
+            if self.pretokenized:
+                return [[sentence] for sentence in nlp(inputs).sentences]
+            return [doc.sentences for doc in nlp.bulk_process(inputs)]
+
+    def summary(self) -> str:
+        return (f"Stanza pipelines: {self.loads} loads, {self.evictions} evictions, {self.hits} reuses; "
+                f"resident: {', '.join(self._loaded) or 'none'} (~{self.memory / 1024 / 1024:.0f} MB)")
+
+
+def add_pipeline_arguments(parser, default_lang: str = 'en'):
+    group = parser.add_argument_group('stanza pipelines')
+    group.add_argument('--lang', default=default_lang,
+                       help=f'Stanza language for items that do not name one (default: {default_lang})')
+    group.add_argument('--max_models', type=int, default=2,
+                       help='Keep at most this many language pipelines loaded (default: 2)')
+    group.add_argument('--max_model_mb', type=float,
+                       help='Also evict pipelines beyond this many MB of model files')
+    group.add_argument('--parse_batch_size', type=int, default=32,
+                       help='Sentences of one language parsed per Stanza call (default: 32)')
+
+
+def make_pipeline_pool(args, processors: str = 'tokenize,pos,lemma,depparse', pretokenized: bool = False,
+                       **pipeline_kwargs) -> PipelinePool:
+    return PipelinePool(processors, max_models=args.max_models, max_memory_mb=args.max_model_mb,
+                        pretokenized=pretokenized, **pipeline_kwargs)
+
+
+def parse_stream(pool: PipelinePool, items: Iterable, lang_of: Callable, input_of: Callable,
+                 batch_size: int = 32, max_pending: Optional[int] = None) -> Iterator[Tuple[object, List]]:
+    """Yield (item, Stanza sentences) in input order, parsing each language in batches.
+
+    Up to max_pending items (default: 4 batches) wait for their language's batch to
+    fill; past that, the batch holding the oldest waiting item is parsed early.
+    At the end of the stream, languages already resident are parsed first.
+    Items whose language is None are passed through unparsed (with None).
+    """
+    max_pending = max(batch_size, max_pending or 4 * batch_size)
+    buffers: Dict[str, List[Tuple[int, object]]] = OrderedDict()
+    done: Dict[int, List] = {}
+    order = deque()  # (index, item) in input order, not yet yielded
+    waiting = 0
+
+    def flush(lang: str):
+        nonlocal waiting
+        batch = buffers.pop(lang)
+        waiting -= len(batch)
+        for (index, _), sentences in zip(batch, pool.parse(lang, [input_of(item) for _, item in batch])):
+            done[index] = sentences
+
+    def ready() -> Iterator[Tuple[object, List]]:
+        while order and order[0][0] in done:
+            index, item = order.popleft()
+            yield item, done.pop(index)
+
+    for index, item in enumerate(items):
+        lang = lang_of(item)
+        order.append((index, item))
+        if lang is None:
+            done[index] = None
+            yield from ready()
+            continue
+        buffers.setdefault(lang, []).append((index, item))
+        waiting += 1
+        if len(buffers[lang]) >= batch_size:
+            flush(lang)
+        while waiting > max_pending:
+            flush(min(buffers, key=lambda lang: buffers[lang][0][0]))
+        yield from ready()
+
+    for lang in sorted(buffers, key=lambda lang: lang not in pool):
+        flush(lang)
+    yield from ready()
@@ -0,0 +1,83 @@
+"""A request/token budget shared by concurrent API callers.
+
+RateBudget holds one token bucket for requests per minute and one for tokens
+per minute.  acquire() reserves its share under a lock and sleeps outside it,
+so any number of threads drawing from the same budget stay under the account
+limits together and are served in arrival order.  Buckets hold one second of
+refill, which keeps bursts small instead of spending a whole minute's quota up
+front.
+
+BudgetedClient wraps an OpenAI client so existing code that calls
+client.chat.completions.create() draws from the budget without changes.
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+from typing import Optional
+
+from common.tokens import count_message_tokens
+from common.tracing import span
+
+
+class _Bucket:
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate)
+        self.level = self.capacity
+        self.stamp = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take amount (possibly going into debt) and return the seconds until it is covered."""
+        self.level = min(self.capacity, self.level + (now - self.stamp) * self.rate)
+        self.stamp = now
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+
+class RateBudget:
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = _Bucket(rpm) if rpm else None
+        self._tokens = _Bucket(tpm) if tpm else None
+        self._lock = threading.Lock()
+        self.waited_s = 0.0
+        self.calls = 0
+
+    def acquire(self, tokens: int = 0):
+        """Block until one request of this many tokens fits the budget."""
+        with self._lock:
+            now = time.monotonic()
+            wait = 0.0
+            if self._requests is not None:
+                wait = max(wait, self._requests.reserve(1, now))
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.reserve(tokens, now))
+            self.calls += 1
+            self.waited_s += wait
+        if wait > 0:
+            with span("rate_limit"):
+                time.sleep(wait)
+
+    def summary(self) -> str:
+        limits = ", ".join(f"{value:g} {name}" for name, value in (("rpm", self.rpm), ("tpm", self.tpm)) if value)
+        return (f"Rate budget ({limits or 'unlimited'}): {self.calls} requests, "
+                f"{self.waited_s:.1f}s spent waiting")
+
+
+class BudgetedClient:
+    """OpenAI client stand-in whose chat completions draw from a shared RateBudget."""
+
+    def __init__(self, client, budget: RateBudget):
+        self._client = client
+        self.budget = budget
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        tokens = count_message_tokens(kwargs.get("messages", []), kwargs.get("model", "gpt-4o"))
+        self.budget.acquire(tokens + kwargs.get("max_tokens", 0))
+        return self._client.chat.completions.create(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
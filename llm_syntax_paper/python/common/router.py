@@ -0,0 +1,219 @@
+"""Model-tier routing: ask a cheap model first and escalate only when needed.
+
+A query goes to the first tier of its task's policy.  The answer is accepted
+when it passes the task's validator (a UPOS tag, a UD label, a word of the
+sentence, a candidate number in range, a well-formed CoNLL-U parse, ...) and
+its log-probability is at least the policy's min_logprob; otherwise the next,
+stronger tier is asked.  The log-probability is that of the whole answer, of
+its first token for free-text answers whose verdict comes first ("no" or an
+explanation), or not used at all for long structured answers, which are
+escalated on validity alone.  The last tier's answer is always
+kept.  The router counts calls, escalations, latency and (when the caller
+reports correctness) accuracy per tier for the run summary.
+
+Scripts opt in with --route; without it they keep their single hard-coded model.
+"""
+
+import json
+import logging
+import re
+import time
+from typing import Any, List, Optional, Tuple
+
+from common.tracing import span
+from common.ud import UPOS_TAGS, is_valid_deprel, validate_tokens
+
+_UPOS_SET = set(UPOS_TAGS)
+
+
+def first_word(answer: str) -> str:
+    words = answer.split()
+    return words[0].strip(".,;:'\"`()") if words else ""
+
+
+def valid_upos(answer: str, sentence: Optional[str] = None) -> bool:
+    return first_word(answer).upper() in _UPOS_SET
+
+
+def valid_deprel(answer: str, sentence: Optional[str] = None) -> bool:
+    return is_valid_deprel(first_word(answer))
+
+
+def valid_head_word(answer: str, sentence: Optional[str] = None) -> bool:
+    """'root' or a word of the sentence (case-insensitive)."""
+    word = first_word(answer).lower()
+    if word == "root":
+        return True
+    if sentence is None:
+        return bool(word)
+    sentence = sentence.lower()
+    return word in set(sentence.split()) | set(re.findall(r"\w+", sentence))
+
+
+def valid_judgment(answer: str, context: Any = None) -> bool:
+    """Any non-empty verdict: "no", or an explanation of the error."""
+    return bool(first_word(answer))
+
+
+def valid_choice(answer: str, n_candidates: Optional[int] = None) -> bool:
+    """A candidate number between 1 and n_candidates."""
+    match = re.search(r"\d+", answer or "")
+    return bool(match) and (n_candidates is None or 1 <= int(match.group()) <= n_candidates)
+
+
+def valid_conllu(answer: str, n_words: Optional[int] = None) -> bool:
+    """One CoNLL-U line per word, numbered 1..n, with heads and labels validate_tokens() accepts."""
+    lines = [line for line in (answer or "").strip().splitlines() if line.strip() and not line.startswith("#")]
+    if not lines or (n_words is not None and len(lines) != n_words):
+        return False
+    records = {}
+    for n, line in enumerate(lines, 1):
+        parts = line.split("\t")
+        if len(parts) != 10 or parts[0] != str(n) or not parts[6].isdigit():
+            return False
+        records[n] = {"upos": parts[3], "head": int(parts[6]), "deprel": parts[7]}
+    return not validate_tokens(records, len(lines))
+
+
+def valid_head_map(answer: str, sentences: Optional[List[str]] = None) -> bool:
+    """A JSON object giving, for every item 1..n, a word of that item's sentence."""
+    match = re.search(r"\{.*\}", answer or "", re.S)
+    try:
+        data = json.loads(match.group()) if match else None
+    except json.JSONDecodeError:
+        return False
+    if not isinstance(data, dict):
+        return False
+    if sentences is None:
+        return bool(data)
+    heads = {str(key).strip(): value for key, value in data.items()}
+    return all(isinstance(heads.get(str(n)), str) and valid_head_word(heads[str(n)], sentence)
+               for n, sentence in enumerate(sentences, 1))
+
+
+VALIDATORS = {"upos": valid_upos, "deprel": valid_deprel, "head_word": valid_head_word,
+              "judgment": valid_judgment, "choice": valid_choice, "conllu": valid_conllu,
+              "head_map": valid_head_map}
+
+# Per-task policy: model tiers from cheapest to strongest, the answer validator,
+# which log-probability counts ("answer": the whole answer, "first": its first
+# token, None: escalate on validity only) and the minimum to accept it without escalating.
+TASK_POLICIES = {
+    "tags": {"tiers": ["gpt-4o-mini", "gpt-4o"], "validate": "upos", "min_logprob": -0.7},
+    "rels": {"tiers": ["gpt-4o-mini", "gpt-4o"], "validate": "deprel", "min_logprob": -0.7},
+    "arcs": {"tiers": ["gpt-4o-mini", "gpt-4o"], "validate": "head_word", "min_logprob": -1.0},
+    "pp_head": {"tiers": ["gpt-4o-mini", "gpt-4"], "validate": "head_word", "min_logprob": -1.0},
+    "pp_pack": {"tiers": ["gpt-4o-mini", "gpt-4"], "validate": "head_map", "confidence": None},
+    "judge": {"tiers": ["gpt-4o-mini", "gpt-4"], "validate": "judgment", "confidence": "first", "min_logprob": -0.5},
+    "pick": {"tiers": ["gpt-4o-mini", "gpt-4"], "validate": "choice", "min_logprob": -0.7},
+    "conllu": {"tiers": ["gpt-4o-mini", "gpt-4o"], "validate": "conllu", "confidence": None},
+}
+
+
+class Router:
+    def __init__(self, client, task: str, tiers: Optional[List[str]] = None, min_logprob: Optional[float] = None,
+                 system_prompt: Optional[str] = None):
+        policy = TASK_POLICIES[task]
+        self.client = client
+        self.task = task
+        self.tiers = tiers or policy["tiers"]
+        self.confidence = policy.get("confidence", "answer")
+        self.min_logprob = policy.get("min_logprob") if min_logprob is None else min_logprob
+        if self.min_logprob is not None and self.confidence is None:
+            self.confidence = "answer"
+        self.validate = VALIDATORS[policy["validate"]]
+        self.system_prompt = system_prompt
+        self.stats = {model: {"calls": 0, "errors": 0, "accepted": 0, "invalid": 0, "low_confidence": 0,
+                              "latency_s": 0.0, "correct": 0, "scored": 0} for model in self.tiers}
+        self.last_tier = None
+
+    def _call(self, model: str, prompt: str) -> Tuple[Optional[str], Optional[float]]:
+        messages = [{"role": "user", "content": prompt}]
+        if self.system_prompt:
+            messages.insert(0, {"role": "system", "content": self.system_prompt})
+        start = time.perf_counter()
+        try:
+            with span("api", model=model, tier=self.tiers.index(model)):
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=0,
+                    logprobs=self.confidence is not None,
+                )
+        except Exception as e:
+            logging.error(f"OpenAI API error ({model}): {e}")
+            self.stats[model]["errors"] += 1
+            return None, None
+        finally:
+            self.stats[model]["calls"] += 1
+            self.stats[model]["latency_s"] += time.perf_counter() - start
+
+        choice = response.choices[0]
+        content = choice.logprobs.content if choice.logprobs else None
+        logprob = None
+        if content:
+            logprob = content[0].logprob if self.confidence == "first" else sum(t.logprob for t in content)
+        return (choice.message.content or "").strip(), logprob
+
+    def ask(self, prompt: str, sentence: Any = None) -> Optional[str]:
+        """Answer from the cheapest tier whose answer is valid and confident enough.
+
+        sentence is what the task's validator checks the answer against: the
+        sentence text, the number of candidates or words, or the packed sentences.
+        """
+        answer = None
+        self.last_tier = None
+        for level, model in enumerate(self.tiers):
+            candidate, logprob = self._call(model, prompt)
+            if candidate is None:
+                continue
+            answer = candidate
+            self.last_tier = model
+            is_last = level == len(self.tiers) - 1
+            if not self.validate(candidate, sentence):
+                if not is_last:
+                    self.stats[model]["invalid"] += 1
+                    continue
+            elif logprob is not None and self.min_logprob is not None and logprob < self.min_logprob and not is_last:
+                self.stats[model]["low_confidence"] += 1
+                continue
+            self.stats[model]["accepted"] += 1
+            return candidate
+        return answer
+
+    def record(self, correct: bool):
+        """Attribute the correctness of the last answer to the tier that gave it."""
+        if self.last_tier is not None:
+            self.stats[self.last_tier]["scored"] += 1
+            self.stats[self.last_tier]["correct"] += bool(correct)
+
+    def summary(self) -> List[str]:
+        confidence = (f"min_logprob {self.min_logprob}" + (" (first token)" if self.confidence == "first" else "")
+                      if self.min_logprob is not None else "escalating on invalid answers only")
+        lines = [f"Routing ({self.task}): {' -> '.join(self.tiers)}, {confidence}",
+                 f"{'tier':<14} {'calls':>6} {'accepted':>9} {'invalid':>8} {'low conf':>9} {'errors':>7} "
+                 f"{'mean ms':>8} {'accuracy':>9}"]
+        for model, st in self.stats.items():
+            mean_ms = st["latency_s"] / st["calls"] * 1000 if st["calls"] else 0.0
+            accuracy = f"{st['correct'] / st['scored'] * 100:8.2f}%" if st["scored"] else f"{'-':>9}"
+            lines.append(f"{model:<14} {st['calls']:6d} {st['accepted']:9d} {st['invalid']:8d} "
+                         f"{st['low_confidence']:9d} {st['errors']:7d} {mean_ms:8.1f} {accuracy}")
+        return lines
+
+
+def add_router_arguments(parser, task: str):
+    policy = TASK_POLICIES[task]
+    parser.add_argument('--route', action='store_true',
+                        help=f'Route queries through model tiers, escalating on invalid or low-confidence answers '
+                             f'(default tiers: {",".join(policy["tiers"])})')
+    parser.add_argument('--route_tiers', help='Comma-separated models from cheapest to strongest')
+    parser.add_argument('--route_min_logprob', type=float,
+                        help=f'Escalate answers whose log-probability is below this '
+                             f'(default: {policy.get("min_logprob", "none, validity only")})')
+
+
+def make_router(args, client, task: str, system_prompt: Optional[str] = None) -> Optional[Router]:
+    if not getattr(args, 'route', False) or client is None:
+        return None
+    tiers = [t.strip() for t in args.route_tiers.split(',') if t.strip()] if args.route_tiers else None
+    return Router(client, task, tiers, args.route_min_logprob, system_prompt)
@@ -0,0 +1,427 @@
+"""Semgrex-style dependency pattern search over an indexed treebank.
+
+Patterns describe a tree fragment.  A node is a brace-delimited list of
+constraints on text, lemma, upos, xpos or deprel, each an exact value or a
+/regex/ (matched against the whole value), optionally negated with !:
+
+    {upos:NOUN}    {lemma:/with|of/;!upos:ADP}    {}
+
+A node may be named with =name, and is followed by relations to other nodes;
+every relation after a node applies to that node, and parentheses nest:
+
+    A > B      B is a child of A          A >obl B    ... with B labelled obl
+    A < B      B is the head of A         A <obl B    ... with A labelled obl
+    A >> B     B is a descendant of A     A << B      B is an ancestor of A
+    A !> B     no child of A matches B    (any relation can be negated)
+
+    {upos:VERB}=v >obj {}=o >obl ({}=pp >case {upos:ADP}=p)
+
+Distinct pattern nodes match distinct tokens.
+
+The Treebank keeps every column as an int array with a token-level inverted
+index (value -> sorted token positions) and pre-order subtree intervals, so
+a query first intersects the postings of each node's constraints, keeps only
+the sentences that contain a candidate for every required node (rarest node
+first), and runs the backtracking matcher on those sentences alone.  Indexes
+can be saved as .npz and reloaded without re-reading the CoNLL-U file.
+"""
+
+import os
+import re
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from common.conllu import is_word, read_conllu
+
+FIELDS = ["text", "lemma", "upos", "xpos", "deprel"]
+ALIASES = {"word": "text", "form": "text", "pos": "upos", "tag": "xpos", "rel": "deprel", "reln": "deprel"}
+RELATIONS = [">>", "<<", ">", "<"]
+
+
+class PatternError(ValueError):
+    pass
+
+
+class NodePattern:
+    def __init__(self, constraints: List[Tuple[str, object, bool]], name: str):
+        self.constraints = constraints  # (field, value or compiled regex, negated)
+        self.name = name
+        self.relations: List[Tuple[str, object, bool, "NodePattern"]] = []  # (op, label, negated, target)
+
+    def nodes(self, required_only: bool = False) -> Iterator["NodePattern"]:
+        yield self
+        for _, _, negated, target in self.relations:
+            if not (required_only and negated):
+                yield from target.nodes(required_only)
+
+
+_TOKEN = re.compile(r"""\s*(?:
+      (?P<node>\{(?:/(?:[^/\\]|\\.)*/|[^}])*\})
+    | (?P<name>=\w+)
+    | (?P<rel>!?(?:>>|<<|>|<)(?:/(?:[^/\\]|\\.)*/|[\w:]+)?)
+    | (?P<paren>[()])
+)""", re.X)
+
+
+def _value(text: str):
+    if len(text) >= 2 and text.startswith("/") and text.endswith("/"):
+        return re.compile(text[1:-1])
+    return text
+
+
+def _tokenize(pattern: str) -> List[Tuple[str, str]]:
+    tokens, pos = [], 0
+    pattern = pattern.rstrip()
+    while pos < len(pattern):
+        m = _TOKEN.match(pattern, pos)
+        if not m or m.end() == pos:
+            raise PatternError(f"cannot parse pattern at {pattern[pos:]!r}")
+        tokens.append((m.lastgroup, m.group(m.lastgroup)))
+        pos = m.end()
+    return tokens
+
+
+def parse_pattern(pattern: str) -> NodePattern:
+    tokens = _tokenize(pattern)
+    position = 0
+    count = 0
+
+    def peek(kind):
+        return position < len(tokens) and tokens[position][0] == kind
+
+    def take(kind):
+        nonlocal position
+        if not peek(kind):
+            found = tokens[position][1] if position < len(tokens) else "end of pattern"
+            raise PatternError(f"expected {kind}, found {found!r}")
+        position += 1
+        return tokens[position - 1][1]
+
+    def parse_node():
+        nonlocal count
+        body = take("node")[1:-1].strip()
+        constraints = []
+        for item in filter(None, (part.strip() for part in body.split(";"))):
+            negated = item.startswith("!")
+            key, sep, value = item.lstrip("!").partition(":")
+            field = ALIASES.get(key.strip(), key.strip())
+            if not sep or field not in FIELDS:
+                raise PatternError(f"bad node constraint {item!r} (fields: {', '.join(FIELDS)})")
+            constraints.append((field, _value(value.strip()), negated))
+        name = take("name")[1:] if peek("name") else f"n{count}"
+        count += 1
+        return NodePattern(constraints, name)
+
+    def parse_term():
+        if peek("paren") and tokens[position][1] == "(":
+            take("paren")
+            node = parse_expr()
+            if take("paren") != ")":
+                raise PatternError("unbalanced parentheses")
+            return node
+        return parse_node()
+
+    def parse_expr():
+        node = parse_node()
+        while peek("rel"):
+            rel = take("rel")
+            negated = rel.startswith("!")
+            rel = rel.lstrip("!")
+            op = next(o for o in RELATIONS if rel.startswith(o))
+            label = rel[len(op):] or None
+            if label and op in (">>", "<<"):
+                raise PatternError(f"{op} does not take a label")
+            node.relations.append((op, _value(label) if label else None, negated, parse_term()))
+        return node
+
+    root = parse_expr()
+    if position != len(tokens):
+        raise PatternError(f"unexpected {tokens[position][1]!r}")
+    names = [node.name for node in root.nodes()]
+    if len(set(names)) != len(names):
+        raise PatternError("node names must be unique")
+    return root
+
+
+def _preorder(heads: List[int]) -> Tuple[List[int], List[int]]:
+    """Pre-order entry and exit numbers per token (1-based heads, 0 = root).
+
+    Tokens not reachable from the root (LLM outputs can have cycles) get an
+    empty subtree of their own.
+    """
+    n = len(heads)
+    children = [[] for _ in range(n + 1)]
+    for d, h in enumerate(heads, 1):
+        if 0 <= h <= n and h != d:
+            children[h].append(d)
+    tin, tout = [0] * (n + 1), [0] * (n + 1)
+    clock = 0
+    stack = [(0, False)]
+    seen = [False] * (n + 1)
+    while stack:
+        node, done = stack.pop()
+        if done:
+            tout[node] = clock
+            continue
+        if seen[node]:
+            continue
+        seen[node] = True
+        tin[node] = clock
+        clock += 1
+        stack.append((node, True))
+        stack.extend((c, False) for c in reversed(children[node]))
+    for node in range(1, n + 1):
+        if not seen[node]:
+            tin[node], tout[node] = clock, clock + 1
+            clock += 1
+    return tin[1:], tout[1:]
+
+
+class Treebank:
+    """Columns, inverted indexes and subtree intervals for a whole corpus."""
+
+    def __init__(self, arrays: Dict[str, np.ndarray], vocab: Dict[str, List[str]], source: str = ""):
+        self.arrays = arrays
+        self.vocab = vocab
+        self.source = source
+        self.ids = {field: {v: i for i, v in enumerate(vocab[field])} for field in FIELDS}
+        self.offsets = arrays["offsets"]
+        self.n_sentences = len(self.offsets) - 1
+        self.n_tokens = int(self.offsets[-1])
+
+    @classmethod
+    def from_conllu(cls, path: str) -> "Treebank":
+        ids = {field: {} for field in FIELDS}
+        columns = {field: [] for field in FIELDS}
+        heads, tins, touts, offsets = [], [], [], [0]
+        for _, tokens in read_conllu(path):
+            words = [t for t in tokens if is_word(t)]
+            sentence_heads = [t["head"] if t["head"] is not None else -1 for t in words]
+            for field in FIELDS:
+                table = ids[field]
+                key = "form" if field == "text" else field
+                columns[field].extend(table.setdefault(t[key], len(table)) for t in words)
+            tin, tout = _preorder(sentence_heads)
+            heads.extend(sentence_heads)
+            tins.extend(tin)
+            touts.extend(tout)
+            offsets.append(offsets[-1] + len(words))
+
+        arrays = {field: np.array(columns[field], dtype=np.int32) for field in FIELDS}
+        arrays["head"] = np.array(heads, dtype=np.int32)
+        arrays["tin"] = np.array(tins, dtype=np.int32)
+        arrays["tout"] = np.array(touts, dtype=np.int32)
+        arrays["offsets"] = np.array(offsets, dtype=np.int64)
+        for field in FIELDS:
+            # Stable argsort groups token positions by value and keeps each group sorted.
+            order = np.argsort(arrays[field], kind="stable").astype(np.int64)
+            arrays[f"{field}_order"] = order
+            arrays[f"{field}_start"] = np.searchsorted(arrays[field][order], np.arange(len(ids[field]) + 1))
+        arrays["sentence"] = np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets))
+        return cls(arrays, {field: list(ids[field]) for field in FIELDS}, path)
+
+    def save(self, path: str):
+        vocab = {f"vocab_{field}": np.array(self.vocab[field], dtype=str) for field in FIELDS}
+        np.savez(path, source=np.array(self.source), **self.arrays, **vocab)
+
+    @classmethod
+    def load(cls, path: str) -> "Treebank":
+        data = np.load(path)
+        vocab = {field: data[f"vocab_{field}"].tolist() for field in FIELDS}
+        arrays = {key: data[key] for key in data.files if not key.startswith("vocab_") and key != "source"}
+        return cls(arrays, vocab, str(data["source"]))
+
+    @classmethod
+    def open(cls, path: str) -> "Treebank":
+        return cls.load(path) if path.endswith(".npz") else cls.from_conllu(path)
+
+    def value_ids(self, field: str, value) -> List[int]:
+        if isinstance(value, re.Pattern):
+            return [i for v, i in self.ids[field].items() if value.fullmatch(v)]
+        return [self.ids[field][value]] if value in self.ids[field] else []
+
+    def postings(self, field: str, value) -> np.ndarray:
+        """Sorted positions of the tokens whose `field` matches `value`."""
+        order, start = self.arrays[f"{field}_order"], self.arrays[f"{field}_start"]
+        parts = [order[start[i]:start[i + 1]] for i in self.value_ids(field, value)]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+
+    def candidates(self, constraints: List[Tuple[str, object, bool]]) -> Optional[np.ndarray]:
+        """Sorted token positions satisfying every constraint, or None when unconstrained."""
+        positive = sorted((self.postings(field, value) for field, value, negated in constraints if not negated),
+                          key=len)
+        result = None
+        for postings in positive:
+            result = postings if result is None else np.intersect1d(result, postings, assume_unique=True)
+            if not len(result):
+                return result
+        for field, value, negated in constraints:
+            if negated:
+                excluded = np.isin(self.arrays[field] if result is None else self.arrays[field][result],
+                                   self.value_ids(field, value))
+                result = np.flatnonzero(~excluded) if result is None else result[~excluded]
+        return result
+
+    def sentence_text(self, s: int) -> str:
+        forms = self.vocab["text"]
+        return " ".join(forms[i] for i in self.arrays["text"][self.offsets[s]:self.offsets[s + 1]])
+
+    def form(self, s: int, token: int) -> str:
+        return self.vocab["text"][self.arrays["text"][self.offsets[s] + token - 1]]
+
+
+def _implied_constraints(root: NodePattern) -> Dict[str, List]:
+    """Each node's own constraints plus the deprel implied by labelled relations."""
+    implied = {node.name: list(node.constraints) for node in root.nodes()}
+    for node in root.nodes():
+        for op, label, negated, target in node.relations:
+            if label is None or negated:
+                continue
+            dependent = target if op == ">" else node
+            implied[dependent.name].append(("deprel", label, False))
+    return implied
+
+
+class _SentenceMatcher:
+    def __init__(self, tb: Treebank, columns: Dict[str, List[int]], allowed: Dict[str, Optional[set]]):
+        self.tb = tb
+        self.heads, self.deprel, self.tin, self.tout = (columns[c] for c in ("head", "deprel", "tin", "tout"))
+        self.n = len(self.heads)
+        self.allowed = allowed
+        self.children = [[] for _ in range(self.n + 1)]
+        for d, h in enumerate(self.heads, 1):
+            if 0 < h <= self.n:
+                self.children[h].append(d)
+        self._label_ids = {}
+
+    def _accepts(self, node: NodePattern, i: int) -> bool:
+        allowed = self.allowed[node.name]
+        return allowed is None or i in allowed
+
+    def _label_ok(self, label, token: int) -> bool:
+        if label is None:
+            return True
+        key = label.pattern if isinstance(label, re.Pattern) else label
+        if key not in self._label_ids:
+            self._label_ids[key] = set(self.tb.value_ids("deprel", label))
+        return self.deprel[token - 1] in self._label_ids[key]
+
+    def _targets(self, op: str, label, i: int, target: NodePattern) -> Iterator[int]:
+        if op == ">":
+            return (j for j in self.children[i] if self._label_ok(label, j))
+        if op == "<":
+            h = self.heads[i - 1]
+            return iter([h] if 0 < h <= self.n and self._label_ok(label, i) else [])
+        allowed = self.allowed[target.name]
+        pool = range(1, self.n + 1) if allowed is None else sorted(allowed)
+        lo, hi = self.tin[i - 1], self.tout[i - 1]
+        if op == ">>":
+            return (j for j in pool if lo < self.tin[j - 1] < hi)
+        return (j for j in pool if self.tin[j - 1] < lo < self.tout[j - 1])
+
+    def match(self, node: NodePattern, i: int, bound: Dict[str, int]) -> Iterator[Dict[str, int]]:
+        if not self._accepts(node, i) or i in bound.values():
+            return
+        yield from self._relations(node, 0, i, {**bound, node.name: i})
+
+    def _relations(self, node: NodePattern, k: int, i: int, bound: Dict[str, int]) -> Iterator[Dict[str, int]]:
+        if k == len(node.relations):
+            yield bound
+            return
+        op, label, negated, target = node.relations[k]
+        if negated:
+            if not any(True for j in self._targets(op, label, i, target) for _ in self.match(target, j, bound)):
+                yield from self._relations(node, k + 1, i, bound)
+            return
+        for j in self._targets(op, label, i, target):
+            for extended in self.match(target, j, bound):
+                yield from self._relations(node, k + 1, i, extended)
+
+    def matches(self, root: NodePattern) -> List[Dict[str, int]]:
+        found = []
+        allowed = self.allowed[root.name]
+        for i in (range(1, self.n + 1) if allowed is None else sorted(allowed)):
+            found.extend(self.match(root, i, {}))
+        return found
+
+
+def candidate_sentences(tb: Treebank, root: NodePattern) -> Tuple[np.ndarray, Dict[str, Optional[np.ndarray]]]:
+    """Sentences that contain a candidate token for every required node, and the per-node candidates."""
+    implied = _implied_constraints(root)
+    candidates = {name: tb.candidates(constraints) for name, constraints in implied.items()}
+    required = [candidates[node.name] for node in root.nodes(required_only=True)]
+    sentences = None
+    for cand in sorted((c for c in required if c is not None), key=len):
+        present = np.unique(tb.arrays["sentence"][cand])
+        sentences = present if sentences is None else np.intersect1d(sentences, present, assume_unique=True)
+        if not len(sentences):
+            break
+    if sentences is None:
+        sentences = np.arange(tb.n_sentences)
+    return sentences, candidates
+
+
+_job = None
+
+
+def _set_job(job):
+    global _job
+    _job = job
+
+
+def _match_shard(shard: np.ndarray) -> List[Tuple[int, Dict[str, int]]]:
+    tb, root, candidates = _job
+    if not len(shard):
+        return []
+    # Convert the shard's token span and each node's candidates (as 1-based
+    # token ids with per-sentence bounds) to lists once, not per sentence.
+    first = int(tb.offsets[shard[0]])
+    span_end = int(tb.offsets[shard[-1] + 1])
+    columns = {c: tb.arrays[c][first:span_end].tolist() for c in ("head", "deprel", "tin", "tout")}
+    starts = tb.offsets[shard]
+    ends = tb.offsets[shard + 1]
+    local = {}
+    for name, cand in candidates.items():
+        if cand is not None:
+            local[name] = ((cand - tb.offsets[tb.arrays["sentence"][cand]] + 1).tolist(),
+                           np.searchsorted(cand, starts).tolist(), np.searchsorted(cand, ends).tolist())
+
+    results = []
+    for k, s in enumerate(shard.tolist()):
+        lo, hi = int(starts[k]) - first, int(ends[k]) - first
+        sentence_columns = {c: values[lo:hi] for c, values in columns.items()}
+        allowed = {name: set(local[name][0][local[name][1][k]:local[name][2][k]]) if name in local else None
+                   for name in candidates}
+        for bindings in _SentenceMatcher(tb, sentence_columns, allowed).matches(root):
+            results.append((s, bindings))
+    return results
+
+
+def search(tb: Treebank, pattern, workers: int = 1, limit: Optional[int] = None) -> List[Tuple[int, Dict[str, int]]]:
+    """(sentence index, {node name: 1-based token id}) for every match, in corpus order."""
+    global _job
+    root = parse_pattern(pattern) if isinstance(pattern, str) else pattern
+    sentences, candidates = candidate_sentences(tb, root)
+    _job = (tb, root, candidates)
+    try:
+        if workers > 1 and len(sentences) > workers:
+            # Each worker takes contiguous runs of sentences.  The job goes through the
+            # initializer: forked workers inherit it without copying, spawned ones
+            # (the default on macOS and Windows) unpickle it once.
+            shards = np.array_split(sentences, workers * 4)
+            with Pool(workers, initializer=_set_job, initargs=(_job,)) as pool:
+                parts = pool.map(_match_shard, shards)
+            results = [match for part in parts for match in part]
+        else:
+            results = _match_shard(sentences)
+    finally:
+        _job = None
+    return results[:limit] if limit is not None else results
+
+
+def default_workers() -> int:
+    return max(1, min(8, os.cpu_count() or 1))
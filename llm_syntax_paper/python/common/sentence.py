@@ -0,0 +1,162 @@
+"""Compact Token and Sentence objects for CoNLL-U data.
+
+load_sentences() replaces the per-token dicts from CoNLL.conll2dict: ids and
+heads are ints from load time on (no more `token['head'][0] if
+isinstance(...)`), label and tag strings are interned so a corpus holds one
+copy of each, and tokens use __slots__ instead of a dict each.
+
+Tokens still answer the dict-style access the scripts use (token['text'],
+token.get('upos', '_'), token['chatgpt_upos'] = ...); keys that are not
+CoNLL-U columns go to a small per-token `extra` dict that is only created when
+needed.  Sentence.heads and Sentence.deprel_ids give numpy arrays for
+vectorized code.
+"""
+
+import sys
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from common.conllu import read_conllu
+
+# Dict keys used across the scripts (including conll2dict's spellings) -> Token attributes.
+KEY_ALIASES = {
+    "id": "id", "text": "text", "form": "text", "lemma": "lemma", "Lemma": "lemma",
+    "upos": "upos", "UPOS": "upos", "xpos": "xpos", "XPOS": "xpos", "feats": "feats", "Feats": "feats",
+    "head": "head", "deprel": "deprel", "Deprel": "deprel", "deps": "deps", "Deps": "deps",
+    "misc": "misc", "Misc": "misc",
+}
+
+# Interned deprel -> small int, shared by all sentences for Sentence.deprel_ids.
+DEPREL_IDS: Dict[str, int] = {}
+
+_intern = sys.intern
+
+
+def _field(value: str) -> Optional[str]:
+    return None if value == "_" else value
+
+
+class Token:
+    __slots__ = ("id", "text", "lemma", "upos", "xpos", "feats", "head", "deprel", "deps", "misc", "extra")
+
+    def __init__(self, id, text: str, lemma: Optional[str] = None, upos: Optional[str] = None,
+                 xpos: Optional[str] = None, feats: Optional[str] = None, head: Optional[int] = None,
+                 deprel: Optional[str] = None, deps: Optional[str] = None, misc: Optional[str] = None):
+        self.id = id
+        self.text = _intern(text)
+        self.lemma = _intern(lemma) if lemma else None
+        self.upos = _intern(upos) if upos else None
+        self.xpos = _intern(xpos) if xpos else None
+        self.feats = _intern(feats) if feats else None
+        self.head = head
+        self.deprel = _intern(deprel) if deprel else None
+        self.deps = deps
+        self.misc = misc
+        self.extra = None
+
+    @classmethod
+    def from_conllu(cls, token: Dict) -> "Token":
+        return cls(token["id"], token["form"], _field(token["lemma"]), _field(token["upos"]),
+                   _field(token["xpos"]), _field(token["feats"]), token["head"], _field(token["deprel"]),
+                   _field(token["deps"]), _field(token["misc"]))
+
+    # Dict-style access, so code written against conll2dict keeps working.
+    def __getitem__(self, key: str):
+        attr = KEY_ALIASES.get(key)
+        if attr is not None:
+            value = getattr(self, attr)
+            if value is None and attr != "head":
+                raise KeyError(key)
+            return value
+        if self.extra is None or key not in self.extra:
+            raise KeyError(key)
+        return self.extra[key]
+
+    def __setitem__(self, key: str, value):
+        attr = KEY_ALIASES.get(key)
+        if attr is not None:
+            setattr(self, attr, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def __contains__(self, key: str) -> bool:
+        attr = KEY_ALIASES.get(key)
+        if attr is not None:
+            return getattr(self, attr) is not None
+        return self.extra is not None and key in self.extra
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def setdefault(self, key: str, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def items(self):
+        return self.to_dict().items()
+
+    def to_dict(self) -> Dict:
+        fields = {attr: getattr(self, attr) for attr in self.__slots__[:-1] if getattr(self, attr) is not None}
+        return {**fields, **(self.extra or {})}
+
+    def __repr__(self):
+        return f"Token({self.id}, {self.text!r}, {self.upos}, head={self.head}, {self.deprel})"
+
+
+class Sentence:
+    __slots__ = ("tokens", "comments", "_heads", "_deprel_ids")
+
+    def __init__(self, tokens: List[Token], comments: Optional[List[str]] = None):
+        self.tokens = tokens
+        self.comments = comments or []
+        self._heads = None
+        self._deprel_ids = None
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __iter__(self) -> Iterator[Token]:
+        return iter(self.tokens)
+
+    def __getitem__(self, index):
+        return self.tokens[index]
+
+    @property
+    def text(self) -> str:
+        return " ".join(token.text for token in self.tokens)
+
+    @property
+    def heads(self) -> np.ndarray:
+        """int32 head per token (0 = root, -1 = missing); computed once."""
+        if self._heads is None:
+            self._heads = np.fromiter((-1 if t.head is None else t.head for t in self.tokens),
+                                      dtype=np.int32, count=len(self.tokens))
+        return self._heads
+
+    @property
+    def deprel_ids(self) -> np.ndarray:
+        """int16 ids of the deprels in DEPREL_IDS (-1 = missing); computed once."""
+        if self._deprel_ids is None:
+            self._deprel_ids = np.fromiter(
+                (-1 if t.deprel is None else DEPREL_IDS.setdefault(t.deprel, len(DEPREL_IDS)) for t in self.tokens),
+                dtype=np.int16, count=len(self.tokens))
+        return self._deprel_ids
+
+
+def iter_sentences(path: str, words_only: bool = True) -> Iterator[Sentence]:
+    """Stream Sentences from a CoNLL-U file; multiword ranges and empty nodes are dropped unless words_only=False."""
+    for comments, tokens in read_conllu(path):
+        if words_only:
+            tokens = [t for t in tokens if isinstance(t["id"], int)]
+        yield Sentence([Token.from_conllu(t) for t in tokens], comments)
+
+
+def load_sentences(path: str, words_only: bool = True) -> List[Sentence]:
+    return list(iter_sentences(path, words_only))
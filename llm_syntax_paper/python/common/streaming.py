@@ -0,0 +1,173 @@
+"""Streamed CoNLL-U answers, validated line by line and cancelled when hopeless.
+
+A oneshot parse is only usable if it is exactly one CoNLL-U line per word of
+the sentence, numbered 1..n with ten tab-separated columns.  ConlluStream is
+fed the completion as it arrives and checks every line when its newline comes
+in (and the start of a line as soon as its first character does), so an
+answer that opens with prose or a code fence, skips or repeats a token id,
+splits a word, or runs past the last word is recognized after a few tokens
+instead of after the whole generation.
+
+StreamingParser.ask() sends the request with stream=True and closes the
+connection at the first irrecoverable line, which stops generation (and
+billing) on the server side.  It also stops reading once all n lines are in.
+summary() reports the time to the first valid line and the completion tokens
+saved by aborting, estimated against the size of a full answer.
+"""
+
+import logging
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from common.tokens import count_tokens
+from common.tracing import span
+
+
+class ConlluStream:
+    def __init__(self, n_words: int):
+        self.n_words = n_words
+        self.lines: List[str] = []
+        self.partial = ""
+        self.error: Optional[str] = None
+
+    @property
+    def complete(self) -> bool:
+        return self.error is None and len(self.lines) == self.n_words
+
+    def _check(self, line: str) -> Optional[str]:
+        """Why this complete line makes the answer unusable, or None if it fits."""
+        stripped = line.strip()
+        if not stripped:
+            return "blank line inside the parse" if 0 < len(self.lines) < self.n_words else None
+        if stripped.startswith("#"):
+            return None
+        if len(self.lines) >= self.n_words:
+            return f"extra lines: more than the {self.n_words} words of the sentence"
+        parts = line.rstrip("\r").split("\t")
+        if len(parts) != 10:
+            return f"wrong column count: {len(parts)} instead of 10"
+        expected = len(self.lines) + 1
+        if parts[0] != str(expected):
+            return f"wrong token id: expected {expected}, got {parts[0]!r}"
+        if not parts[6].isdigit() or int(parts[6]) > self.n_words:
+            return f"bad head: {parts[6]!r} on token {expected}"
+        return None
+
+    def _check_start(self) -> Optional[str]:
+        """Catch prose and code fences from the first character of a line."""
+        start = self.partial.lstrip(" \r")
+        if not start or start[0].isdigit() or start[0] == "#":
+            return None
+        if start.startswith("`"):
+            return "code fence"
+        return f"prose: {start[:20]!r}"
+
+    def feed(self, text: str) -> bool:
+        """Take the next piece of the completion; False once the answer cannot be used."""
+        if self.error is not None:
+            return False
+        self.partial += text
+        *complete, self.partial = self.partial.split("\n")
+        for line in complete:
+            self.error = self._check(line)
+            if self.error:
+                return False
+            if line.strip() and not line.lstrip().startswith("#"):
+                self.lines.append(line.rstrip("\r"))
+        self.error = self._check_start()
+        return self.error is None
+
+    def finish(self) -> Optional[str]:
+        """The CoNLL-U block once the stream has ended, or None if it is unusable."""
+        if self.error is None and self.partial.strip():
+            self.feed("\n")
+        if self.error is None and len(self.lines) < self.n_words:
+            self.error = f"incomplete: {len(self.lines)} of {self.n_words} tokens"
+        return "\n".join(self.lines) if self.error is None else None
+
+
+class StreamingParser:
+    def __init__(self, client, model: str = "gpt-4o"):
+        self.client = client
+        self.model = model
+        self.calls = 0
+        self.errors = 0
+        self.aborted = 0
+        self.stopped_early = 0
+        self.reasons: Counter = Counter()
+        self.first_line_s: List[float] = []
+        self.tokens_received = 0
+        self.tokens_saved = 0
+
+    def ask(self, messages: List[Dict], n_words: int, full_answer_tokens: int) -> Optional[str]:
+        """Stream one oneshot parse; the CoNLL-U block, or None if it was aborted or incomplete.
+
+        full_answer_tokens is the expected size of a complete answer, against
+        which the tokens not generated after an abort are counted.
+        """
+        self.calls += 1
+        parsed = ConlluStream(n_words)
+        received = []
+        usage = None
+        start = time.perf_counter()
+        try:
+            with span("api", model=self.model, stream=True):
+                response = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                )
+                try:
+                    for chunk in response:
+                        usage = getattr(chunk, "usage", None) or usage
+                        if not chunk.choices:
+                            continue
+                        text = chunk.choices[0].delta.content or ""
+                        received.append(text)
+                        had_lines = bool(parsed.lines)
+                        if not parsed.feed(text):
+                            break
+                        if parsed.lines and not had_lines:
+                            self.first_line_s.append(time.perf_counter() - start)
+                        if parsed.complete:
+                            self.stopped_early += chunk.choices[0].finish_reason is None
+                            break
+                finally:
+                    response.close()
+        except Exception as e:
+            self.errors += 1
+            logging.error(f"OpenAI API error: {e}")
+            return None
+
+        tokens = getattr(usage, "completion_tokens", None) or count_tokens("".join(received), self.model)
+        self.tokens_received += tokens
+        if usage is not None and hasattr(self.client, "usage"):
+            self.client.usage.record(self.model, usage, time.perf_counter() - start)
+        if parsed.error is not None:
+            self.aborted += 1
+            self.reasons[parsed.error.split(":")[0]] += 1
+            self.tokens_saved += max(0, full_answer_tokens - tokens)
+            logging.warning(f"✂️  Aborted stream after {tokens} tokens: {parsed.error}")
+            return None
+        block = parsed.finish()
+        if block is None:
+            self.reasons[parsed.error.split(":")[0]] += 1
+            logging.warning(f"⚠️  Unusable answer: {parsed.error}")
+        return block
+
+    def summary(self) -> List[str]:
+        lines = [f"Streaming: {self.calls} calls, {self.aborted} aborted, {self.stopped_early} closed after the last token line, "
+                 f"{self.errors} errors"]
+        if self.first_line_s:
+            ordered = sorted(self.first_line_s)
+            lines.append(f"   time to first valid line: mean {sum(ordered) / len(ordered) * 1000:.0f} ms, "
+                         f"median {ordered[len(ordered) // 2] * 1000:.0f} ms")
+        total = self.tokens_received + self.tokens_saved
+        lines.append(f"   completion tokens: {self.tokens_received:,} received, ~{self.tokens_saved:,} saved by aborting"
+                     + (f" ({self.tokens_saved / total:.1%})" if total else ""))
+        for reason, count in self.reasons.most_common():
+            lines.append(f"   {count:>6} × {reason}")
+        return lines
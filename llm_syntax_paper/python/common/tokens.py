@@ -0,0 +1,46 @@
+"""Local prompt token counting.
+
+Uses tiktoken when it is installed and its encoding files are available;
+otherwise falls back to a word/punctuation split, which tracks the BPE count
+of English prompts closely enough for comparing prompt layouts and sizing runs.
+"""
+
+import logging
+import re
+from functools import lru_cache
+from typing import Dict, List
+
+_FALLBACK_PIECES = re.compile(r"[A-Za-z]+|\d{1,3}|[^\sA-Za-z\d]")
+
+# Per-message framing overhead of the chat format (role markers and separators).
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_REPLY = 3
+
+
+@lru_cache(maxsize=None)
+def _encoder(model: str):
+    try:
+        import tiktoken
+    except ImportError:
+        logging.warning("tiktoken not installed; using approximate token counts")
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        logging.warning(f"tiktoken encoding for {model} unavailable ({e}); using approximate token counts")
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    encoder = _encoder(model)
+    if encoder is None:
+        return len(_FALLBACK_PIECES.findall(text))
+    return len(encoder.encode(text))
+
+
+def count_message_tokens(messages: List[Dict], model: str = "gpt-4o") -> int:
+    """Prompt tokens for a chat request, including the chat format overhead."""
+    return sum(count_tokens(m["content"], model) + TOKENS_PER_MESSAGE for m in messages) + TOKENS_PER_REPLY
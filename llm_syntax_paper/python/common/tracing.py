@@ -0,0 +1,143 @@
+"""Lightweight stage tracing with Chrome/Perfetto trace export.
+
+Tracing is off unless a script calls setup_tracing() with a path, or the
+TREESTAR_TRACE environment variable names an output file.  While it is off,
+span() returns a shared no-op context manager, so instrumented code only pays
+for one function call and a global lookup.
+
+When on, every span is recorded as a Chrome "complete" event.  At exit the
+events are written to the trace file (open it in chrome://tracing or
+https://ui.perfetto.dev) and a flat per-stage summary is printed to stderr
+and written next to it as <trace>.summary.json.
+"""
+
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+TRACE_ENV_VAR = "TREESTAR_TRACE"
+
+_NULL_SPAN = nullcontext()
+_tracer = None
+
+
+class Tracer:
+    def __init__(self, path: str):
+        self.path = path
+        self.pid = os.getpid()
+        self.events: List[Dict] = []
+        self.totals = defaultdict(float)
+        self.counts = defaultdict(int)
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, args: Dict):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter(), args)
+
+    def record(self, name: str, start: float, end: float, args: Optional[Dict] = None):
+        event = {
+            "name": name,
+            "cat": "stage",
+            "ph": "X",
+            "ts": (start - self._origin) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": self.pid,
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = {k: str(v) for k, v in args.items()}
+        with self._lock:
+            self.events.append(event)
+            self.totals[name] += end - start
+            self.counts[name] += 1
+
+    def summary(self) -> List[Dict]:
+        wall = time.perf_counter() - self._origin
+        rows = []
+        for name, total in sorted(self.totals.items(), key=lambda kv: -kv[1]):
+            count = self.counts[name]
+            rows.append({
+                "stage": name,
+                "count": count,
+                "total_s": round(total, 6),
+                "mean_ms": round(total / count * 1000, 3),
+                "pct_wall": round(total / wall * 100, 2) if wall else 0.0,
+            })
+        return rows
+
+    def write(self):
+        with open(self.path, "w") as f:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, f)
+
+        rows = self.summary()
+        with open(self.path + ".summary.json", "w") as f:
+            json.dump(rows, f, indent=2)
+
+        print(f"\n⏱️  Stage summary (trace written to {self.path})", file=sys.stderr)
+        print(f"{'stage':<24}{'count':>8}{'total s':>12}{'mean ms':>12}{'% wall':>9}", file=sys.stderr)
+        for row in rows:
+            print(
+                f"{row['stage']:<24}{row['count']:>8}{row['total_s']:>12.3f}"
+                f"{row['mean_ms']:>12.3f}{row['pct_wall']:>9.1f}",
+                file=sys.stderr,
+            )
+
+
+def add_trace_argument(parser):
+    parser.add_argument('--trace', metavar='FILE',
+                        help=f'Write a Chrome/Perfetto trace of run stages to FILE '
+                             f'(also enabled by setting {TRACE_ENV_VAR})')
+
+
+def setup_tracing(path: Optional[str] = None) -> Optional[Tracer]:
+    """Turn tracing on if a path is given or TREESTAR_TRACE is set."""
+    global _tracer
+    path = path or os.environ.get(TRACE_ENV_VAR)
+    if not path:
+        return None
+    if _tracer is None:
+        _tracer = Tracer(path)
+        atexit.register(finish_tracing)
+    return _tracer
+
+
+def finish_tracing():
+    """Write the trace and summary now (also runs automatically at exit)."""
+    global _tracer
+    if _tracer is not None:
+        tracer, _tracer = _tracer, None
+        tracer.write()
+
+
+def span(name: str, **args):
+    """Context manager timing one stage, e.g. `with span("api", model=m):`."""
+    if _tracer is None:
+        return _NULL_SPAN
+    return _tracer.span(name, args)
+
+
+def traced(name: Optional[str] = None):
+    """Decorator form of span(); the stage name defaults to the function name."""
+    def decorator(func):
+        stage = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with _tracer.span(stage, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,85 @@
+"""Universal Dependencies inventories and local validation of LLM-produced parses.
+
+validate_tokens() checks a parse given as {token id: record} against a
+sentence of known length and returns the problems per token id, so callers
+can re-ask about just the broken tokens instead of the whole sentence.
+"""
+
+from typing import Dict, List, Set
+
+UPOS_TAGS = [
+    "ADJ", "ADP", "ADV", "AUX", "CCONJ", "DET", "INTJ", "NOUN", "NUM",
+    "PART", "PRON", "PROPN", "PUNCT", "SCONJ", "SYM", "VERB", "X",
+]
+
+UD_DEPRELS = [
+    "acl", "advcl", "advmod", "amod", "appos", "aux", "case", "cc", "ccomp",
+    "clf", "compound", "conj", "cop", "csubj", "dep", "det", "discourse",
+    "dislocated", "expl", "fixed", "flat", "goeswith", "iobj", "list", "mark",
+    "nmod", "nsubj", "nummod", "obj", "obl", "orphan", "parataxis", "punct",
+    "reparandum", "root", "vocative", "xcomp",
+]
+
+_UPOS_SET = set(UPOS_TAGS)
+_DEPREL_SET = set(UD_DEPRELS)
+
+
+def base_deprel(deprel: str) -> str:
+    """nmod:poss -> nmod"""
+    return deprel.split(":", 1)[0].lower()
+
+
+def is_valid_deprel(deprel: str) -> bool:
+    return isinstance(deprel, str) and base_deprel(deprel) in _DEPREL_SET
+
+
+def cycle_tokens(heads: Dict[int, int]) -> Set[int]:
+    """Token ids that lie on a head cycle (heads maps id -> head, 0 = root)."""
+    in_cycle = set()
+    for start in heads:
+        path, position = [], {}
+        node = start
+        while node in heads and node not in position and node not in in_cycle:
+            position[node] = len(path)
+            path.append(node)
+            node = heads[node]
+        if node in position:
+            in_cycle.update(path[position[node]:])
+    return in_cycle
+
+
+def validate_tokens(tokens: Dict[int, Dict], n_tokens: int) -> Dict[int, List[str]]:
+    """Problems per token id for records with "upos", "head" and "deprel" fields."""
+    problems = {}
+
+    def flag(token_id, message):
+        problems.setdefault(token_id, []).append(message)
+
+    heads = {}
+    for token_id in range(1, n_tokens + 1):
+        record = tokens.get(token_id)
+        if record is None:
+            flag(token_id, "missing")
+            continue
+        head = record.get("head")
+        if not isinstance(head, int) or isinstance(head, bool) or not 0 <= head <= n_tokens:
+            flag(token_id, f"head {head!r} is not a token id between 0 and {n_tokens}")
+        elif head == token_id:
+            flag(token_id, "token is its own head")
+        else:
+            heads[token_id] = head
+        if record.get("upos") not in _UPOS_SET:
+            flag(token_id, f"unknown UPOS tag {record.get('upos')!r}")
+        if not is_valid_deprel(record.get("deprel")):
+            flag(token_id, f"unknown dependency label {record.get('deprel')!r}")
+        elif token_id in heads and (base_deprel(record["deprel"]) == "root") != (heads[token_id] == 0):
+            flag(token_id, "only the token with head 0 may have the label root")
+
+    roots = [token_id for token_id, head in heads.items() if head == 0]
+    for token_id in roots[1:]:
+        flag(token_id, f"second root (token {roots[0]} is already attached to 0)")
+
+    for token_id in sorted(cycle_tokens(heads)):
+        flag(token_id, "part of a head cycle")
+
+    return problems
@@ -0,0 +1,80 @@
+"""Per-call token usage and prompt-cache telemetry.
+
+OpenAI caches the longest previously seen prompt prefix (in 128-token steps,
+once a prompt reaches 1024 tokens) and reports the reused part as
+usage.prompt_tokens_details.cached_tokens.  The prompt builders therefore put
+the static instructions first, then the sentence, then the per-token question,
+so every call about the same sentence shares everything but its last line.
+
+TrackedClient wraps an OpenAI client and records, for every chat completion,
+the prompt, cached and completion tokens and the latency.  summary() reports
+the cache hit rate per model and the mean latency of calls that did and did
+not hit the cache, which is the visible gain from the prompt layout.
+"""
+
+import threading
+import time
+from types import SimpleNamespace
+from typing import Dict, List
+
+
+def cached_tokens(usage) -> int:
+    details = getattr(usage, "prompt_tokens_details", None)
+    return (getattr(details, "cached_tokens", None) or 0) if details is not None else 0
+
+
+class UsageTracker:
+    def __init__(self):
+        self.models: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, usage, latency_s: float):
+        cached = cached_tokens(usage)
+        with self._lock:
+            stats = self.models.setdefault(model, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0,
+                                                   "completion_tokens": 0, "hit_calls": 0,
+                                                   "hit_latency_s": 0.0, "miss_latency_s": 0.0})
+            stats["calls"] += 1
+            stats["prompt_tokens"] += getattr(usage, "prompt_tokens", 0) or 0
+            stats["completion_tokens"] += getattr(usage, "completion_tokens", 0) or 0
+            stats["cached_tokens"] += cached
+            if cached:
+                stats["hit_calls"] += 1
+                stats["hit_latency_s"] += latency_s
+            else:
+                stats["miss_latency_s"] += latency_s
+
+    def summary(self) -> List[str]:
+        lines = ["Prompt cache:",
+                 f"   {'model':<16}{'calls':>8}{'prompt tok':>12}{'cached tok':>12}{'hit rate':>10}"
+                 f"{'hit calls':>11}{'hit ms':>9}{'miss ms':>9}"]
+        for model, st in self.models.items():
+            misses = st["calls"] - st["hit_calls"]
+            hit_ms = f"{st['hit_latency_s'] / st['hit_calls'] * 1000:9.0f}" if st["hit_calls"] else f"{'-':>9}"
+            miss_ms = f"{st['miss_latency_s'] / misses * 1000:9.0f}" if misses else f"{'-':>9}"
+            rate = st["cached_tokens"] / st["prompt_tokens"] if st["prompt_tokens"] else 0.0
+            lines.append(f"   {model:<16}{st['calls']:>8,}{st['prompt_tokens']:>12,}{st['cached_tokens']:>12,}"
+                         f"{rate:>10.1%}{st['hit_calls']:>11,}{hit_ms}{miss_ms}")
+        if not self.models:
+            lines.append("   (no requests)")
+        return lines
+
+
+class TrackedClient:
+    """OpenAI client stand-in that records the usage of every chat completion in .usage."""
+
+    def __init__(self, client, tracker: UsageTracker = None):
+        self._client = client
+        self.usage = tracker or UsageTracker()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        start = time.perf_counter()
+        response = self._client.chat.completions.create(**kwargs)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            self.usage.record(kwargs.get("model", "?"), usage, time.perf_counter() - start)
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
@@ -0,0 +1,100 @@
+"""Self-consistency voting over several samples from one request.
+
+With --samples N (N > 1) a script asks for N completions in a single API call
+(the n parameter) at --temperature, normalizes each answer with the task's key
+(e.g. the first word, upper-cased for UPOS tags), and keeps the majority
+answer.  The share of samples that agree with it is the answer's confidence,
+which the scripts write to MISC next to the answer (ChatGPTUPOSConf=0.80) for
+downstream selection.  Ties go to the answer sampled first.
+
+Prompt tokens are paid once per call; only the completion is multiplied by N,
+and the latency is about that of a single request.
+"""
+
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple
+
+from common.router import first_word
+from common.tracing import span
+
+
+def vote(answers: List[Optional[str]], key: Callable[[str], str] = first_word) -> Tuple[Optional[str], float]:
+    """Majority answer (as first sampled) and the share of all samples that agree with it."""
+    keyed = [(key(answer), answer.strip()) for answer in answers if answer and key(answer)]
+    if not keyed:
+        return None, 0.0
+    counts = Counter(k for k, _ in keyed)
+    winner, votes = counts.most_common(1)[0]
+    return next(answer for k, answer in keyed if k == winner), votes / len(answers)
+
+
+class Voter:
+    def __init__(self, client, samples: int, temperature: float, key: Callable[[str], str] = first_word):
+        self.client = client
+        self.samples = samples
+        self.temperature = temperature
+        self.key = key
+        self.last_confidence = None
+        self.calls = 0
+        self.errors = 0
+        self.confidences: List[float] = []
+        self.scored: Dict[float, List[int]] = {}
+
+    def ask(self, model: str, messages: List[Dict]) -> Optional[str]:
+        """Majority answer of one n-sample request; its agreement is left in last_confidence."""
+        self.last_confidence = None
+        self.calls += 1
+        try:
+            with span("api", model=model, samples=self.samples):
+                response = self.client.chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    temperature=self.temperature,
+                    n=self.samples,
+                )
+        except Exception:
+            self.errors += 1
+            raise
+        answer, confidence = vote([choice.message.content for choice in response.choices], self.key)
+        if answer is not None:
+            self.last_confidence = confidence
+            self.confidences.append(confidence)
+        return answer
+
+    def record(self, correct: bool):
+        """Score the last answer, so the summary can show accuracy per agreement level (calibration)."""
+        if self.last_confidence is not None:
+            bucket = self.scored.setdefault(round(self.last_confidence, 2), [0, 0])
+            bucket[0] += bool(correct)
+            bucket[1] += 1
+
+    def summary(self) -> List[str]:
+        lines = [f"Self-consistency: {self.samples} samples per call at temperature {self.temperature:g}, "
+                 f"{self.calls} calls, {self.errors} errors"]
+        if not self.confidences:
+            return lines
+        counts = Counter(round(c, 2) for c in self.confidences)
+        lines.append(f"   mean agreement {sum(self.confidences) / len(self.confidences):.2f}, "
+                     f"unanimous {counts.get(1.0, 0)}/{len(self.confidences)}")
+        lines.append(f"   {'agreement':>10} {'answers':>8} {'accuracy':>9}")
+        for level in sorted(counts, reverse=True):
+            correct, scored = self.scored.get(level, (0, 0))
+            accuracy = f"{correct / scored * 100:8.2f}%" if scored else f"{'-':>9}"
+            lines.append(f"   {level:>10.2f} {counts[level]:>8} {accuracy}")
+        return lines
+
+
+def add_vote_arguments(parser):
+    group = parser.add_argument_group('self-consistency voting')
+    group.add_argument('--samples', type=int, default=1,
+                       help='Ask for this many samples in one request and keep the majority answer, '
+                            'writing its agreement to MISC as a confidence (default: 1 = off)')
+    group.add_argument('--temperature', type=float, default=0.7,
+                       help='Sampling temperature when --samples > 1 (default: 0.7)')
+
+
+def make_voter(args, client, key: Callable[[str], str] = first_word) -> Optional[Voter]:
+    """A Voter when --samples > 1 (also in dry runs, where client is None and only .samples is used)."""
+    if getattr(args, 'samples', 1) <= 1:
+        return None
+    return Voter(client, args.samples, args.temperature, key)
@@ -1,67 +1,240 @@
 #!/usr/bin/env python3
 
-import openai
+from __future__ import annotations
+
 import logging
 import sys
 import os
 import argparse
 import time
 import json
-from stanza.utils.conll import CoNLL
-from typing import List, Dict
+import numpy as np
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    import openai
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.sentence import Sentence, load_sentences
+from common.estimate import add_estimate_arguments, make_estimator
+from common.tracing import add_trace_argument, setup_tracing, span, traced
+from common.usage import TrackedClient
+from common.voting import add_vote_arguments, make_voter
+from common.router import add_router_arguments, first_word, make_router
+from common.dedup import add_dedup_arguments, plan_dedup_sentences
+
+router = None
+estimator = None
+voter = None
+
+# Expected answer length in tokens, for dry-run estimates.
+ANSWER_TOKENS = 3
+from common.mst import DECODERS
+
+# Score for heads the model did not propose; the small distance term breaks ties toward nearby heads.
+UNSEEN_HEAD_LOGPROB = -10.0
+DISTANCE_PENALTY = 0.01
+
+# Static first, so calls share a cacheable prefix: instructions, then the sentence, then the token.
+INSTRUCTIONS = (
+    "You find which word a given word modifies in a sentence, according to CoNLL guidelines. "
+    "Respond with only the word it modifies. If it's the root, reply 'root'."
+)
+INDEXED_INSTRUCTIONS = (
+    "You find which token a given token modifies in a numbered sentence, according to CoNLL guidelines. "
+    "Respond with only its number, or 0 if it is the root."
+)
 
 def setup_args():
     parser = argparse.ArgumentParser(description='Query OpenAI API with prompts')
     parser.add_argument('--live_run', action='store_true', 
-                       help='If set, actually send requests to OpenAI. Otherwise, just print prompts')
+                       help='If set, actually send requests to OpenAI. Otherwise, estimate the cost of the run')
     parser.add_argument('--output_file', 
                        help='File to save responses (required for live run)')
     parser.add_argument('input_file', help='Input CoNLL file path')
+    parser.add_argument('--decode', choices=sorted(DECODERS),
+                       help='Ask for head indices with log-probabilities and decode a tree: '
+                            'cle (Chu-Liu/Edmonds, non-projective) or eisner (projective)')
+    parser.add_argument('--top_k', type=int, default=5,
+                       help='Head candidates per token to read from the log-probabilities in --decode mode')
+    add_router_arguments(parser, "arcs")
+    add_dedup_arguments(parser)
+    add_vote_arguments(parser)
+    add_trace_argument(parser)
+    add_estimate_arguments(parser)
     args = parser.parse_args()
     
     # Check if output_file is provided when doing a live run
     if args.live_run and not args.output_file:
         parser.error("--output_file is required when using --live_run")
+    if args.route and args.samples > 1:
+        parser.error("--samples cannot be combined with --route")
+    if args.decode and args.route:
+        parser.error("--decode cannot be combined with --route")
+    if args.decode and args.samples > 1:
+        parser.error("--samples cannot be combined with --decode")
     
     return args
 
-def send_to_openai(prompt: str, client: openai.OpenAI, live_run: bool) -> str:
+def send_to_openai(prompt: str, client: openai.OpenAI, live_run: bool, sentence: str = None,
+                   instructions: str = INSTRUCTIONS) -> str:
     """Send prompt to OpenAI API or simulate it."""
+    if live_run and router is not None:
+        return router.ask(prompt, sentence)
+    if live_run and voter is not None:
+        try:
+            return voter.ask("gpt-4o-mini", [{"role": "system", "content": instructions},
+                                             {"role": "user", "content": prompt}])
+        except Exception as e:
+            logger.error(f"Error calling OpenAI API: {e}")
+            return None
     if live_run:
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0
-            )
+            with span("api", model="gpt-4o-mini"):
+                response = client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[{"role": "system", "content": instructions},
+                              {"role": "user", "content": prompt}],
+                    temperature=0
+                )
             return response.choices[0].message.content.strip()
         except Exception as e:
             logger.error(f"Error calling OpenAI API: {e}")
             return None
     else:
-        # Just print what would be sent
-        print("\n=== PROMPT THAT WOULD BE SENT ===")
-        print(prompt)
-        print("=== END PROMPT ===\n")
+        # Just count what would be sent
+        estimator.add_prompt("gpt-4o-mini", prompt, ANSWER_TOKENS * (voter.samples if voter else 1), instructions)
         return None
 
-def load_conll_file(file_path: str) -> List[List[Dict]]:
+@traced("load")
+def load_conll_file(file_path: str) -> List[Sentence]:
     """Load sentences from a CoNLL file."""
-    doc = CoNLL.conll2dict(input_file=file_path)
-    return [sentence for doc_sentences in doc for sentence in doc_sentences]
+    return load_sentences(file_path)
 
 
 def query_chatgpt(sentence: List[Dict], focus_token: Dict, client: openai.OpenAI, live_run: bool) -> str:
     """Send a request to ChatGPT asking about token dependencies without explicit indexing."""
     sentence_text = " ".join(token['text'] for token in sentence)
-    prompt = (
-        f"Given the sentence '{sentence_text}', "
-        f"according to CoNLL guidelines, which word does '{focus_token['text']}' modify? "
-        "Respond with only the word it modifies. If it's the root, reply 'root'."
-    )
-    return send_to_openai(prompt, client, live_run)
+    with span("prompt"):
+        prompt = (
+            f"Sentence: '{sentence_text}'\n\n"
+            f"Which word does '{focus_token['text']}' modify?"
+        )
+    return send_to_openai(prompt, client, live_run, sentence_text)
+
+
+
+def send_with_logprobs(prompt: str, client: openai.OpenAI, live_run: bool, top_k: int) -> Tuple[Optional[str], List]:
+    """Like send_to_openai, but also returns the top-k alternatives for the first answer token."""
+    if not live_run:
+        send_to_openai(prompt, client, live_run, instructions=INDEXED_INSTRUCTIONS)
+        return None, []
+    try:
+        with span("api", model="gpt-4o-mini"):
+            response = client.chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{"role": "system", "content": INDEXED_INSTRUCTIONS},
+                          {"role": "user", "content": prompt}],
+                temperature=0,
+                max_tokens=3,
+                logprobs=True,
+                top_logprobs=top_k
+            )
+        choice = response.choices[0]
+        content = choice.logprobs.content if choice.logprobs else None
+        top = [(alt.token, alt.logprob) for alt in content[0].top_logprobs] if content else []
+        return choice.message.content.strip(), top
+    except Exception as e:
+        logger.error(f"Error calling OpenAI API: {e}")
+        return None, []
 
 
+def query_chatgpt_indexed(sentence: List[Dict], position: int, client: openai.OpenAI, live_run: bool,
+                          top_k: int) -> Tuple[Optional[str], Dict[int, float]]:
+    """Ask for the head of token `position` (1-based) by index; returns the answer and {head id: logprob}."""
+    numbered = " ".join(f"{i}:{token['text']}" for i, token in enumerate(sentence, 1))
+    with span("prompt"):
+        prompt = (
+            f"Tokens: {numbered}\n\n"
+            f"Which token does token {position} ('{sentence[position - 1]['text']}') modify?"
+        )
+    answer, top = send_with_logprobs(prompt, client, live_run, top_k)
+
+    candidates = {}
+    for token, logprob in top:
+        token = token.strip()
+        if token.isdigit() and int(token) <= len(sentence) and int(token) != position:
+            head = int(token)
+            candidates[head] = max(logprob, candidates.get(head, -np.inf))
+    if not candidates and answer and answer.split()[0].isdigit():
+        head = int(answer.split()[0])
+        if head <= len(sentence) and head != position:
+            candidates[head] = 0.0
+    return answer, candidates
+
+
+def score_matrix(candidates: List[Dict[int, float]]) -> np.ndarray:
+    """(n+1) x (n+1) matrix with scores[h, d] = log-probability of head h for token d."""
+    n = len(candidates)
+    ids = np.arange(n + 1)
+    scores = UNSEEN_HEAD_LOGPROB - DISTANCE_PENALTY * np.abs(ids[:, None] - ids[None, :])
+    for d, token_candidates in enumerate(candidates, 1):
+        for h, logprob in token_candidates.items():
+            scores[h, d] = logprob
+    return scores
+
+
+def head_word(sentence: List[Dict], head: int) -> str:
+    return sentence[head - 1]['text'] if head > 0 else 'root'
+
+
+def decode_sentences(sentences: List[List[Dict]], client: openai.OpenAI, live_run: bool,
+                     decoder: str, top_k: int) -> List[List[Dict]]:
+    """Score every head candidate per token, then decode one tree per sentence."""
+    decode = DECODERS[decoder]
+    correct = correct_raw = correct_words = total = 0
+    not_trees = 0
+
+    for sentence in sentences:
+        candidates = []
+        for position in range(1, len(sentence) + 1):
+            _, token_candidates = query_chatgpt_indexed(sentence, position, client, live_run, top_k)
+            candidates.append(token_candidates)
+            if live_run:
+                with span("rate_limit"):
+                    time.sleep(0.5)  # Rate limit
+        if not live_run:
+            continue
+
+        scores = score_matrix(candidates)
+        raw = scores.argmax(axis=0)
+        with span("decode", decoder=decoder):
+            heads = decode(scores)
+        if any(raw[1:] != heads[1:]):
+            not_trees += 1
+
+        for d, token in enumerate(sentence, 1):
+            gold_head_idx = token.head
+            gold_head_word = head_word(sentence, gold_head_idx)
+            prediction = head_word(sentence, int(heads[d]))
+            token['chatgpt_head'] = prediction
+            token['chatgpt_head_id'] = int(heads[d])
+
+            correct += heads[d] == gold_head_idx
+            correct_raw += raw[d] == gold_head_idx
+            correct_words += prediction == gold_head_word
+            total += 1
+
+            logger.info(f"Token: {token['text']} | Gold: {gold_head_word} | ChatGPT: {prediction}")
+
+    if live_run and total > 0:
+        logger.info(f"Accuracy: {correct_words / total * 100:.2f}%")
+        logger.info(f"UAS by index: {correct / total * 100:.2f}% decoded ({decoder}), "
+                    f"{correct_raw / total * 100:.2f}% per-token argmax")
+        logger.info(f"Sentences whose per-token argmax was not a tree: {not_trees}/{len(sentences)}")
+
+    return sentences
+
 
 def evaluate_sentences(sentences: List[List[Dict]], client: openai.OpenAI, live_run: bool) -> List[List[Dict]]:
     """Evaluate each token using ChatGPT and calculate accuracy."""
@@ -70,46 +243,66 @@ def evaluate_sentences(sentences: List[List[Dict]], client: openai.OpenAI, live_
 
     for sentence in sentences:
         for token in sentence:
-            gold_head_idx = token['head'][0] if isinstance(token['head'], tuple) else token['head']
+            gold_head_idx = token.head
             gold_head_word = sentence[gold_head_idx - 1]['text'] if gold_head_idx > 0 else 'root'
 
             chatgpt_prediction = query_chatgpt(sentence, token, client, live_run)
             token['chatgpt_head'] = chatgpt_prediction if chatgpt_prediction else "None"
+            if voter is not None and voter.last_confidence is not None:
+                token['chatgpt_head_conf'] = voter.last_confidence
 
             if live_run and chatgpt_prediction:
+                if voter is not None:
+                    voter.record(chatgpt_prediction == gold_head_word)
+                if router is not None:
+                    router.record(chatgpt_prediction == gold_head_word)
                 if chatgpt_prediction == gold_head_word:
                     correct += 1
                 total += 1
 
                 logger.info(f"Token: {token['text']} | Gold: {gold_head_word} | ChatGPT: {chatgpt_prediction}")
 
-                time.sleep(0.5)  # Rate limit
+                with span("rate_limit"):
+                    time.sleep(0.5)  # Rate limit
 
     if live_run and total > 0:
         accuracy = correct / total * 100
         logger.info(f"Accuracy: {accuracy:.2f}%")
 
+    if router is not None:
+        for line in router.summary():
+            logger.info(line)
+    if live_run and voter is not None:
+        for line in voter.summary():
+            logger.info(line)
+
     return sentences
 
 
+@traced("save")
 def save_results(sentences: List[List[Dict]], output_path: str):
     """Save sentences to a CoNLL-formatted file, including ChatGPT predictions."""
     with open(output_path, 'w') as f:
         for sentence in sentences:
             for token in sentence:
                 conll_line = [
-                    str(token['id'][0]), token['text'], token.get('Lemma', '_'), token.get('upos', '_'),
+                    str(token.id), token['text'], token.get('Lemma', '_'), token.get('upos', '_'),
                     token.get('xpos', '_'), '_',
-                    str(token['head'][0]) if isinstance(token['head'], tuple) else str(token['head']),
+                    str(token.head),
                     token.get('deprel', '_'), '_', f"ChatGPTHead={token['chatgpt_head']}"
                 ]
+                if 'chatgpt_head_conf' in token:
+                    conll_line[-1] += f"|ChatGPTHeadConf={token['chatgpt_head_conf']:.2f}"
+                if 'chatgpt_head_id' in token:
+                    conll_line[-1] += f"|ChatGPTHeadId={token['chatgpt_head_id']}"
                 f.write('\t'.join(conll_line) + '\n')
             f.write('\n')
 
 
 def main():
-    global logger
+    global logger, router, estimator, voter
     args = setup_args()
+    setup_tracing(args.trace)
 
     logging.basicConfig(
         level=logging.INFO,
@@ -124,18 +317,36 @@ def main():
         if not api_key:
             logger.error("Error: Please set the OPENAI_API_KEY environment variable")
             sys.exit(1)
-        client = openai.OpenAI(api_key=api_key)
+        import openai
+        client = TrackedClient(openai.OpenAI(api_key=api_key))
+        router = make_router(args, client, "arcs", INSTRUCTIONS)
 
     if args.live_run:
         logger.info(f"Running in LIVE mode - will send requests to OpenAI and save to {args.output_file}")
     else:
-        logger.info("Running in DRY RUN mode - will only print prompts")
+        estimator = make_estimator(args, pause_s=0.5)
+        logger.info("Running in DRY RUN mode - will only estimate the cost of the run")
 
-    sentences = load_conll_file(args.input_file)
-    evaluated_sentences = evaluate_sentences(sentences, client, args.live_run)
+    voter = make_voter(args, client, first_word)
+    all_sentences = load_conll_file(args.input_file)
+    dedup = plan_dedup_sentences(all_sentences, args)
+    if dedup is not None:
+        logger.info(dedup.summary(args.dedup_project, unit="per-token calls"))
+    sentences = dedup.representatives(all_sentences) if dedup is not None else all_sentences
+    if args.decode:
+        evaluated_sentences = decode_sentences(sentences, client, args.live_run, args.decode, args.top_k)
+    else:
+        evaluated_sentences = evaluate_sentences(sentences, client, args.live_run)
 
     if args.live_run:
+        if dedup is not None:
+            evaluated_sentences = dedup.project(all_sentences, args.dedup_project)
         save_results(evaluated_sentences, args.output_file)
+        for line in client.usage.summary():
+            logger.info(line)
+    else:
+        for line in estimator.summary():
+            logger.info(line)
 
 
 
@@ -1,22 +1,48 @@
 #!/usr/bin/env python3
 
-import openai
+from __future__ import annotations
+
 import logging
 import sys
 import os
 import argparse
 import time
 import json
-from stanza.utils.conll import CoNLL
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict
+
+if TYPE_CHECKING:
+    import openai
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.sentence import Sentence, load_sentences
+from common.estimate import add_estimate_arguments, make_estimator
+from common.tracing import add_trace_argument, setup_tracing, span, traced
+from common.usage import TrackedClient
+from common.voting import add_vote_arguments, make_voter
+from common.router import first_word
+
+estimator = None
+voter = None
+
+# Expected answer length in tokens, for dry-run estimates.
+ANSWER_TOKENS = 3
+
+# Static first, so calls share a cacheable prefix: instructions, then the sentence, then the token.
+INSTRUCTIONS = (
+    "You find which word a given word modifies in a sentence. Respond with only the word it modifies. "
+    "If it doesn't modify any word and is the root, just reply 'root'."
+)
 
 def setup_args():
     parser = argparse.ArgumentParser(description='Query OpenAI API with prompts')
     parser.add_argument('--live_run', action='store_true', 
-                       help='If set, actually send requests to OpenAI. Otherwise, just print prompts')
+                       help='If set, actually send requests to OpenAI. Otherwise, estimate the cost of the run')
     parser.add_argument('--output_file', 
                        help='File to save responses (required for live run)')
     parser.add_argument('input_file', help='Input CoNLL file path')
+    add_vote_arguments(parser)
+    add_trace_argument(parser)
+    add_estimate_arguments(parser)
     args = parser.parse_args()
     
     # Check if output_file is provided when doing a live run
@@ -27,40 +53,48 @@ def setup_args():
 
 def send_to_openai(prompt: str, client: openai.OpenAI, live_run: bool) -> str:
     """Send prompt to OpenAI API or simulate it."""
+    if live_run and voter is not None:
+        try:
+            return voter.ask("gpt-4o-mini", [{"role": "system", "content": INSTRUCTIONS},
+                                             {"role": "user", "content": prompt}])
+        except Exception as e:
+            logger.error(f"Error calling OpenAI API: {e}")
+            return None
     if live_run:
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0
-            )
+            with span("api", model="gpt-4o-mini"):
+                response = client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[{"role": "system", "content": INSTRUCTIONS},
+                              {"role": "user", "content": prompt}],
+                    temperature=0
+                )
             print(response.choices[0].message.content.strip())
             return response.choices[0].message.content.strip()
         except Exception as e:
             logger.error(f"Error calling OpenAI API: {e}")
             return None
     else:
-        # Just print what would be sent
-        print("\n=== PROMPT THAT WOULD BE SENT ===")
-        print(prompt)
-        print("=== END PROMPT ===\n")
+        # Just count what would be sent
+        estimator.add_prompt("gpt-4o-mini", prompt, ANSWER_TOKENS * (voter.samples if voter else 1), INSTRUCTIONS)
         return None
 
-def load_conll_file(file_path: str) -> List[List[Dict]]:
+@traced("load")
+def load_conll_file(file_path: str) -> List[Sentence]:
     """Load sentences from a CoNLL file."""
-    doc = CoNLL.conll2dict(input_file=file_path)
-    return [sentence for doc_sentences in doc for sentence in doc_sentences]
+    return load_sentences(file_path)
 
 
 def query_chatgpt(sentence: List[Dict], focus_token: Dict, client: openai.OpenAI, live_run: bool) -> str:
     """Ask ChatGPT which word a specific token modifies, using natural language style."""
     sentence_text = " ".join(token['text'] for token in sentence)
-    prompt = (
-        f"What word does the word '{focus_token['text']}' modify in the sentence "
-        f"'{sentence_text}'? Respond with only the word it modifies. "
-        "If it doesn't modify any word and is the root, just reply 'root'."
-    )
-    print(prompt)
+    with span("prompt"):
+        prompt = (
+            f"Sentence: '{sentence_text}'\n\n"
+            f"What word does the word '{focus_token['text']}' modify?"
+        )
+    if live_run:
+        print(prompt)
     return send_to_openai(prompt, client, live_run)
 
 
@@ -71,13 +105,17 @@ def evaluate_sentences(sentences: List[List[Dict]], client: openai.OpenAI, live_
 
     for sentence in sentences:
         for token in sentence:
-            gold_head_idx = token['head'][0] if isinstance(token['head'], tuple) else token['head']
+            gold_head_idx = token.head
             gold_head_word = sentence[gold_head_idx - 1]['text'] if gold_head_idx > 0 else 'root'
 
             chatgpt_prediction = query_chatgpt(sentence, token, client, live_run)
             token['chatgpt_head'] = chatgpt_prediction if chatgpt_prediction else "None"
+            if voter is not None and voter.last_confidence is not None:
+                token['chatgpt_head_conf'] = voter.last_confidence
 
             if live_run and chatgpt_prediction:
+                if voter is not None:
+                    voter.record(chatgpt_prediction == gold_head_word)
                 if chatgpt_prediction == gold_head_word:
                     correct += 1
                 total += 1
@@ -85,33 +123,42 @@ def evaluate_sentences(sentences: List[List[Dict]], client: openai.OpenAI, live_
                 logger.info(f"Token: {token['text']} | Gold: {gold_head_word} | ChatGPT: {chatgpt_prediction}")
                 logger.info(f"Correct: {correct} | Total: {total} | Accuracy: {(correct/total)*100:.2f}%")
 
-                time.sleep(0.5)  # Rate limit
+                with span("rate_limit"):
+                    time.sleep(0.5)  # Rate limit
 
     if live_run and total > 0:
         accuracy = correct / total * 100
         logger.info(f"Accuracy: {accuracy:.2f}%")
 
+    if live_run and voter is not None:
+        for line in voter.summary():
+            logger.info(line)
+
     return sentences
 
 
+@traced("save")
 def save_results(sentences: List[List[Dict]], output_path: str):
     """Save sentences to a CoNLL-formatted file, including ChatGPT predictions."""
     with open(output_path, 'w') as f:
         for sentence in sentences:
             for token in sentence:
                 conll_line = [
-                    str(token['id'][0]), token['text'], token.get('Lemma', '_'), token.get('upos', '_'),
+                    str(token.id), token['text'], token.get('Lemma', '_'), token.get('upos', '_'),
                     token.get('xpos', '_'), '_',
-                    str(token['head'][0]) if isinstance(token['head'], tuple) else str(token['head']),
+                    str(token.head),
                     token.get('deprel', '_'), '_', f"ChatGPTHead={token['chatgpt_head']}"
                 ]
+                if 'chatgpt_head_conf' in token:
+                    conll_line[-1] += f"|ChatGPTHeadConf={token['chatgpt_head_conf']:.2f}"
                 f.write('\t'.join(conll_line) + '\n')
             f.write('\n')
 
 
 def main():
-    global logger
+    global logger, estimator, voter
     args = setup_args()
+    setup_tracing(args.trace)
 
     logging.basicConfig(
         level=logging.INFO,
@@ -126,18 +173,26 @@ def main():
         if not api_key:
             logger.error("Error: Please set the OPENAI_API_KEY environment variable")
             sys.exit(1)
-        client = openai.OpenAI(api_key=api_key)
+        import openai
+        client = TrackedClient(openai.OpenAI(api_key=api_key))
 
     if args.live_run:
         logger.info(f"Running in LIVE mode - will send requests to OpenAI and save to {args.output_file}")
     else:
-        logger.info("Running in DRY RUN mode - will only print prompts")
+        estimator = make_estimator(args, pause_s=0.5)
+        logger.info("Running in DRY RUN mode - will only estimate the cost of the run")
 
+    voter = make_voter(args, client, first_word)
     sentences = load_conll_file(args.input_file)
     evaluated_sentences = evaluate_sentences(sentences, client, args.live_run)
 
     if args.live_run:
         save_results(evaluated_sentences, args.output_file)
+        for line in client.usage.summary():
+            logger.info(line)
+    else:
+        for line in estimator.summary():
+            logger.info(line)
 
 
 
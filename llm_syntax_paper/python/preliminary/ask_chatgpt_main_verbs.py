@@ -1,49 +1,66 @@
 #!/usr/bin/env python3
 
-import openai
+from __future__ import annotations
+
 import logging
 import sys
 import os
 import argparse
 import time
-from stanza.utils.conll import CoNLL
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict
+
+if TYPE_CHECKING:
+    import openai
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.estimate import add_estimate_arguments, make_estimator
+from common.tracing import add_trace_argument, setup_tracing, span, traced
+from common.usage import TrackedClient
+
+estimator = None
+
+# Expected answer length in tokens (free text), for dry-run estimates.
+ANSWER_TOKENS = 15
 
 def setup_args():
     parser = argparse.ArgumentParser(description='Query OpenAI API for main verbs')
     parser.add_argument('--live_run', action='store_true', 
                         help='Actually send requests to OpenAI')
     parser.add_argument('input_file', help='Input CoNLL file path')
+    add_trace_argument(parser)
+    add_estimate_arguments(parser)
     return parser.parse_args()
 
 def send_to_openai(prompt: str, client: openai.OpenAI, live_run: bool) -> str:
     if live_run:
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0
-            )
+            with span("api", model="gpt-4o-mini"):
+                response = client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0
+                )
             return response.choices[0].message.content.strip()
         except Exception as e:
             logger.error(f"OpenAI API error: {e}")
             return None
     else:
-        print("\n=== PROMPT ===")
-        print(prompt)
-        print("=== END PROMPT ===\n")
+        estimator.add_prompt("gpt-4o-mini", prompt, ANSWER_TOKENS)
         return None
 
+@traced("load")
 def load_conll_file(file_path: str) -> List[List[Dict]]:
+    from stanza.utils.conll import CoNLL
     doc = CoNLL.conll2dict(input_file=file_path)
     # return [sentence for doc_sentences in doc for sentence in doc_sentences]
     return doc[0]
 def identify_main_verbs(sentence: List[Dict], client: openai.OpenAI, live_run: bool):
     sentence_text = " ".join(token['text'] for token in sentence)
-    prompt = (
-        f"In the sentence: '{sentence_text}', identify the main verb or verbs. "
-        "Only list the main verbs, nothing else."
-    )
+    with span("prompt"):
+        prompt = (
+            f"In the sentence: '{sentence_text}', identify the main verb or verbs. "
+            "Only list the main verbs, nothing else."
+        )
     response = send_to_openai(prompt, client, live_run)
     if live_run and response:
         print("\n=== PROMPT ===")
@@ -53,8 +70,9 @@ def identify_main_verbs(sentence: List[Dict], client: openai.OpenAI, live_run: b
         print("=== END ===\n")
 
 def main():
-    global logger
+    global logger, estimator
     args = setup_args()
+    setup_tracing(args.trace)
 
     logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[logging.StreamHandler(sys.stdout)])
     logger = logging.getLogger(__name__)
@@ -65,12 +83,24 @@ def main():
         if not api_key:
             logger.error("Error: OPENAI_API_KEY not set")
             sys.exit(1)
-        client = openai.OpenAI(api_key=api_key)
+        import openai
+        client = TrackedClient(openai.OpenAI(api_key=api_key))
+    else:
+        estimator = make_estimator(args, pause_s=0.5)
 
     sentences = load_conll_file(args.input_file)
     for sentence in sentences:
         identify_main_verbs(sentence, client, args.live_run)
-        time.sleep(0.5)
+        if args.live_run:
+            with span("rate_limit"):
+                time.sleep(0.5)
+
+    if args.live_run:
+        for line in client.usage.summary():
+            logger.info(line)
+    else:
+        for line in estimator.summary():
+            logger.info(line)
 
 if __name__ == "__main__":
     main()
@@ -1,42 +1,97 @@
 #!/usr/bin/env python3
 
-import openai
 import argparse
+import json
 import os
 import logging
 import sys
 import time
-from stanza.utils.conll import CoNLL
 from collections import Counter
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.estimate import add_estimate_arguments, make_estimator
+from common.router import add_router_arguments, make_router
+from common.streaming import StreamingParser
+from common.tracing import add_trace_argument, setup_tracing, span, traced
+from common.usage import TrackedClient
+from common.tokens import count_message_tokens, count_tokens
+from common.ud import UPOS_TAGS, validate_tokens
+
+PARSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "tokens": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "integer"},
+                    "form": {"type": "string"},
+                    "lemma": {"type": "string"},
+                    "upos": {"type": "string", "enum": UPOS_TAGS},
+                    "head": {"type": "integer"},
+                    "deprel": {"type": "string"},
+                },
+                "required": ["id", "form", "lemma", "upos", "head", "deprel"],
+                "additionalProperties": False,
+            },
+        },
+    },
+    "required": ["tokens"],
+    "additionalProperties": False,
+}
+
+estimator = None
+streamer = None
+router = None
+
 def setup_args():
     parser = argparse.ArgumentParser(description='Send sentences to ChatGPT for zero-shot dependency parsing.')
     parser.add_argument('--live_run', action='store_true', help='Actually send requests to OpenAI')
     parser.add_argument('--output_file', help='Where to save the CoNLL-U outputs')
     parser.add_argument('--gold_file', required=True, help='Gold standard .conllu file (used for both input and evaluation)')
+    parser.add_argument('--structured', action='store_true',
+                        help='Ask for typed per-token JSON records (structured outputs) and repair invalid tokens locally')
+    parser.add_argument('--max_repairs', type=int, default=2,
+                        help='Structured mode: repair rounds per sentence before giving up')
+    parser.add_argument('--repair_max_fraction', type=float, default=0.3,
+                        help='Structured mode: re-parse the whole sentence instead of repairing when more than this fraction of tokens is invalid')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream the answer, check each CoNLL-U line as it arrives and cancel the request '
+                             'as soon as the parse cannot be used')
+    add_router_arguments(parser, "conllu")
+    add_trace_argument(parser)
+    add_estimate_arguments(parser)
     args = parser.parse_args()
 
     if args.live_run and not args.output_file:
         parser.error("--output_file is required in live mode")
+    if args.stream and args.structured:
+        parser.error("--stream applies to the plain CoNLL-U prompt, not --structured")
+    if args.route and (args.stream or args.structured):
+        parser.error("--route applies to the plain CoNLL-U prompt, without --stream or --structured")
     return args
 
+@traced("load")
 def load_conll_sentences(path):
+    from stanza.utils.conll import CoNLL
     docs = CoNLL.conll2dict(input_file=path)
     return docs[0]
 
 def format_as_text(sentence):
     return " ".join(tok["text"] for tok in sentence)
 
-def send_to_chatgpt(prompt, client, live):
+def send_to_chatgpt(prompt, client, live, answer_tokens=0):
     if not live:
-        print("\n=== PROMPT ===\n", prompt, "\n=== END PROMPT ===\n")
+        estimator.add_prompt("gpt-4o", prompt, answer_tokens)
         return None
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0
-        )
+        with span("api", model="gpt-4o"):
+            response = client.chat.completions.create(
+                model="gpt-4o",
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0
+            )
         return response.choices[0].message.content.strip()
     except Exception as e:
         logging.error(f"OpenAI API error: {e}")
@@ -44,13 +99,143 @@ def send_to_chatgpt(prompt, client, live):
 
 def query_chatgpt_parse(sentence, client, live):
     text = format_as_text(sentence)
-    prompt = (
-        "You are a syntactic parser. Output only the dependency parse of the sentence below in valid CoNLL-U format.\n"
-        "Do not include any explanations, headers, or formatting (such as triple backticks). Just return the CoNLL-U lines.\n\n"
-        f"Sentence: {text}"
+    with span("prompt"):
+        prompt = (
+            "You are a syntactic parser. Output only the dependency parse of the sentence below in valid CoNLL-U format.\n"
+            "Do not include any explanations, headers, or formatting (such as triple backticks). Just return the CoNLL-U lines.\n\n"
+            f"Sentence: {text}"
+        )
+    words = gold_words(sentence)
+    if live and router is not None:
+        return router.ask(prompt, len(words))
+    if live and streamer is not None:
+        return streamer.ask([{"role": "user", "content": prompt}], len(words), count_tokens(expected_answer(words)))
+    answer_tokens = 0 if live else count_tokens(expected_answer(words))
+    return send_to_chatgpt(prompt, client, live, answer_tokens)
+
+def gold_words(sentence):
+    return [tok for tok in sentence if '-' not in str(tok['id']) and '.' not in str(tok['id'])
+            and not (isinstance(tok['id'], tuple) and len(tok['id']) > 1)]
+
+def expected_answer(words, structured=False):
+    """The gold parse written the way the model is asked to answer, to size completions in dry runs."""
+    if structured:
+        return json.dumps({"tokens": [
+            {"id": i, "form": tok['text'], "lemma": tok.get('lemma', tok['text']), "upos": tok.get('upos', 'X'),
+             "head": tok.get('head', 0), "deprel": tok.get('deprel', 'dep')} for i, tok in enumerate(words, 1)]})
+    return "\n".join(f"{i}\t{tok['text']}\t{tok.get('lemma', '_')}\t{tok.get('upos', '_')}\t{tok.get('xpos', '_')}"
+                     f"\t{tok.get('feats', '_')}\t{tok.get('head', 0)}\t{tok.get('deprel', '_')}\t_\t_"
+                     for i, tok in enumerate(words, 1))
+
+def send_structured(messages, client):
+    """One structured-output request; returns (content, tokens used)."""
+    try:
+        with span("api", model="gpt-4o"):
+            response = client.chat.completions.create(
+                model="gpt-4o",
+                messages=messages,
+                temperature=0,
+                response_format={
+                    "type": "json_schema",
+                    "json_schema": {"name": "dependency_parse", "strict": True, "schema": PARSE_SCHEMA},
+                },
+            )
+        content = response.choices[0].message.content or ""
+        usage = getattr(response, "usage", None)
+        used = usage.total_tokens if usage else count_message_tokens(messages, "gpt-4o") + count_tokens(content)
+        return content, used
+    except Exception as e:
+        logging.error(f"OpenAI API error: {e}")
+        return "", 0
+
+def parse_records(content, n_tokens, only=None):
+    """Token id -> record from a structured answer; ids outside the sentence (or `only`) are dropped."""
+    try:
+        records = json.loads(content).get("tokens", [])
+    except (json.JSONDecodeError, AttributeError):
+        return {}
+    parsed = {}
+    for record in records if isinstance(records, list) else []:
+        token_id = record.get("id") if isinstance(record, dict) else None
+        if isinstance(token_id, int) and 1 <= token_id <= n_tokens and (only is None or token_id in only):
+            parsed.setdefault(token_id, record)
+    return parsed
+
+def structured_prompt(words):
+    numbered = " ".join(f"{i}:{tok['text']}" for i, tok in enumerate(words, 1))
+    return (
+        "You are a syntactic parser. Give the Universal Dependencies parse of the sentence below, "
+        "one record per token, using exactly the numbered tokens given.\n"
+        "head is the id of the token's syntactic head (0 for the root); deprel is a UD relation, "
+        "optionally with a subtype (e.g. nmod:poss).\n\n"
+        f"Sentence: {format_as_text(words)}\n"
+        f"Tokens: {numbered}"
+    )
+
+def repair_prompt(words, records, problems):
+    lines = []
+    for i, tok in enumerate(words, 1):
+        r = records.get(i, {})
+        lines.append(f"{i}\t{tok['text']}\t{r.get('upos', '?')}\t{r.get('head', '?')}\t{r.get('deprel', '?')}")
+    issues = "\n".join(f"  {i}: {'; '.join(msgs)}" for i, msgs in sorted(problems.items()))
+    ids = ", ".join(str(i) for i in sorted(problems))
+    return (
+        "Here is a Universal Dependencies parse of the sentence below, one token per line as id, form, upos, head, deprel.\n"
+        f"Sentence: {format_as_text(words)}\n\n" + "\n".join(lines) + "\n\n"
+        f"These tokens are invalid:\n{issues}\n\n"
+        f"Return corrected records for only tokens {ids}, keeping the rest of the parse fixed."
     )
-    return send_to_chatgpt(prompt, client, live)
 
+def records_to_conllu(words, records, stats):
+    lines = [f"# repairs = {stats['repairs']}", f"# tokens_used = {stats['tokens_used']}"]
+    for i, tok in enumerate(words, 1):
+        r = records[i]
+        lines.append(f"{i}\t{tok['text']}\t{r.get('lemma') or '_'}\t{r['upos']}\t_\t_\t{r['head']}\t{r['deprel']}\t_\t_")
+    return "\n".join(lines)
+
+def query_chatgpt_structured(sentence, client, live, max_repairs=2, repair_max_fraction=0.3):
+    """Structured parse with local validation and partial repair.
+
+    Returns (CoNLL-U block or None, stats) where stats counts the tokens used,
+    repair rounds and full re-parses for this sentence.
+    """
+    words = gold_words(sentence)
+    n = len(words)
+    with span("prompt"):
+        prompt = structured_prompt(words)
+    stats = {"tokens_used": 0, "repairs": 0, "reparses": 0, "valid": False}
+    if not live:
+        # Repair rounds depend on the answers, so only the first request is counted.
+        estimator.add_prompt("gpt-4o", prompt, count_tokens(expected_answer(words, structured=True)))
+        return None, stats
+
+    for attempt in range(2):
+        if attempt:
+            stats["reparses"] += 1
+        content, used = send_structured([{"role": "user", "content": prompt}], client)
+        stats["tokens_used"] += used
+        records = parse_records(content, n)
+        problems = validate_tokens(records, n)
+
+        rounds = 0
+        while problems and len(problems) <= max(1, repair_max_fraction * n) and rounds < max_repairs:
+            logging.info(f"🔧 Repairing {len(problems)}/{n} tokens: {sorted(problems)}")
+            with span("prompt"):
+                fix = repair_prompt(words, records, problems)
+            content, used = send_structured([{"role": "user", "content": fix}], client)
+            stats["tokens_used"] += used
+            stats["repairs"] += 1
+            rounds += 1
+            records.update(parse_records(content, n, only=set(problems)))
+            problems = validate_tokens(records, n)
+
+        if not problems:
+            stats["valid"] = True
+            return records_to_conllu(words, records, stats), stats
+        logging.warning(f"⚠️  {len(problems)}/{n} tokens still invalid after {rounds} repair(s)")
+    return None, stats
+
+@traced("evaluate")
 def evaluate_conllu(gold_sentences, pred_blocks):
     """Evaluate predicted parses against gold standard."""
     correct_heads = 0
@@ -111,7 +296,9 @@ def evaluate_conllu(gold_sentences, pred_blocks):
     }
 
 def main():
+    global estimator, streamer, router
     args = setup_args()
+    setup_tracing(args.trace)
     logging.basicConfig(level=logging.INFO)
 
     client = None
@@ -120,27 +307,60 @@ def main():
         if not api_key:
             logging.error("Please set the OPENAI_API_KEY environment variable.")
             sys.exit(1)
-        client = openai.OpenAI(api_key=api_key)
+        import openai
+        client = TrackedClient(openai.OpenAI(api_key=api_key))
+        if args.stream:
+            streamer = StreamingParser(client)
+        router = make_router(args, client, "conllu")
+    else:
+        estimator = make_estimator(args, pause_s=1.0)
 
     sentences = load_conll_sentences(args.gold_file)
     logging.info(f"Loaded {len(sentences)} sentences.")
 
     results = []
+    structured_stats = []
     for i, sentence in enumerate(sentences):
-        logging.info(f"→ Sentence {i+1}: {format_as_text(sentence)}")
-        response = query_chatgpt_parse(sentence, client, args.live_run)
+        if args.live_run or args.show_prompts:
+            logging.info(f"→ Sentence {i+1}: {format_as_text(sentence)}")
+        if args.structured:
+            response, stats = query_chatgpt_structured(sentence, client, args.live_run,
+                                                       args.max_repairs, args.repair_max_fraction)
+            structured_stats.append(stats)
+        else:
+            response = query_chatgpt_parse(sentence, client, args.live_run)
         if response:
             results.append(response)
             logging.info("✅ Got response.")
-            time.sleep(1.0)  # Rate limit safety
+            with span("rate_limit"):
+                time.sleep(1.0)  # Rate limit safety
         else:
             results.append("# FAILED TO PARSE\n")
 
     if args.live_run:
-        with open(args.output_file, "w") as f:
+        with span("save"), open(args.output_file, "w") as f:
             for block in results:
                 f.write(block.strip() + "\n\n")
         logging.info(f"Saved results to {args.output_file}")
+        for line in client.usage.summary():
+            logging.info(line)
+        if streamer is not None:
+            for line in streamer.summary():
+                logging.info(line)
+        if router is not None:
+            for line in router.summary():
+                logging.info(line)
+    else:
+        for line in estimator.summary():
+            logging.info(line)
+
+    if args.structured and args.live_run:
+        valid = sum(st["valid"] for st in structured_stats)
+        spent = sum(st["tokens_used"] for st in structured_stats)
+        logging.info(f"Structured: {valid}/{len(structured_stats)} valid sentences, "
+                     f"{sum(st['repairs'] for st in structured_stats)} repair rounds, "
+                     f"{sum(st['reparses'] for st in structured_stats)} full re-parses")
+        logging.info(f"Tokens per valid sentence: {spent / valid if valid else 0:.1f} ({spent} total)")
 
     # Always evaluate
     metrics = evaluate_conllu(sentences, results)
@@ -1,50 +1,85 @@
 #!/usr/bin/env python3
 
-import openai
+from __future__ import annotations
+
 import logging
 import sys
 import os
 import argparse
 import time
 import json
-from stanza.utils.conll import CoNLL
-from typing import List, Dict
+from typing import TYPE_CHECKING, List, Dict
+
+if TYPE_CHECKING:
+    import openai
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.sentence import Sentence, load_sentences
+from common.estimate import add_estimate_arguments, make_estimator
+from common.tracing import add_trace_argument, setup_tracing, span, traced
+from common.usage import TrackedClient
+from common.voting import add_vote_arguments, make_voter
+from common.router import add_router_arguments, first_word, make_router
+from common.dedup import add_dedup_arguments, plan_dedup_sentences
+
+router = None
+estimator = None
+voter = None
+
+# Expected answer length in tokens, for dry-run estimates.
+ANSWER_TOKENS = 3
 
 def setup_args():
     parser = argparse.ArgumentParser(description='Ask ChatGPT for CoNLL dependency labels')
     parser.add_argument('--live_run', action='store_true', 
-                       help='If set, actually send requests to OpenAI. Otherwise, just print prompts')
+                       help='If set, actually send requests to OpenAI. Otherwise, estimate the cost of the run')
     parser.add_argument('--output_file', 
                        help='File to save responses (required for live run)')
     parser.add_argument('input_file', help='Input CoNLL file path')
+    add_router_arguments(parser, "rels")
+    add_dedup_arguments(parser)
+    add_vote_arguments(parser)
+    add_trace_argument(parser)
+    add_estimate_arguments(parser)
     args = parser.parse_args()
     
     if args.live_run and not args.output_file:
         parser.error("--output_file is required when using --live_run")
+    if args.route and args.samples > 1:
+        parser.error("--samples cannot be combined with --route")
     
     return args
 
-def send_to_openai(prompt: str, client: openai.OpenAI, live_run: bool) -> str:
+def send_to_openai(prompt: str, client: openai.OpenAI, live_run: bool, sentence: str = None) -> str:
+    if live_run and router is not None:
+        return router.ask(prompt, sentence)
+    if live_run and voter is not None:
+        try:
+            return voter.ask("gpt-4o-mini", [{"role": "system", "content": INSTRUCTIONS},
+                                             {"role": "user", "content": prompt}])
+        except Exception as e:
+            logger.error(f"Error calling OpenAI API: {e}")
+            return None
     if live_run:
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0
-            )
+            with span("api", model="gpt-4o-mini"):
+                response = client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[{"role": "system", "content": INSTRUCTIONS},
+                              {"role": "user", "content": prompt}],
+                    temperature=0
+                )
             return response.choices[0].message.content.strip()
         except Exception as e:
             logger.error(f"Error calling OpenAI API: {e}")
             return None
     else:
-        print("\n=== PROMPT THAT WOULD BE SENT ===")
-        print(prompt)
-        print("=== END PROMPT ===\n")
+        estimator.add_prompt("gpt-4o-mini", prompt, ANSWER_TOKENS * (voter.samples if voter else 1), INSTRUCTIONS)
         return None
 
-def load_conll_file(file_path: str) -> List[List[Dict]]:
-    doc = CoNLL.conll2dict(input_file=file_path)
-    return [sentence for doc_sentences in doc for sentence in doc_sentences]
+@traced("load")
+def load_conll_file(file_path: str) -> List[Sentence]:
+    return load_sentences(file_path)
 
 COMMON_CONLL_LABELS = [
     "nsubj", "obj", "iobj", "csubj", "ccomp", "xcomp", "obl", "vocative", "expl",
@@ -53,26 +88,31 @@ COMMON_CONLL_LABELS = [
     "flat", "compound", "list", "parataxis", "orphan", "goeswith", "reparandum", "punct", "root"
 ]
 
+# Static first, so calls share a cacheable prefix: instructions, then the sentence, then the token.
+INSTRUCTIONS = (
+    "You label dependency relations. For a sentence and a word that modifies another word, give the most "
+    "appropriate dependency label for the relation between them according to the Universal Dependencies "
+    "(CoNLL-U) scheme.\n\n"
+    f"Choose one of the following labels:\n{', '.join(COMMON_CONLL_LABELS)}\n\n"
+    "Respond with only the label (e.g., 'nsubj')."
+)
+
 def query_chatgpt_deprel(sentence: List[Dict], focus_token: Dict, client: openai.OpenAI, live_run: bool) -> str:
     sentence_text = " ".join(token['text'] for token in sentence)
 
     # Get the head index and head word
-    head_idx = focus_token['head'][0] if isinstance(focus_token['head'], tuple) else focus_token['head']
+    head_idx = focus_token.head
     if head_idx == 0:
         head_word = "root"
     else:
         head_word = sentence[head_idx - 1]['text']
 
-    options_str = ", ".join(COMMON_CONLL_LABELS)
-
-    prompt = (
-        f"Given the sentence:\n\n'{sentence_text}'\n\n"
-        f"The word '{focus_token['text']}' modifies '{head_word}'.\n"
-        f"According to the Universal Dependencies (CoNLL-U) scheme, what is the most appropriate dependency label "
-        f"that describes the relation between them?\n\n"
-        f"Choose one of the following labels:\n{options_str}\n\n"
-        f"Respond with only the label (e.g., 'nsubj')."
-    )
+    with span("prompt"):
+        prompt = (
+            f"Sentence: '{sentence_text}'\n\n"
+            f"The word '{focus_token['text']}' modifies '{head_word}'. "
+            f"What is the label of the relation between them?"
+        )
 
     return send_to_openai(prompt, client, live_run)
 
@@ -85,15 +125,22 @@ def evaluate_sentences(sentences: List[List[Dict]], client: openai.OpenAI, live_
             gold_label = token.get('deprel', '_')
             chatgpt_prediction = query_chatgpt_deprel(sentence, token, client, live_run)
             token['chatgpt_deprel'] = chatgpt_prediction if chatgpt_prediction else "None"
+            if voter is not None and voter.last_confidence is not None:
+                token['chatgpt_deprel_conf'] = voter.last_confidence
 
             if live_run and chatgpt_prediction:
+                if voter is not None:
+                    voter.record(chatgpt_prediction.lower() == gold_label.lower())
+                if router is not None:
+                    router.record(chatgpt_prediction.lower() == gold_label.lower())
                 if chatgpt_prediction.lower() == gold_label.lower():
                     correct += 1
                 total += 1
 
                 logger.info(f"Token: {token['text']} | Head: {token['head']} | Gold Label: {gold_label} | ChatGPT: {chatgpt_prediction}")
 
-                time.sleep(0.5)
+                with span("rate_limit"):
+                    time.sleep(0.5)
 
     if live_run:
         if total > 0:
@@ -102,25 +149,36 @@ def evaluate_sentences(sentences: List[List[Dict]], client: openai.OpenAI, live_
         else:
             logger.info("No tokens evaluated, total is 0.")
 
+    if router is not None:
+        for line in router.summary():
+            logger.info(line)
+    if live_run and voter is not None:
+        for line in voter.summary():
+            logger.info(line)
+
     return sentences
 
+@traced("save")
 def save_results(sentences: List[List[Dict]], output_path: str):
     with open(output_path, 'w') as f:
         for sentence in sentences:
             for token in sentence:
-                token_id = token['id'][0] if isinstance(token['id'], tuple) else token['id']
-                head_id = token['head'][0] if isinstance(token['head'], tuple) else token['head']
+                token_id = token.id
+                head_id = token.head
                 conll_line = [
                     str(token_id), token['text'], token.get('Lemma', '_'), token.get('upos', '_'),
                     token.get('xpos', '_'), '_', str(head_id),
                     token.get('deprel', '_'), '_', f"ChatGPTDeprel={token['chatgpt_deprel']}"
                 ]
+                if 'chatgpt_deprel_conf' in token:
+                    conll_line[-1] += f"|ChatGPTDeprelConf={token['chatgpt_deprel_conf']:.2f}"
                 f.write('\t'.join(conll_line) + '\n')
             f.write('\n')
 
 def main():
-    global logger
+    global logger, router, estimator, voter
     args = setup_args()
+    setup_tracing(args.trace)
 
     logging.basicConfig(
         level=logging.INFO,
@@ -135,18 +193,33 @@ def main():
         if not api_key:
             logger.error("Error: Please set the OPENAI_API_KEY environment variable")
             sys.exit(1)
-        client = openai.OpenAI(api_key=api_key)
+        import openai
+        client = TrackedClient(openai.OpenAI(api_key=api_key))
+        router = make_router(args, client, "rels", INSTRUCTIONS)
 
     if args.live_run:
         logger.info(f"Running in LIVE mode - will send requests to OpenAI and save to {args.output_file}")
     else:
-        logger.info("Running in DRY RUN mode - will only print prompts")
-
-    sentences = load_conll_file(args.input_file)
+        estimator = make_estimator(args, pause_s=0.5)
+        logger.info("Running in DRY RUN mode - will only estimate the cost of the run")
+
+    voter = make_voter(args, client, lambda answer: first_word(answer).lower())
+    all_sentences = load_conll_file(args.input_file)
+    dedup = plan_dedup_sentences(all_sentences, args)
+    if dedup is not None:
+        logger.info(dedup.summary(args.dedup_project, unit="per-token calls"))
+    sentences = dedup.representatives(all_sentences) if dedup is not None else all_sentences
     evaluated_sentences = evaluate_sentences(sentences, client, args.live_run)
 
     if args.live_run:
+        if dedup is not None:
+            evaluated_sentences = dedup.project(all_sentences, args.dedup_project)
         save_results(evaluated_sentences, args.output_file)
+        for line in client.usage.summary():
+            logger.info(line)
+    else:
+        for line in estimator.summary():
+            logger.info(line)
 
 if __name__ == "__main__":
     main()
@@ -1,59 +1,114 @@
 #!/usr/bin/env python3
 #!/usr/bin/env python3
 
-import openai
+from __future__ import annotations
+
 import logging
 import sys
 import os
 import argparse
 import time
 import json
-from stanza.utils.conll import CoNLL
-from typing import List, Dict
+from collections import Counter
+from typing import TYPE_CHECKING, List, Dict, Optional
+
+if TYPE_CHECKING:
+    import openai
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.sentence import Sentence, load_sentences
+from common.estimate import add_estimate_arguments, make_estimator
+from common.tracing import add_trace_argument, setup_tracing, span, traced
+from common.usage import TrackedClient
+from common.voting import add_vote_arguments, make_voter
+from common.router import add_router_arguments, first_word, make_router
+from common.dedup import add_dedup_arguments, plan_dedup_sentences
+
+router = None
+estimator = None
+voter = None
+
+# Expected answer length in tokens, for dry-run estimates.
+ANSWER_TOKENS = 2
+
+# Static first, so calls share a cacheable prefix: instructions, then the sentence, then the token.
+INSTRUCTIONS = (
+    "You tag words with their part of speech according to the Universal POS tags used in the CoNLL guidelines. "
+    "Respond with the UPOS tag only (e.g., NOUN, VERB, ADJ, etc)."
+)
 
 def setup_args():
     parser = argparse.ArgumentParser(description='Query OpenAI API with prompts')
     parser.add_argument('--live_run', action='store_true', 
-                       help='If set, actually send requests to OpenAI. Otherwise, just print prompts')
+                       help='If set, actually send requests to OpenAI. Otherwise, estimate the cost of the run')
     parser.add_argument('--output_file', 
                        help='File to save responses (required for live run)')
     parser.add_argument('input_file', help='Input CoNLL file path')
+    parser.add_argument('--cascade', action='store_true',
+                       help='Tag with Stanza first and only ask ChatGPT about tokens whose tag is risky')
+    parser.add_argument('--cascade_threshold', type=float, default=0.3,
+                       help='Cascade: send tokens with risk >= this value to ChatGPT (default: 0.3)')
+    parser.add_argument('--replay_thresholds', '--report_thresholds', default='',
+                       help='Cascade: also report accuracy and calls at these comma-separated thresholds, e.g. '
+                            '0.05,0.1,0.2,0.5. Costs extra: every token at or above the lowest of them is sent '
+                            'to ChatGPT, not only those above --cascade_threshold')
+    parser.add_argument('--lexicon_file',
+                       help='Cascade: CoNLL-U file for the word/UPOS ambiguity statistics. Defaults to input_file, '
+                            'whose gold tags then leak into the risk scores; give a separate file for evaluations')
+    parser.add_argument('--lang', default='en', help='Cascade: Stanza language (default: en)')
+    add_router_arguments(parser, "tags")
+    add_dedup_arguments(parser)
+    add_vote_arguments(parser)
+    add_trace_argument(parser)
+    add_estimate_arguments(parser)
     args = parser.parse_args()
     
     if args.live_run and not args.output_file:
         parser.error("--output_file is required when using --live_run")
+    if args.route and args.samples > 1:
+        parser.error("--samples cannot be combined with --route")
+    args.replay_thresholds = sorted(float(t) for t in args.replay_thresholds.split(',') if t.strip())
     
     return args
 
-def send_to_openai(prompt: str, client: openai.OpenAI, live_run: bool) -> str:
+def send_to_openai(prompt: str, client: openai.OpenAI, live_run: bool, sentence: str = None) -> str:
+    if live_run and router is not None:
+        return router.ask(prompt, sentence)
+    if live_run and voter is not None:
+        try:
+            return voter.ask("gpt-4o-mini", [{"role": "system", "content": INSTRUCTIONS},
+                                             {"role": "user", "content": prompt}])
+        except Exception as e:
+            logger.error(f"Error calling OpenAI API: {e}")
+            return None
     if live_run:
         try:
-            response = client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0
-            )
+            with span("api", model="gpt-4o-mini"):
+                response = client.chat.completions.create(
+                    model="gpt-4o-mini",
+                    messages=[{"role": "system", "content": INSTRUCTIONS},
+                              {"role": "user", "content": prompt}],
+                    temperature=0
+                )
             return response.choices[0].message.content.strip()
         except Exception as e:
             logger.error(f"Error calling OpenAI API: {e}")
             return None
     else:
-        print("\n=== PROMPT THAT WOULD BE SENT ===")
-        print(prompt)
-        print("=== END PROMPT ===\n")
+        estimator.add_prompt("gpt-4o-mini", prompt, ANSWER_TOKENS * (voter.samples if voter else 1), INSTRUCTIONS)
         return None
 
-def load_conll_file(file_path: str) -> List[List[Dict]]:
-    doc = CoNLL.conll2dict(input_file=file_path)
-    return [sentence for doc_sentences in doc for sentence in doc_sentences]
+@traced("load")
+def load_conll_file(file_path: str) -> List[Sentence]:
+    return load_sentences(file_path)
 
 def query_chatgpt_pos(sentence: List[Dict], focus_token: Dict, client: openai.OpenAI, live_run: bool) -> str:
     sentence_text = " ".join(token['text'] for token in sentence)
-    prompt = (
-        f"In the sentence '{sentence_text}', what is the part of speech of the word '{focus_token['text']}' "
-        "according to the Universal POS tags used in the CoNLL guidelines? "
-        "Respond with the UPOS tag only (e.g., NOUN, VERB, ADJ, etc)."
-    )
+    with span("prompt"):
+        prompt = (
+            f"Sentence: '{sentence_text}'\n\n"
+            f"What is the part of speech of the word '{focus_token['text']}'?"
+        )
     return send_to_openai(prompt, client, live_run)
 
 def evaluate_sentences(sentences: List[List[Dict]], client: openai.OpenAI, live_run: bool) -> List[List[Dict]]:
@@ -65,15 +120,22 @@ def evaluate_sentences(sentences: List[List[Dict]], client: openai.OpenAI, live_
             gold_upos = token.get('upos', '_')
             chatgpt_prediction = query_chatgpt_pos(sentence, token, client, live_run)
             token['chatgpt_upos'] = chatgpt_prediction if chatgpt_prediction else "None"
+            if voter is not None and voter.last_confidence is not None:
+                token['chatgpt_upos_conf'] = voter.last_confidence
 
             if live_run and chatgpt_prediction:
+                if voter is not None:
+                    voter.record(chatgpt_prediction.upper() == gold_upos.upper())
+                if router is not None:
+                    router.record(chatgpt_prediction.upper() == gold_upos.upper())
                 if chatgpt_prediction.upper() == gold_upos.upper():
                     correct += 1
                 total += 1
 
                 logger.info(f"Token: {token['text']} | Gold UPOS: {gold_upos} | ChatGPT: {chatgpt_prediction}")
 
-                time.sleep(0.5)
+                with span("rate_limit"):
+                    time.sleep(0.5)
 
     if live_run:
         if total > 0:
@@ -82,25 +144,132 @@ def evaluate_sentences(sentences: List[List[Dict]], client: openai.OpenAI, live_
         else:
             logger.info("No tokens evaluated, total is 0.")
 
+    if router is not None:
+        for line in router.summary():
+            logger.info(line)
+    if live_run and voter is not None:
+        for line in voter.summary():
+            logger.info(line)
+
+    return sentences
+
+@traced("lexicon")
+def build_lexicon(sentences: List[List[Dict]]) -> Dict[str, Counter]:
+    """Lowercased word form -> UPOS counts."""
+    lexicon = {}
+    for sentence in sentences:
+        for token in sentence:
+            lexicon.setdefault(token['text'].lower(), Counter())[token.get('upos', '_')] += 1
+    return lexicon
+
+def tag_risk(form: str, tag: Optional[str], lexicon: Dict[str, Counter]) -> float:
+    """1 - P(tag | form) from the lexicon, with one extra pseudo-count so rare words stay risky."""
+    counts = lexicon.get(form.lower())
+    if not counts or tag is None:
+        return 1.0
+    return 1.0 - counts[tag] / (sum(counts.values()) + 1)
+
+def tag_locally(sentences: List[List[Dict]], lang: str) -> List[List[Optional[str]]]:
+    """Stanza UPOS tags over the gold tokenization (None where the alignment fails)."""
+    import stanza
+    with span("stanza_setup"):
+        stanza.download(lang, processors='tokenize,pos')
+        nlp = stanza.Pipeline(lang=lang, processors='tokenize,pos', tokenize_pretokenized=True)
+    with span("stanza"):
+        doc = nlp([[token['text'] for token in sentence] for sentence in sentences])
+    tags = []
+    for sentence, tagged in zip(sentences, doc.sentences):
+        if len(tagged.words) == len(sentence):
+            tags.append([word.upos for word in tagged.words])
+        else:
+            tags.append([None] * len(sentence))
+    return tags
+
+def cascade_sentences(sentences: List[List[Dict]], client: openai.OpenAI, live_run: bool, threshold: float,
+                      replay_thresholds: List[float], lexicon: Dict[str, Counter], lang: str) -> List[List[Dict]]:
+    """Accept confident Stanza tags locally and ask ChatGPT about tokens at or above threshold.
+
+    With replay thresholds, tokens at or above the lowest of them are queried
+    too, so accuracy and call counts can be replayed for each from one run.
+    """
+    query_from = min(replay_thresholds + [threshold])
+    local_tags = tag_locally(sentences, lang)
+
+    scored = []  # (risk, gold, stanza tag, chatgpt tag or None)
+    for sentence, stanza_tags in zip(sentences, local_tags):
+        for token, stanza_upos in zip(sentence, stanza_tags):
+            gold_upos = token.get('upos', '_')
+            risk = tag_risk(token['text'], stanza_upos, lexicon)
+            chatgpt_prediction = None
+            if risk >= query_from:
+                chatgpt_prediction = query_chatgpt_pos(sentence, token, client, live_run)
+                if live_run and chatgpt_prediction:
+                    if voter is not None:
+                        voter.record(chatgpt_prediction.upper() == gold_upos.upper())
+                    if router is not None:
+                        router.record(chatgpt_prediction.upper() == gold_upos.upper())
+                if live_run:
+                    with span("rate_limit"):
+                        time.sleep(0.5)
+
+            use_chatgpt = risk >= threshold and chatgpt_prediction
+            prediction = chatgpt_prediction if use_chatgpt else (stanza_upos or chatgpt_prediction or "None")
+            token['chatgpt_upos'] = prediction
+            token['tag_source'] = "chatgpt" if use_chatgpt else "stanza"
+            if use_chatgpt and voter is not None and voter.last_confidence is not None:
+                token['chatgpt_upos_conf'] = voter.last_confidence
+            scored.append((risk, gold_upos, stanza_upos, chatgpt_prediction))
+
+            if live_run:
+                logger.info(f"Token: {token['text']} | Gold UPOS: {gold_upos} | ChatGPT: {prediction}")
+
+    total = len(scored)
+    if not total:
+        logger.info("No tokens evaluated, total is 0.")
+        return sentences
+
+    logger.info(f"\nCascade: {sum(r >= query_from for r, *_ in scored)}/{total} tokens sent to ChatGPT")
+    if live_run:
+        logger.info(f"{'threshold':>10} {'calls':>7} {'calls %':>8} {'accuracy':>9}")
+        for t in [float('inf')] + sorted(set(replay_thresholds + [threshold]), reverse=True):
+            calls = correct = 0
+            for risk, gold, stanza_upos, chatgpt in scored:
+                pred = chatgpt if risk >= t and chatgpt else stanza_upos
+                calls += risk >= t
+                correct += bool(pred) and pred.upper() == gold.upper()
+            label = "stanza" if t == float('inf') else f"{t:.2f}"
+            logger.info(f"{label:>10} {calls:7d} {calls / total * 100:7.1f}% {correct / total * 100:8.2f}%")
+        if router is not None:
+            for line in router.summary():
+                logger.info(line)
+        if voter is not None:
+            for line in voter.summary():
+                logger.info(line)
     return sentences
 
+@traced("save")
 def save_results(sentences: List[List[Dict]], output_path: str):
     with open(output_path, 'w') as f:
         for sentence in sentences:
             for token in sentence:
-                token_id = token['id'][0] if isinstance(token['id'], tuple) else token['id']
-                head_id = token['head'][0] if isinstance(token['head'], tuple) else token['head']
+                token_id = token.id
+                head_id = token.head
                 conll_line = [
                     str(token_id), token['text'], token.get('Lemma', '_'), token.get('upos', '_'),
                     token.get('xpos', '_'), '_', str(head_id),
                     token.get('deprel', '_'), '_', f"ChatGPTUPOS={token['chatgpt_upos']}"
                 ]
+                if 'chatgpt_upos_conf' in token:
+                    conll_line[-1] += f"|ChatGPTUPOSConf={token['chatgpt_upos_conf']:.2f}"
+                if 'tag_source' in token:
+                    conll_line[-1] += f"|TagSource={token['tag_source']}"
                 f.write('\t'.join(conll_line) + '\n')
             f.write('\n')
 
 def main():
-    global logger
+    global logger, router, estimator, voter
     args = setup_args()
+    setup_tracing(args.trace)
 
     logging.basicConfig(
         level=logging.INFO,
@@ -115,18 +284,41 @@ def main():
         if not api_key:
             logger.error("Error: Please set the OPENAI_API_KEY environment variable")
             sys.exit(1)
-        client = openai.OpenAI(api_key=api_key)
+        import openai
+        client = TrackedClient(openai.OpenAI(api_key=api_key))
+        router = make_router(args, client, "tags", INSTRUCTIONS)
 
     if args.live_run:
         logger.info(f"Running in LIVE mode - will send requests to OpenAI and save to {args.output_file}")
     else:
-        logger.info("Running in DRY RUN mode - will only print prompts")
+        estimator = make_estimator(args, pause_s=0.5)
+        logger.info("Running in DRY RUN mode - will only estimate the cost of the run")
 
-    sentences = load_conll_file(args.input_file)
-    evaluated_sentences = evaluate_sentences(sentences, client, args.live_run)
+    voter = make_voter(args, client, lambda answer: first_word(answer).upper())
+    all_sentences = load_conll_file(args.input_file)
+    dedup = plan_dedup_sentences(all_sentences, args)
+    if dedup is not None:
+        logger.info(dedup.summary(args.dedup_project, unit="per-token calls"))
+    sentences = dedup.representatives(all_sentences) if dedup is not None else all_sentences
+    if args.cascade:
+        if not args.lexicon_file:
+            logger.warning("⚠️  No --lexicon_file: the tag risk is estimated from the gold UPOS of the input itself, "
+                           "so the cascade accuracy is optimistic; use a separate file for reported numbers")
+        lexicon = build_lexicon(load_conll_file(args.lexicon_file) if args.lexicon_file else all_sentences)
+        evaluated_sentences = cascade_sentences(sentences, client, args.live_run, args.cascade_threshold,
+                                                args.replay_thresholds, lexicon, args.lang)
+    else:
+        evaluated_sentences = evaluate_sentences(sentences, client, args.live_run)
 
     if args.live_run:
+        if dedup is not None:
+            evaluated_sentences = dedup.project(all_sentences, args.dedup_project)
         save_results(evaluated_sentences, args.output_file)
+        for line in client.usage.summary():
+            logger.info(line)
+    else:
+        for line in estimator.summary():
+            logger.info(line)
 
 if __name__ == "__main__":
     main()
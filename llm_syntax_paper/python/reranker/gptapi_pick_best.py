@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+
+from __future__ import annotations
+
+import json
+import re
+import argparse
+import logging
+import os
+import sys
+from typing import TYPE_CHECKING, List, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.router import add_router_arguments, make_router
+from common.tracing import add_trace_argument, setup_tracing, span, traced
+from common.usage import TrackedClient
+from common.pipelines import add_pipeline_arguments, make_pipeline_pool, parse_stream
+from common.tokens import count_message_tokens
+from parse_encodings import ENCODING_NAMES, FORMAT_DESCRIPTIONS, encode_parse, rows_from_stanza
+from risk_gate import ATTACHMENT_SITE_UPOS, load_spacy, phrase_word_ids, spacy_parse
+
+SYSTEM_PROMPT = "You are a linguist helping to analyze syntactic dependency parses."
+
+router = None
+
+
+def setup_args():
+    parser = argparse.ArgumentParser(description='Build several candidate parses per sentence and ask ChatGPT to pick the best one')
+    parser.add_argument('input_file', help='Input JSON file with sentence examples')
+    parser.add_argument('--output_file', help='If set, will call OpenAI and write the chosen parses (CoNLL-U) to this file')
+    parser.add_argument('--results_file', help='Optional JSONL file with per-example candidate and choice details')
+    parser.add_argument('--oneshot_file', help='ask_chatgpt_oneshot.py output to add as a candidate source')
+    parser.add_argument('--spacy_model', help='spaCy model to add as a candidate source, e.g. en_core_web_sm')
+    parser.add_argument('--encoding', choices=ENCODING_NAMES, default='compact',
+                        help='Parse serialization used for each candidate (default: compact)')
+    parser.add_argument('--no_flips', action='store_true',
+                        help='Do not add attachment-flipped variants of the ambiguous phrase')
+    add_router_arguments(parser, "pick")
+    add_pipeline_arguments(parser)
+    add_trace_argument(parser)
+    return parser.parse_args()
+
+
+def tree_key(rows: List[Dict]) -> Tuple:
+    """Tree identity over a fixed tokenization: the (head, deprel) of every token."""
+    return tuple((r["head"], r["deprel"]) for r in rows)
+
+
+def load_oneshot_parses(path: str) -> Dict[str, List[Dict]]:
+    """Map space-joined token forms to parsed rows from an ask_chatgpt_oneshot.py output file."""
+    parses = {}
+    with open(path) as f:
+        blocks = f.read().split("\n\n")
+    for block in blocks:
+        rows = []
+        for line in block.strip().splitlines():
+            parts = line.split('\t')
+            if line.startswith('#') or len(parts) != 10 or not parts[0].isdigit() or not parts[6].isdigit():
+                continue
+            rows.append({"id": int(parts[0]), "text": parts[1], "lemma": parts[2], "upos": parts[3],
+                         "xpos": parts[4], "head": int(parts[6]), "deprel": parts[7]})
+        if rows:
+            parses[" ".join(r["text"] for r in rows)] = rows
+    return parses
+
+
+def descendants(rows: List[Dict], node_id: int) -> set:
+    children = {}
+    for r in rows:
+        children.setdefault(r["head"], []).append(r["id"])
+    seen, stack = set(), [node_id]
+    while stack:
+        for child in children.get(stack.pop(), []):
+            if child not in seen:
+                seen.add(child)
+                stack.append(child)
+    return seen
+
+
+def phrase_head_id(rows: List[Dict], phrase_ids: List[int]) -> Optional[int]:
+    id_set = set(phrase_ids)
+    return next((r["id"] for r in rows if r["id"] in id_set and r["head"] not in id_set), None)
+
+
+def flipped_variants(rows: List[Dict], phrase_ids: List[int]) -> List[List[Dict]]:
+    """Reattach the ambiguous phrase to every other plausible site before it."""
+    head_id = phrase_head_id(rows, phrase_ids)
+    if head_id is None or not phrase_ids:
+        return []
+    current = rows[head_id - 1]["head"]
+    below = descendants(rows, head_id)
+    variants = []
+    for site in rows:
+        if (site["id"] >= min(phrase_ids) or site["id"] == current or site["id"] in below
+                or site["upos"] not in ATTACHMENT_SITE_UPOS):
+            continue
+        variant = [dict(r) for r in rows]
+        variant[head_id - 1]["head"] = site["id"]
+        variant[head_id - 1]["deprel"] = "obl" if site["upos"] == "VERB" else "nmod"
+        variants.append(variant)
+    return variants
+
+
+def build_candidates(stanza_rows: List[Dict], phrase_ids: List[int], spacy_result=None,
+                     oneshot_rows=None, flips: bool = True) -> List[Tuple[List[Dict], List[str]]]:
+    """Collect (rows, sources) candidates, merging parses that are the same tree."""
+    raw = [("stanza", stanza_rows)]
+    if spacy_result is not None:
+        heads, deps = spacy_result
+        raw.append(("spacy", [dict(r, head=h, deprel=d) for r, h, d in zip(stanza_rows, heads, deps)]))
+    if oneshot_rows is not None and all(0 <= o["head"] <= len(stanza_rows) for o in oneshot_rows):
+        raw.append(("oneshot", [dict(r, head=o["head"], deprel=o["deprel"]) for r, o in zip(stanza_rows, oneshot_rows)]))
+    if flips:
+        raw.extend(("flip", v) for v in flipped_variants(stanza_rows, phrase_ids))
+
+    candidates, index = [], {}
+    for source, rows in raw:
+        key = tree_key(rows)
+        if key in index:
+            candidates[index[key]][1].append(source)
+        else:
+            index[key] = len(candidates)
+            candidates.append((rows, [source]))
+    return candidates
+
+
+@traced("prompt")
+def build_prompt(candidates: List[Tuple[List[Dict], List[str]]], text: str, phrase: str, encoding: str) -> str:
+    # Instructions first and the phrase last, so the fixed part is a shared prompt prefix.
+    parts = [
+        f"Here are candidate dependency parses of the same sentence, each {FORMAT_DESCRIPTIONS[encoding]}, "
+        "followed by a phrase.\n"
+        "Paying particular attention to the attachment of that phrase, which candidate is the best analysis? "
+        "Respond with only its number.\n"
+    ]
+    for n, (rows, _) in enumerate(candidates, 1):
+        parts.append(f"Candidate {n}:\n{encode_parse(rows, text, encoding)}\n")
+    parts.append(f"Phrase: \"{phrase}\"")
+    return "\n".join(parts)
+
+
+def parse_choice(answer: str, n_candidates: int) -> Optional[int]:
+    match = re.search(r"\d+", answer or "")
+    if not match:
+        return None
+    choice = int(match.group())
+    return choice if 1 <= choice <= n_candidates else None
+
+
+def get_chatgpt_choice(client: OpenAI, prompt: str, n_candidates: int) -> str:
+    if router is not None:
+        return router.ask(prompt, n_candidates) or "error"
+    try:
+        with span("api", model="gpt-4"):
+            response = client.chat.completions.create(
+                model="gpt-4",
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0,
+            )
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        logging.error(f"OpenAI API error: {e}")
+        return "error"
+
+
+def attachment_word(rows: List[Dict], phrase_ids: List[int]) -> Optional[str]:
+    head_id = phrase_head_id(rows, phrase_ids)
+    if head_id is None:
+        return None
+    attached = rows[head_id - 1]["head"]
+    return rows[attached - 1]["text"] if attached > 0 else None
+
+
+def write_conllu(f, rows: List[Dict], text: str, n: int, sources: List[str]):
+    f.write(f"# text = {text}\n")
+    f.write(f"# chosen_candidate = {n}\n")
+    f.write(f"# candidate_sources = {'+'.join(sources)}\n")
+    for r in rows:
+        f.write(f"{r['id']}\t{r['text']}\t{r['lemma']}\t{r['upos']}\t{r['xpos']}\t_\t{r['head']}\t{r['deprel']}\t_\t_\n")
+    f.write("\n")
+
+
+def main():
+    global router
+    args = setup_args()
+    setup_tracing(args.trace)
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+    logger = logging.getLogger(__name__)
+
+    with span("load"), open(args.input_file) as f:
+        examples = json.load(f)
+    oneshot = load_oneshot_parses(args.oneshot_file) if args.oneshot_file else {}
+
+    pool = make_pipeline_pool(args)
+    nlp_spacy = load_spacy(args.spacy_model)
+
+    use_live_api = args.output_file is not None
+    client = None
+    if use_live_api:
+        from openai import OpenAI
+        client = TrackedClient(OpenAI())
+        router = make_router(args, client, "pick", SYSTEM_PROMPT)
+
+    results = []
+    chosen_parses = []
+    parsed = parse_stream(pool, examples, lambda example: example.get("lang", args.lang),
+                          lambda example: example["sentence"], args.parse_batch_size)
+    for i, (example, sentences) in enumerate(parsed, 1):
+        sentence = sentences[0]
+        stanza_rows = rows_from_stanza(sentence)
+        phrase_ids = phrase_word_ids(sentence.words, example["ambiguous_phrase"], example["sentence"])
+
+        with span("candidates"):
+            spacy_result = spacy_parse(nlp_spacy, sentence.words) if nlp_spacy else None
+            oneshot_rows = oneshot.get(" ".join(r["text"] for r in stanza_rows))
+            candidates = build_candidates(stanza_rows, phrase_ids, spacy_result, oneshot_rows, not args.no_flips)
+
+        prompt = build_prompt(candidates, example["sentence"], example["ambiguous_phrase"], args.encoding)
+        prompt_tokens = count_message_tokens(
+            [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], "gpt-4")
+
+        asked = False
+        if len(candidates) == 1:
+            answer, choice = "only candidate", 1
+        elif use_live_api:
+            answer = get_chatgpt_choice(client, prompt, len(candidates))
+            choice = parse_choice(answer, len(candidates))
+            asked = True
+        else:
+            logger.info(f"\nExample {i} (DRY RUN, {len(candidates)} candidates, {prompt_tokens} prompt tokens)")
+            logger.info("\n----- Prompt to ChatGPT -----\n")
+            logger.info(prompt)
+            logger.info("\n-----------------------------\n")
+            answer, choice = "dry run", 1
+
+        if choice is None:
+            logger.warning(f"⚠️  Example {i}: unusable answer {answer!r}, keeping the Stanza parse")
+            choice = 1
+        rows, sources = candidates[choice - 1]
+        chosen_parses.append((rows, example["sentence"], choice, sources))
+
+        expected = example["correct_attachment"]
+        stanza_head = attachment_word(stanza_rows, phrase_ids)
+        chosen_head = attachment_word(rows, phrase_ids)
+        if asked and router is not None:
+            router.record(bool(chosen_head and chosen_head.lower() == expected.lower()))
+        results.append({
+            "index": i,
+            "sentence": example["sentence"],
+            "ambiguous_phrase": example["ambiguous_phrase"],
+            "expected_head": expected,
+            "stanza_head": stanza_head,
+            "chosen_head": chosen_head,
+            "stanza_correct": bool(stanza_head and stanza_head.lower() == expected.lower()),
+            "chosen_correct": bool(chosen_head and chosen_head.lower() == expected.lower()),
+            "n_candidates": len(candidates),
+            "candidate_sources": [s for _, s in candidates],
+            "chosen_sources": sources,
+            "chatgpt_response": answer,
+            "prompt_tokens": prompt_tokens
+        })
+        logger.info(f"Example {i}: {len(candidates)} candidates → chose {choice} ({'+'.join(sources)}), "
+                    f"attachment '{chosen_head}', expected '{expected}'")
+
+    total = len(results)
+    if total:
+        stanza_acc = sum(r["stanza_correct"] for r in results) / total
+        chosen_acc = sum(r["chosen_correct"] for r in results) / total
+        logger.info(f"\nStanza attachment accuracy: {stanza_acc:.2%}")
+        logger.info(f"Chosen attachment accuracy: {chosen_acc:.2%}")
+        logger.info(f"Mean candidates per sentence: {sum(r['n_candidates'] for r in results) / total:.2f}")
+
+    if use_live_api:
+        if router is not None:
+            for line in router.summary():
+                logger.info(line)
+        for line in client.usage.summary():
+            logger.info(line)
+        with span("save"), open(args.output_file, 'w') as f:
+            for rows, text, choice, sources in chosen_parses:
+                write_conllu(f, rows, text, choice, sources)
+    if args.results_file:
+        with open(args.results_file, 'w') as f:
+            for r in results:
+                json.dump(r, f)
+                f.write('\n')
+
+
+if __name__ == "__main__":
+    main()
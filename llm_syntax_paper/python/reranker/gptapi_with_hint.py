@@ -1,31 +1,52 @@
 #!/usr/bin/env python3
 
+from __future__ import annotations
+
 import json
-import stanza
 import argparse
 import logging
+import os
 import sys
 from pathlib import Path
-from openai import OpenAI
-from typing import List, Dict, Optional
+from typing import TYPE_CHECKING, List, Dict, Optional
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.router import add_router_arguments, make_router
+from common.tracing import add_trace_argument, setup_tracing, span, traced
+from common.usage import TrackedClient
+from common.pipelines import add_pipeline_arguments, make_pipeline_pool, parse_stream
+from common.tokens import count_message_tokens
+from parse_encodings import ENCODING_NAMES, FORMAT_DESCRIPTIONS, encode_parse, parse_encoding_list, rows_from_stanza
+from risk_gate import add_gate_arguments, combine_risk, load_spacy, risk_signals, select_for_llm, spacy_heads
 
 
 def setup_args():
     parser = argparse.ArgumentParser(description='Run Stanza + ChatGPT to evaluate parses for attachment errors')
     parser.add_argument('input_file', help='Input JSON file with sentence examples')
     parser.add_argument('--output_file', help='If set, will call OpenAI and write results to this file')
+    parser.add_argument('--encoding', type=parse_encoding_list, default=['conllu'],
+                        help=f'Parse serialization(s) for the prompt, comma-separated to compare several '
+                             f'({", ".join(ENCODING_NAMES)}; default: conllu)')
+    add_gate_arguments(parser)
+    add_router_arguments(parser, "judge")
+    add_pipeline_arguments(parser)
+    add_trace_argument(parser)
     return parser.parse_args()
 
 
-def stanza_to_conllu(sentence, text):
-    conllu_lines = [f"# text = {text}"]
-    for word in sentence.words:
-        conllu_lines.append(
-            f"{word.id}\t{word.text}\t{word.lemma}\t{word.upos}\t{word.xpos}\t_\t{word.head}\t{word.deprel}\t_\t_"
-        )
-    return "\n".join(conllu_lines)
+SYSTEM_PROMPT = "You are a linguist helping to analyze syntactic dependency parses."
+
+router = None
 
 
+def serialize_parse(sentence, text, encoding: str = "conllu") -> str:
+    return encode_parse(rows_from_stanza(sentence), text, encoding)
+
+
+@traced("analyze")
 def analyze_attachment(sentence_tokens, phrase: str, full_sentence: str) -> Dict[str, Optional[str]]:
     phrase = phrase.strip()
     phrase_start = full_sentence.lower().find(phrase.lower())
@@ -58,27 +79,32 @@ def analyze_attachment(sentence_tokens, phrase: str, full_sentence: str) -> Dict
     }
 
 
-def build_prompt(conllu: str, phrase: str) -> str:
+@traced("prompt")
+def build_prompt(parse: str, phrase: str, encoding: str = "conllu") -> str:
     return (
-        "Here is a dependency parse of a sentence in CoNLL-U format.\n"
-        f"Focus on the phrase: \"{phrase}\".\n\n"
+        f"Here is a dependency parse of a sentence {FORMAT_DESCRIPTIONS[encoding]}, "
+        "followed by a phrase to focus on.\n"
         "Do you see any errors in the attachment of this phrase?\n\n"
         "1. If no errors, respond only with \"no\".\n"
         "2. If yes, explain the most important or most obvious error in the sentence.\n\n"
-        f"{conllu}"
+        f"{parse}\n\n"
+        f"Focus on the phrase: \"{phrase}\"."
     )
 
 
 def get_chatgpt_judgment(client: OpenAI, prompt: str) -> str:
+    if router is not None:
+        return router.ask(prompt) or "error"
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a linguist helping to analyze syntactic dependency parses."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0,
-        )
+        with span("api", model="gpt-4"):
+            response = client.chat.completions.create(
+                model="gpt-4",
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0,
+            )
         return response.choices[0].message.content.strip()
     except Exception as e:
         logging.error(f"OpenAI API error: {e}")
@@ -86,56 +112,103 @@ def get_chatgpt_judgment(client: OpenAI, prompt: str) -> str:
 
 
 def main():
+    global router
     args = setup_args()
+    setup_tracing(args.trace)
 
     logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[logging.StreamHandler(sys.stdout)])
     logger = logging.getLogger(__name__)
 
-    with open(args.input_file) as f:
+    with span("load"), open(args.input_file) as f:
         examples = json.load(f)
 
-    stanza.download('en')
-    nlp = stanza.Pipeline(lang='en', processors='tokenize,pos,lemma,depparse')
+    pool = make_pipeline_pool(args)
 
-    use_live_api = args.output_file is not None
-    client = OpenAI() if use_live_api else None
-    results = []
+    nlp_spacy = load_spacy(args.spacy_model)
 
-    for i, example in enumerate(examples, 1):
-        doc = nlp(example["sentence"])
-        sentence = doc.sentences[0]
-        conllu = stanza_to_conllu(sentence, example["sentence"])
-        prompt = build_prompt(conllu, example["ambiguous_phrase"])
-        # prompt = build_prompt(conllu)
+    use_live_api = args.output_file is not None
+    client = None
+    if use_live_api:
+        from openai import OpenAI
+        client = TrackedClient(OpenAI())
+        router = make_router(args, client, "judge", SYSTEM_PROMPT)
+
+    parsed = []
+    stream = parse_stream(pool, examples, lambda example: example.get("lang", args.lang),
+                          lambda example: example["sentence"], args.parse_batch_size)
+    for i, (example, sentences) in enumerate(stream, 1):
+        sentence = sentences[0]
+        prompts = {
+            encoding: build_prompt(serialize_parse(sentence, example["sentence"], encoding),
+                                   example["ambiguous_phrase"], encoding)
+            for encoding in args.encoding
+        }
 
         analysis = analyze_attachment(sentence.words, example["ambiguous_phrase"], example["sentence"])
         predicted = analysis["attachment_head"]
         expected = example["correct_attachment"]
         correct = predicted and predicted.lower() == expected.lower()
 
-        if use_live_api:
-            chatgpt_response = get_chatgpt_judgment(client, prompt)
-        else:
-            logger.info(f"\nExample {i} (DRY RUN)")
-            logger.info(f"Sentence: {example['sentence']}")
-            logger.info(f"→ Predicted: {predicted}, Expected: {expected} → Correct: {correct}")
-            logger.info("\n----- Prompt to ChatGPT -----\n")
-            logger.info(prompt)
-            logger.info("\n-----------------------------\n")
-            chatgpt_response = "no"
-
-        results.append({
-            "index": i,
-            "sentence": example["sentence"],
-            "ambiguous_phrase": example["ambiguous_phrase"],
-            "expected_head": expected,
-            "predicted_head": predicted,
-            "correct": correct,
-            "chatgpt_response": chatgpt_response
-        })
+        with span("risk"):
+            other_heads = spacy_heads(nlp_spacy, sentence.words) if nlp_spacy else None
+            signals = risk_signals(sentence.words, example["ambiguous_phrase"], example["sentence"], other_heads)
+        parsed.append((i, example, prompts, predicted, expected, correct, signals, combine_risk(signals)))
+
+    forwarded = select_for_llm([p[-1] for p in parsed], args.gate_fraction, args.gate_threshold)
+    logger.info(f"Gate: forwarding {len(forwarded)}/{len(parsed)} parses to the LLM "
+                f"({len(parsed) - len(forwarded)} calls saved)")
+
+    results = []
+    for idx, (i, example, prompts, predicted, expected, correct, signals, risk) in enumerate(parsed):
+        sent_to_llm = idx in forwarded
+        for encoding, prompt in prompts.items():
+            prompt_tokens = count_message_tokens(
+                [{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}], "gpt-4")
+            if not sent_to_llm:
+                # Low risk: accept the Stanza parse without asking.
+                chatgpt_response = "no"
+            elif use_live_api:
+                chatgpt_response = get_chatgpt_judgment(client, prompt)
+                if router is not None:
+                    router.record(bool(correct) == (chatgpt_response.strip().lower() == "no"))
+            else:
+                logger.info(f"\nExample {i} (DRY RUN, {encoding}, {prompt_tokens} prompt tokens)")
+                logger.info(f"Sentence: {example['sentence']}")
+                logger.info(f"→ Predicted: {predicted}, Expected: {expected} → Correct: {correct}")
+                logger.info(f"→ Risk: {risk:.3f} {signals}")
+                logger.info("\n----- Prompt to ChatGPT -----\n")
+                logger.info(prompt)
+                logger.info("\n-----------------------------\n")
+                chatgpt_response = "no"
+
+            results.append({
+                "index": i,
+                "sentence": example["sentence"],
+                "ambiguous_phrase": example["ambiguous_phrase"],
+                "expected_head": expected,
+                "predicted_head": predicted,
+                "correct": correct,
+                "chatgpt_response": chatgpt_response,
+                "risk": round(risk, 4),
+                "risk_signals": {k: round(v, 4) for k, v in signals.items()},
+                "sent_to_llm": sent_to_llm,
+                "encoding": encoding,
+                "prompt_tokens": prompt_tokens
+            })
+
+    for encoding in args.encoding:
+        tokens = [r["prompt_tokens"] for r in results if r["encoding"] == encoding] or [0]
+        sent = [r["prompt_tokens"] for r in results if r["encoding"] == encoding and r["sent_to_llm"]]
+        logger.info(f"Encoding {encoding}: {sum(tokens) / len(tokens):.1f} prompt tokens/example, "
+                    f"{sum(sent)} prompt tokens sent")
 
     if use_live_api:
-        with open(args.output_file, 'w') as f:
+        if router is not None:
+            for line in router.summary():
+                logger.info(line)
+        for line in client.usage.summary():
+            logger.info(line)
+        with span("save"), open(args.output_file, 'w') as f:
             for r in results:
                 json.dump(r, f)
                 f.write('\n')
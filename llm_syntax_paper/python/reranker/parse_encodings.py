@@ -0,0 +1,69 @@
+"""Parse serializations for reranker prompts.
+
+The full CoNLL-U block spends most of its tokens on lemma/xpos/feats columns
+and literal "_" placeholders the judge does not need.  Each encoding here
+renders the same parse; build_prompt() in the reranker scripts picks one by
+name and describes it to the model with FORMAT_DESCRIPTIONS.
+
+Rows are plain dicts with id, text, lemma, upos, xpos, head, deprel, so
+candidate parses from any source can be rendered the same way.
+"""
+
+import argparse
+from typing import Dict, List
+
+ENCODING_NAMES = ["conllu", "compact", "arcs"]
+
+FORMAT_DESCRIPTIONS = {
+    "conllu": "in CoNLL-U format",
+    "compact": "as tab-separated ID, WORD, HEAD, DEPREL columns (HEAD 0 is the root)",
+    "arcs": "as a list of labeled arcs written relation(head-ID, dependent-ID)",
+}
+
+
+def rows_from_stanza(sentence) -> List[Dict]:
+    return [
+        {"id": w.id, "text": w.text, "lemma": w.lemma, "upos": w.upos, "xpos": w.xpos,
+         "head": w.head, "deprel": w.deprel}
+        for w in sentence.words
+    ]
+
+
+def encode_conllu(rows: List[Dict], text: str) -> str:
+    lines = [f"# text = {text}"]
+    for r in rows:
+        lines.append(f"{r['id']}\t{r['text']}\t{r['lemma']}\t{r['upos']}\t{r['xpos']}\t_\t{r['head']}\t{r['deprel']}\t_\t_")
+    return "\n".join(lines)
+
+
+def encode_compact(rows: List[Dict], text: str) -> str:
+    return "\n".join(f"{r['id']}\t{r['text']}\t{r['head']}\t{r['deprel']}" for r in rows)
+
+
+def encode_arcs(rows: List[Dict], text: str) -> str:
+    by_id = {r["id"]: r for r in rows}
+    arcs = []
+    for r in rows:
+        head = "ROOT-0" if r["head"] == 0 else f"{by_id[r['head']]['text']}-{r['head']}"
+        arcs.append(f"{r['deprel']}({head}, {r['text']}-{r['id']})")
+    return f"Sentence: {text}\n" + "\n".join(arcs)
+
+
+ENCODERS = {
+    "conllu": encode_conllu,
+    "compact": encode_compact,
+    "arcs": encode_arcs,
+}
+
+
+def encode_parse(rows: List[Dict], text: str, encoding: str = "conllu") -> str:
+    return ENCODERS[encoding](rows, text)
+
+
+def parse_encoding_list(value: str) -> List[str]:
+    """argparse type for --encoding: one name or a comma-separated list."""
+    names = [v.strip() for v in value.split(",") if v.strip()]
+    unknown = [n for n in names if n not in ENCODERS]
+    if unknown:
+        raise argparse.ArgumentTypeError(f"unknown encoding(s) {unknown}; choose from {ENCODING_NAMES}")
+    return names
@@ -0,0 +1,115 @@
+"""Local risk scoring for Stanza parses, used to gate which ones go to the LLM.
+
+Most Stanza parses of the systematic PP sentences are already right, so the
+reranker scripts score every parse here first and only forward the riskiest
+fraction to GPT.  Signals:
+
+  pp        - how many plausible attachment sites (nouns/verbs) precede the
+              ambiguous phrase; one site means no real ambiguity
+  arc       - the longest arc relative to sentence length (long arcs are
+              where Stanza's attachment errors tend to show up)
+  disagree  - whether an independent spaCy parse of the same tokens attaches
+              the phrase elsewhere, plus the fraction of heads that differ
+              (only when spaCy and a model are installed)
+  missing   - the phrase could not be located or has no attachment head
+"""
+
+import logging
+from typing import Dict, List, Optional, Tuple
+
+ATTACHMENT_SITE_UPOS = {"NOUN", "PROPN", "VERB"}
+
+DEFAULT_WEIGHTS = {"pp": 0.4, "arc": 0.2, "disagree": 0.4}
+
+
+def load_spacy(model_name: Optional[str]):
+    """Load a spaCy pipeline for the disagreement signal, or None if unavailable."""
+    if not model_name:
+        return None
+    try:
+        import spacy
+        return spacy.load(model_name)
+    except (ImportError, OSError) as e:
+        logging.warning(f"spaCy model '{model_name}' unavailable ({e}); disagreement signal disabled")
+        return None
+
+
+def spacy_parse(nlp_spacy, words) -> Tuple[List[int], List[str]]:
+    """Parse Stanza's tokens with spaCy; return 1-based heads (0 for root) and labels."""
+    from spacy.tokens import Doc
+
+    doc = Doc(nlp_spacy.vocab, words=[w.text for w in words])
+    for _, proc in nlp_spacy.pipeline:
+        doc = proc(doc)
+    heads = [0 if tok.head.i == tok.i else tok.head.i + 1 for tok in doc]
+    return heads, [tok.dep_.lower() for tok in doc]
+
+
+def spacy_heads(nlp_spacy, words) -> List[int]:
+    return spacy_parse(nlp_spacy, words)[0]
+
+
+def phrase_word_ids(words, phrase: str, full_sentence: str) -> List[int]:
+    start = full_sentence.lower().find(phrase.strip().lower())
+    if start < 0:
+        return []
+    end = start + len(phrase.strip())
+    return [
+        w.id for w in words
+        if w.start_char is not None and w.end_char is not None
+        and w.start_char >= start and w.end_char <= end
+    ]
+
+
+def risk_signals(words, phrase: str, full_sentence: str, other_heads: Optional[List[int]] = None) -> Dict[str, float]:
+    """Compute each risk signal in [0, 1] for one Stanza sentence."""
+    ids = phrase_word_ids(words, phrase, full_sentence)
+    if not ids:
+        return {"missing": 1.0}
+    id_set = set(ids)
+    phrase_head = next((w for w in words if w.id in id_set and w.head not in id_set), None)
+    if phrase_head is None or phrase_head.head == 0:
+        return {"missing": 1.0}
+
+    signals = {}
+
+    sites = [w for w in words if w.id < min(ids) and w.upos in ATTACHMENT_SITE_UPOS]
+    starts_with_adp = words[min(ids) - 1].upos == "ADP"
+    signals["pp"] = min(1.0, max(len(sites) - 1, 0) / 3.0) if starts_with_adp else 0.0
+
+    arcs = [abs(w.id - w.head) for w in words if w.head > 0]
+    signals["arc"] = max(arcs) / len(words) if arcs else 0.0
+
+    if other_heads is not None and len(other_heads) == len(words):
+        head_mismatch = sum(1 for w, h in zip(words, other_heads) if w.head != h) / len(words)
+        attach_differs = 1.0 if other_heads[phrase_head.id - 1] != phrase_head.head else 0.0
+        signals["disagree"] = 0.7 * attach_differs + 0.3 * head_mismatch
+
+    return signals
+
+
+def combine_risk(signals: Dict[str, float], weights: Dict[str, float] = DEFAULT_WEIGHTS) -> float:
+    """Weighted mean over the signals that are present."""
+    if "missing" in signals:
+        return 1.0
+    used = {k: w for k, w in weights.items() if k in signals}
+    total = sum(used.values())
+    return sum(signals[k] * w for k, w in used.items()) / total if total else 0.0
+
+
+def select_for_llm(risks: List[float], fraction: float = 1.0, threshold: Optional[float] = None) -> set:
+    """Indices to forward: risk >= threshold if given, else the top `fraction` by risk."""
+    if threshold is not None:
+        return {i for i, r in enumerate(risks) if r >= threshold}
+    k = int(round(len(risks) * fraction))
+    ranked = sorted(range(len(risks)), key=lambda i: -risks[i])
+    return set(ranked[:k])
+
+
+def add_gate_arguments(parser):
+    parser.add_argument('--gate_fraction', type=float, default=1.0,
+                        help='Forward only this top-risk fraction of parses to the LLM (default: 1.0 = all)')
+    parser.add_argument('--gate_threshold', type=float,
+                        help='Forward parses with risk >= this value (overrides --gate_fraction)')
+    parser.add_argument('--spacy_model',
+                        help='spaCy model for the parser-disagreement signal, e.g. en_core_web_sm')
@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+"""Translate labeled dependency trees into first-order logic.
+
+Logical forms are built bottom-up, one rule per deprel, in a neo-Davidsonian
+style: every content word introduces a variable (e for verbs, x otherwise)
+and a predicate named after its lemma, and a dependent either
+
+  - modifies its head's variable (amod, advmod, appos, nummod):   red(x1) ∧ car(x1)
+  - is quantified separately and related to its head by a role named after
+    its case/mark/cc word or its deprel (nsubj, obj, obl, nmod, ccomp, conj, ...):
+                                              ∃x2 (park(x2) ∧ in(e1, x2))
+  - merges into its head's predicate name (flat, fixed, compound:prt):  new_york(x1)
+  - only sets a property of its head: det picks the quantifier (every -> ∀,
+    no -> ¬∃, otherwise ∃), a negating advmod negates it, and case/mark/cc
+    words become the role name used when the head attaches to its own head.
+
+The quantifiers of a clause's arguments take scope over its event in surface
+order, e.g. "Every visitor looks at a painting" ->
+    ∀x2 (visitor(x2) → ∃x3 (painting(x3) ∧ ∃e1 (look(e1) ∧ nsubj(e1, x2) ∧ at(e1, x3))))
+
+Subtree translations are hash-consed by (lemma, upos, deprel, children), so
+the many repeated subtrees in a corpus ("the N", "in the N") are translated
+once; variables are numbered relative to the subtree root and only renamed
+when a subtree is attached.
+
+Batch mode over CoNLL-U files (run from llm_syntax_paper/):
+    python python/semantics/dep_to_fol.py data/input/preliminary/examples25.conllu --output_file out.conllu
+    python python/semantics/dep_to_fol.py data/output/preliminary/*.ask_chatgpt_arcs.py.conllu --use_misc
+"""
+
+import argparse
+import logging
+import os
+import re
+import sys
+import time
+from collections import namedtuple
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.conllu import is_word, parse_misc, read_conllu, write_sentence
+from common.tracing import add_trace_argument, setup_tracing, span
+
+# A subtree's translation.  Variables are ints local to the subtree, 0 being
+# its root; atoms are (predicate, args) with int args for variables and str
+# args for constants; scoped are the quantified dependents as
+# (quantifier, variable, restrictor atoms, nested scoped, negated).
+Meaning = namedtuple("Meaning", "kinds quantifier atoms scoped marker negated")
+
+MODIFIER_DEPRELS = {"amod", "advmod", "appos", "nummod"}
+MERGE_DEPRELS = {"flat", "fixed", "goeswith", "compound:prt"}
+MARKER_DEPRELS = {"case", "mark", "cc"}
+IGNORED_DEPRELS = {"punct", "aux", "cop", "discourse", "reparandum", "expl", "dep"}
+
+UNIVERSAL_DETERMINERS = {"every", "each", "all", "any"}
+NEGATIVE_DETERMINERS = {"no", "neither"}
+NEGATIONS = {"not", "n't", "never", "no"}
+EVENT_UPOS = {"VERB", "AUX"}
+
+
+def predicate_name(lemma: str) -> str:
+    name = re.sub(r"\W+", "_", lemma.lower()).strip("_")
+    return name or "sym"
+
+
+def role_name(deprel: str) -> str:
+    return deprel.replace(":", "_")
+
+
+def _rename(atoms, scoped, mapping):
+    """Apply a variable mapping to atoms and (recursively) to scoped dependents."""
+    atoms = tuple((pred, tuple(mapping[a] if isinstance(a, int) else a for a in args)) for pred, args in atoms)
+    renamed = []
+    for quantifier, var, restrictor, nested, negated in scoped:
+        restrictor, nested = _rename(restrictor, nested, mapping)
+        renamed.append((quantifier, mapping[var], restrictor, nested, negated))
+    return atoms, tuple(renamed)
+
+
+class Translator:
+    """Compositional dependency-to-FOL translator with a subtree memo."""
+
+    def __init__(self, memoize: bool = True):
+        self.memoize = memoize
+        self.ids: Dict[Tuple, int] = {}
+        self.memo: Dict[int, Meaning] = {}
+        self.lookups = 0
+        self.hits = 0
+
+    def _leaf(self, lemma: str, upos: str) -> Meaning:
+        kind = "e" if upos in EVENT_UPOS else "x"
+        return Meaning((kind,), "exists", ((predicate_name(lemma), (0,)),), (), None, False)
+
+    def _combine(self, head: Meaning, child: Meaning, lemma: str, deprel: str) -> Meaning:
+        kinds, quantifier, atoms, scoped, marker, negated = head
+        base = deprel.split(":", 1)[0]
+
+        if deprel in IGNORED_DEPRELS or base in ("punct", "aux", "cop"):
+            return head
+        if base in MARKER_DEPRELS:
+            return head._replace(marker=predicate_name(lemma))
+        if deprel == "det":
+            if lemma.lower() in UNIVERSAL_DETERMINERS:
+                return head._replace(quantifier="forall")
+            if lemma.lower() in NEGATIVE_DETERMINERS:
+                return head._replace(quantifier="no")
+            return head
+        if base == "advmod" and lemma.lower() in NEGATIONS:
+            return head._replace(negated=not negated)
+        if deprel in MERGE_DEPRELS or base in ("flat", "fixed", "goeswith"):
+            (pred, args), rest = atoms[0], atoms[1:]
+            return head._replace(atoms=((f"{pred}_{predicate_name(lemma)}", args),) + rest)
+
+        offset = len(kinds)
+        if base in MODIFIER_DEPRELS:
+            # The modifier's root variable is the head's own variable.
+            mapping = [0] + list(range(offset, offset + len(child.kinds) - 1))
+            child_atoms, child_scoped = _rename(child.atoms, child.scoped, mapping)
+            if base == "nummod":
+                child_atoms = (("card", (0, lemma)),) + child_atoms[1:]
+            return head._replace(kinds=kinds + child.kinds[1:], atoms=atoms + child_atoms,
+                                 scoped=scoped + child_scoped)
+
+        # Arguments and everything else: a separately quantified dependent.
+        mapping = list(range(offset, offset + len(child.kinds)))
+        child_atoms, child_scoped = _rename(child.atoms, child.scoped, mapping)
+        role = child.marker or role_name(deprel)
+        entry = (child.quantifier, offset, child_atoms, child_scoped, child.negated)
+        return head._replace(kinds=kinds + child.kinds, atoms=atoms + ((role, (0, offset)),),
+                             scoped=scoped + (entry,))
+
+    def translate(self, tokens: List[Dict]) -> Tuple[List[Meaning], int]:
+        """Meanings of every root subtree of a sentence, and the number of tokens not under a root.
+
+        tokens are dicts with lemma, upos, head (1-based, 0 = root) and deprel.
+        """
+        n = len(tokens)
+        children = [[] for _ in range(n + 1)]
+        for d, token in enumerate(tokens, 1):
+            h = token["head"]
+            if h is not None and 0 <= h <= n and h != d:
+                children[h].append(d)
+
+        # Iterative post-order from the root, so deep or broken trees cannot recurse too far.
+        order, stack, seen = [], [0], {0}
+        while stack:
+            node = stack.pop()
+            order.append(node)
+            for c in children[node]:
+                if c not in seen:
+                    seen.add(c)
+                    stack.append(c)
+
+        meanings, keys = {}, {}
+        for node in reversed(order):
+            if node == 0:
+                continue
+            token = tokens[node - 1]
+            kids = children[node]
+            key = (token["lemma"], token["upos"], token["deprel"], tuple(keys[c] for c in kids))
+            self.lookups += 1
+            key_id = self.ids.setdefault(key, len(self.ids)) if self.memoize else None
+            keys[node] = key_id if self.memoize else node
+            if self.memoize and key_id in self.memo:
+                self.hits += 1
+                meanings[node] = self.memo[key_id]
+                continue
+            meaning = self._leaf(token["lemma"], token["upos"])
+            for c in kids:
+                child = tokens[c - 1]
+                meaning = self._combine(meaning, meanings[c], child["lemma"], child["deprel"])
+            meanings[node] = meaning
+            if self.memoize:
+                self.memo[key_id] = meaning
+        return [meanings[r] for r in children[0]], n - (len(order) - 1)
+
+    def stats(self) -> Dict[str, float]:
+        return {"lookups": self.lookups, "hits": self.hits, "unique_subtrees": len(self.memo),
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0}
+
+
+def _atom(pred: str, args, names) -> str:
+    return f"{pred}({', '.join(names[a] if isinstance(a, int) else repr(a) for a in args)})"
+
+
+def _conj(parts: List[str]) -> str:
+    return " ∧ ".join(parts) if parts else "⊤"
+
+
+def _scope(scoped, core: str, names) -> str:
+    """Wrap the quantified dependents around a core formula, first dependent outermost."""
+    for quantifier, var, restrictor, nested, negated in reversed(scoped):
+        restr = _scope(nested, _conj([_atom(p, a, names) for p, a in restrictor]), names)
+        v = names[var]
+        if quantifier == "forall":
+            formula = f"∀{v} ({restr} → {core})"
+        elif quantifier == "no":
+            formula = f"¬∃{v} ({restr} ∧ {core})"
+        else:
+            formula = f"∃{v} ({restr} ∧ {core})"
+        core = f"¬{formula}" if negated else formula
+    return core
+
+
+def render(meaning: Meaning, first_var: int = 1) -> str:
+    """A closed formula for a root subtree: its own variable innermost, its dependents scoping over it."""
+    names = [f"{kind}{first_var + i}" for i, kind in enumerate(meaning.kinds)]
+    own = _conj([_atom(p, a, names) for p, a in meaning.atoms])
+    if meaning.quantifier == "forall":
+        core = f"∀{names[0]} ({own})"
+    elif meaning.quantifier == "no":
+        core = f"¬∃{names[0]} ({own})"
+    else:
+        core = f"∃{names[0]} ({own})"
+    if meaning.negated:
+        core = f"¬{core}"
+    return _scope(meaning.scoped, core, names)
+
+
+def sentence_formula(translator: Translator, tokens: List[Dict]) -> Tuple[str, int]:
+    roots, skipped = translator.translate(tokens)
+    parts, first = [], 1
+    for meaning in roots:
+        parts.append(render(meaning, first))
+        first += len(meaning.kinds)
+    return (" ∧ ".join(parts) if parts else "⊤"), skipped
+
+
+def layer_tokens(tokens: List[Dict], use_misc: bool) -> List[Dict]:
+    """The words of a sentence (lemma falling back to the form), with the ChatGPT
+    head/deprel from MISC when asked for and present."""
+    layered = []
+    for t in tokens:
+        if not is_word(t):
+            continue
+        t = dict(t)
+        if t["lemma"] in ("_", ""):
+            t["lemma"] = t["form"]
+        if not use_misc:
+            layered.append(t)
+            continue
+        misc = parse_misc(t["misc"])
+        if misc.get("ChatGPTHeadId", "").isdigit():
+            t["head"] = int(misc["ChatGPTHeadId"])
+        if misc.get("ChatGPTDeprel") not in (None, "", "None"):
+            t["deprel"] = misc["ChatGPTDeprel"].lower()
+        layered.append(t)
+    return layered
+
+
+def setup_args():
+    parser = argparse.ArgumentParser(description='Translate dependency trees in CoNLL-U files to first-order logic')
+    parser.add_argument('input_files', nargs='+', help='CoNLL-U files')
+    parser.add_argument('--output_file', help='Write the sentences back out with a "# fol = ..." comment')
+    parser.add_argument('--use_misc', action='store_true',
+                        help='Use ChatGPTHeadId/ChatGPTDeprel from MISC instead of the HEAD/DEPREL columns where present')
+    parser.add_argument('--no_memo', action='store_true', help='Translate every subtree from scratch (for comparison)')
+    parser.add_argument('--show', type=int, default=3, help='Print the formulas of the first N sentences')
+    add_trace_argument(parser)
+    return parser.parse_args()
+
+
+def main():
+    args = setup_args()
+    setup_tracing(args.trace)
+    logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+    logger = logging.getLogger(__name__)
+
+    translator = Translator(memoize=not args.no_memo)
+    out = open(args.output_file, 'w', encoding='utf-8') if args.output_file else None
+    n_sentences = n_tokens = n_skipped = 0
+    start = time.perf_counter()
+    try:
+        for path in args.input_files:
+            for comments, tokens in read_conllu(path):
+                words = layer_tokens(tokens, args.use_misc)
+                with span("translate"):
+                    formula, skipped = sentence_formula(translator, words)
+                n_sentences += 1
+                n_tokens += len(words)
+                n_skipped += skipped
+                if n_sentences <= args.show:
+                    logger.info(f"{' '.join(t['form'] for t in words)}\n  {formula}\n")
+                if out:
+                    comments = [c for c in comments if not c.startswith("# fol =")] + [f"# fol = {formula}"]
+                    if skipped:
+                        comments.append(f"# fol_skipped_tokens = {skipped}")
+                    write_sentence(out, comments, tokens)
+    finally:
+        if out:
+            out.close()
+    elapsed = time.perf_counter() - start
+
+    stats = translator.stats()
+    logger.info(f"✅ {n_sentences} sentences, {n_tokens} tokens in {elapsed:.2f}s "
+                f"({n_sentences / elapsed if elapsed else 0:.0f} sentences/s, "
+                f"{n_tokens / elapsed if elapsed else 0:.0f} tokens/s)")
+    if n_skipped:
+        logger.info(f"⚠️  {n_skipped} tokens were not under a root (cycles in the input) and were left out")
+    if translator.memoize:
+        logger.info(f"Memo: {stats['hits']}/{stats['lookups']} subtree lookups hit ({stats['hit_rate'] * 100:.1f}%), "
+                    f"{stats['unique_subtrees']} distinct subtrees")
+    if out:
+        logger.info(f"✅ Wrote {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
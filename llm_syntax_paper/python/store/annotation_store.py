@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""SQLite-backed layered annotation store for the treebank.
+
+One database holds the surface layer (sentences and their tokens) and any
+number of per-source annotation layers over the same tokens (gold, stanza,
+gpt-4o-mini, ...), so comparisons between sources are indexed queries rather
+than rescans of data/output/** files.
+
+    sentences(id, corpus, sent_index, text, comments)
+    tokens(sentence_id, token_index, form)
+    annotations(sentence_id, token_index, source, lemma, upos, xpos, feats, head, deprel, misc)
+    sentence_annotations(sentence_id, source, key, value)    # e.g. comments, logical forms
+    sources(name, imported_from, imported_at)
+
+Sentences are identified by (corpus, position in the file), which is how the
+experiment outputs line up with their gold input.  The ChatGPT* MISC fields
+the preliminary scripts write are imported as their own layer with
+--misc_source.
+
+Examples (run from llm_syntax_paper/):
+    python python/store/annotation_store.py treebank.db import data/input/preliminary/examples25.conllu --corpus examples25 --source gold
+    python python/store/annotation_store.py treebank.db import data/output/preliminary/examples25.conllu.ask_chatgpt_rels.py.conllu --corpus examples25 --misc_source gpt-4o-mini
+    python python/store/annotation_store.py treebank.db mismatch deprel gpt-4o-mini --against gold
+    python python/store/annotation_store.py treebank.db export examples25 gold out.conllu
+"""
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.conllu import format_misc, is_word, parse_misc, read_conllu, write_sentence
+from common.tracing import add_trace_argument, setup_tracing, span, traced
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sentences (
+    id INTEGER PRIMARY KEY,
+    corpus TEXT NOT NULL,
+    sent_index INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    comments TEXT,
+    UNIQUE (corpus, sent_index)
+);
+CREATE TABLE IF NOT EXISTS tokens (
+    sentence_id INTEGER NOT NULL REFERENCES sentences(id),
+    token_index INTEGER NOT NULL,
+    form TEXT NOT NULL,
+    PRIMARY KEY (sentence_id, token_index)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS annotations (
+    sentence_id INTEGER NOT NULL,
+    token_index INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    lemma TEXT,
+    upos TEXT,
+    xpos TEXT,
+    feats TEXT,
+    head INTEGER,
+    deprel TEXT,
+    misc TEXT,
+    PRIMARY KEY (sentence_id, token_index, source),
+    FOREIGN KEY (sentence_id, token_index) REFERENCES tokens(sentence_id, token_index)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sentence_annotations (
+    sentence_id INTEGER NOT NULL REFERENCES sentences(id),
+    source TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT,
+    PRIMARY KEY (sentence_id, source, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sources (
+    name TEXT PRIMARY KEY,
+    imported_from TEXT,
+    imported_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_annotations_source_upos ON annotations (source, upos);
+CREATE INDEX IF NOT EXISTS idx_annotations_source_deprel ON annotations (source, deprel);
+CREATE INDEX IF NOT EXISTS idx_annotations_source_head ON annotations (source, head);
+CREATE INDEX IF NOT EXISTS idx_annotations_upos ON annotations (upos);
+CREATE INDEX IF NOT EXISTS idx_annotations_deprel ON annotations (deprel);
+CREATE INDEX IF NOT EXISTS idx_sentences_text ON sentences (text);
+"""
+
+# MISC fields written by the preliminary scripts -> the annotation column they fill.
+MISC_LAYERS = {
+    "ChatGPTUPOS": "upos",
+    "ChatGPTDeprel": "deprel",
+    "ChatGPTHeadId": "head",
+    "ChatGPTHead": "head_word",
+}
+
+FIELDS = ["lemma", "upos", "xpos", "feats", "head", "deprel"]
+
+# Several files can feed one layer (the tags, rels and arcs runs each fill one
+# column of gpt-4o-mini), so a re-import only overwrites the columns it has.
+UPSERT_ANNOTATION = (
+    "INSERT INTO annotations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+    "ON CONFLICT (sentence_id, token_index, source) DO UPDATE SET "
+    + ", ".join(f"{c} = COALESCE(excluded.{c}, {c})" for c in FIELDS)
+    + ", misc = CASE WHEN excluded.misc IS NULL THEN misc WHEN misc IS NULL OR misc = excluded.misc "
+      "THEN excluded.misc ELSE misc || '|' || excluded.misc END"
+)
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def _value(v: str) -> Optional[str]:
+    return None if v in ("_", "", None) else v
+
+
+def resolve_head_word(word: str, forms: List[str]) -> Optional[int]:
+    """Head index for a head given as a word: 0 for root, the position if the word occurs exactly once."""
+    word = word.strip()
+    if word.lower() == "root":
+        return 0
+    positions = [i for i, form in enumerate(forms, 1) if form == word]
+    return positions[0] if len(positions) == 1 else None
+
+
+def misc_layer(token: Dict, forms: List[str]) -> Optional[Dict]:
+    """The annotation carried in a token's ChatGPT* MISC fields, if any."""
+    misc = parse_misc(token["misc"])
+    layer = {}
+    for key, column in MISC_LAYERS.items():
+        if key not in misc or misc[key] in ("None", ""):
+            continue
+        if column == "head_word":
+            if "head" not in layer:
+                layer["head"] = resolve_head_word(misc[key], forms)
+            layer.setdefault("misc", {})[key] = misc[key]
+        elif column == "head":
+            layer["head"] = int(misc[key]) if misc[key].isdigit() else None
+        else:
+            layer[column] = misc[key]
+    if not layer:
+        return None
+    layer["misc"] = format_misc(layer.get("misc", {}))
+    return layer
+
+
+@traced("import")
+def import_conllu(conn: sqlite3.Connection, path: str, corpus: str, source: Optional[str] = None,
+                  misc_source: Optional[str] = None) -> Dict[str, int]:
+    """Bulk-load a CoNLL-U file; returns counts of sentences, tokens and annotation rows written."""
+    counts = {"sentences": 0, "new_sentences": 0, "skipped": 0, "annotations": 0}
+    with conn:
+        for name in (source, misc_source):
+            if name:
+                conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)", (name, path, time.time()))
+
+        for sent_index, (comments, tokens) in enumerate(read_conllu(path)):
+            words = [t for t in tokens if is_word(t)]
+            forms = [t["form"] for t in words]
+            text = next((c.split("=", 1)[1].strip() for c in comments if c.startswith("# text")), " ".join(forms))
+
+            row = conn.execute("SELECT id FROM sentences WHERE corpus = ? AND sent_index = ?",
+                               (corpus, sent_index)).fetchone()
+            if row is None:
+                sentence_id = conn.execute(
+                    "INSERT INTO sentences (corpus, sent_index, text, comments) VALUES (?, ?, ?, ?)",
+                    (corpus, sent_index, text, json.dumps(comments))).lastrowid
+                conn.executemany("INSERT INTO tokens VALUES (?, ?, ?)",
+                                 [(sentence_id, i, form) for i, form in enumerate(forms, 1)])
+                counts["new_sentences"] += 1
+            else:
+                sentence_id = row[0]
+                stored = [r[0] for r in conn.execute(
+                    "SELECT form FROM tokens WHERE sentence_id = ? ORDER BY token_index", (sentence_id,))]
+                if stored != forms:
+                    logging.warning(f"⚠️  {path}: sentence {sent_index} does not match the stored tokens of "
+                                    f"{corpus}; skipping")
+                    counts["skipped"] += 1
+                    continue
+            counts["sentences"] += 1
+
+            rows = []
+            if source:
+                rows.extend((sentence_id, i, source, _value(t["lemma"]), _value(t["upos"]), _value(t["xpos"]),
+                             _value(t["feats"]), t["head"], _value(t["deprel"]), _value(t["misc"]))
+                            for i, t in enumerate(words, 1))
+                conn.executemany("INSERT OR REPLACE INTO sentence_annotations VALUES (?, ?, ?, ?)",
+                                 [(sentence_id, source, "comments", json.dumps(comments))])
+            if misc_source:
+                for i, t in enumerate(words, 1):
+                    layer = misc_layer(t, forms)
+                    if layer:
+                        rows.append((sentence_id, i, misc_source, None, layer.get("upos"), None, None,
+                                     layer.get("head"), layer.get("deprel"), _value(layer["misc"])))
+            conn.executemany(UPSERT_ANNOTATION, rows)
+            counts["annotations"] += len(rows)
+    return counts
+
+
+@traced("export")
+def export_conllu(conn: sqlite3.Connection, corpus: str, source: str, path: str) -> int:
+    """Write one corpus with one source's layer as CoNLL-U; returns the number of sentences."""
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for sentence_id, text in conn.execute(
+                "SELECT id, text FROM sentences WHERE corpus = ? ORDER BY sent_index", (corpus,)).fetchall():
+            rows = conn.execute(
+                "SELECT t.token_index, t.form, a.lemma, a.upos, a.xpos, a.feats, a.head, a.deprel, a.misc "
+                "FROM tokens t LEFT JOIN annotations a "
+                "ON a.sentence_id = t.sentence_id AND a.token_index = t.token_index AND a.source = ? "
+                "WHERE t.sentence_id = ? ORDER BY t.token_index", (source, sentence_id)).fetchall()
+            tokens = [{"id": r[0], "form": r[1], "lemma": r[2], "upos": r[3], "xpos": r[4], "feats": r[5],
+                       "head": r[6], "deprel": r[7], "deps": None, "misc": r[8]} for r in rows]
+            write_sentence(f, [f"# text = {text}"], tokens)
+            n += 1
+    return n
+
+
+def _both(field: str) -> str:
+    """Only tokens both layers annotated for field; a layer that left it empty has no opinion."""
+    return f"p.{field} IS NOT NULL AND g.{field} IS NOT NULL"
+
+
+def mismatches(conn: sqlite3.Connection, field: str, source: str, against: str,
+               corpus: Optional[str] = None, limit: Optional[int] = None) -> Iterator[Tuple]:
+    """Tokens annotated by both where `source` and `against` disagree on `field`:
+    (corpus, sent_index, token_index, form, against value, source value)."""
+    if field not in FIELDS:
+        raise ValueError(f"field must be one of {FIELDS}")
+    query = (
+        f"SELECT s.corpus, s.sent_index, t.token_index, t.form, g.{field}, p.{field} "
+        "FROM annotations p "
+        "JOIN annotations g ON g.sentence_id = p.sentence_id AND g.token_index = p.token_index AND g.source = ? "
+        "JOIN tokens t ON t.sentence_id = p.sentence_id AND t.token_index = p.token_index "
+        "JOIN sentences s ON s.id = p.sentence_id "
+        f"WHERE p.source = ? AND {_both(field)} AND p.{field} != g.{field}"
+    )
+    params = [against, source]
+    if corpus:
+        query += " AND s.corpus = ?"
+        params.append(corpus)
+    query += " ORDER BY s.corpus, s.sent_index, t.token_index"
+    if limit is not None:
+        query += f" LIMIT {int(limit)}"
+    return conn.execute(query, params)
+
+
+def confusions(conn: sqlite3.Connection, field: str, source: str, against: str, corpus: Optional[str] = None,
+               top: int = 20) -> List[Tuple]:
+    """Most frequent (against value, source value, count) disagreements on tokens annotated by both."""
+    if field not in FIELDS:
+        raise ValueError(f"field must be one of {FIELDS}")
+    query = (
+        f"SELECT g.{field}, p.{field}, COUNT(*) AS n FROM annotations p "
+        "JOIN annotations g ON g.sentence_id = p.sentence_id AND g.token_index = p.token_index AND g.source = ? "
+        "JOIN sentences s ON s.id = p.sentence_id "
+        f"WHERE p.source = ? AND {_both(field)} AND p.{field} != g.{field}"
+    )
+    params = [against, source]
+    if corpus:
+        query += " AND s.corpus = ?"
+        params.append(corpus)
+    query += f" GROUP BY g.{field}, p.{field} ORDER BY n DESC LIMIT {int(top)}"
+    return conn.execute(query, params).fetchall()
+
+
+def agreement(conn: sqlite3.Connection, field: str, source: str, against: str,
+              corpus: Optional[str] = None) -> Tuple[int, int]:
+    """(agreeing tokens, tokens annotated by both)."""
+    if field not in FIELDS:
+        raise ValueError(f"field must be one of {FIELDS}")
+    query = (
+        f"SELECT SUM(p.{field} = g.{field}), COUNT(*) FROM annotations p "
+        "JOIN annotations g ON g.sentence_id = p.sentence_id AND g.token_index = p.token_index AND g.source = ? "
+        f"JOIN sentences s ON s.id = p.sentence_id WHERE p.source = ? AND {_both(field)}"
+    )
+    params = [against, source]
+    if corpus:
+        query += " AND s.corpus = ?"
+        params.append(corpus)
+    same, total = conn.execute(query, params).fetchone()
+    return same or 0, total or 0
+
+
+def coverage(conn: sqlite3.Connection, field: str, source: str, against: str,
+             corpus: Optional[str] = None) -> Tuple[int, int]:
+    """(tokens `against` annotated for field that `source` annotated too, tokens `against` annotated)."""
+    if field not in FIELDS:
+        raise ValueError(f"field must be one of {FIELDS}")
+    query = (
+        f"SELECT COUNT(p.{field}), COUNT(*) FROM annotations g "
+        "LEFT JOIN annotations p ON p.sentence_id = g.sentence_id AND p.token_index = g.token_index AND p.source = ? "
+        f"JOIN sentences s ON s.id = g.sentence_id WHERE g.source = ? AND g.{field} IS NOT NULL"
+    )
+    params = [source, against]
+    if corpus:
+        query += " AND s.corpus = ?"
+        params.append(corpus)
+    covered, total = conn.execute(query, params).fetchone()
+    return covered or 0, total or 0
+
+
+def setup_args():
+    parser = argparse.ArgumentParser(description='Layered SQLite annotation store for the treebank')
+    parser.add_argument('db', help='SQLite database file (created if missing)')
+    add_trace_argument(parser)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('import', help='Bulk-import a CoNLL-U file')
+    p.add_argument('conllu_file')
+    p.add_argument('--corpus', required=True, help='Corpus name; files of one corpus align by sentence position')
+    p.add_argument('--source', help='Layer name for the file\'s own columns (e.g. gold, stanza)')
+    p.add_argument('--misc_source', help='Layer name for the ChatGPT* MISC fields (e.g. gpt-4o-mini)')
+
+    p = sub.add_parser('export', help='Export one corpus with one source layer as CoNLL-U')
+    p.add_argument('corpus')
+    p.add_argument('source')
+    p.add_argument('output_file')
+
+    p = sub.add_parser('mismatch', help='List tokens where a source disagrees with another')
+    p.add_argument('field', choices=FIELDS)
+    p.add_argument('source')
+    p.add_argument('--against', default='gold')
+    p.add_argument('--corpus')
+    p.add_argument('--limit', type=int, default=50)
+    p.add_argument('--top', type=int, default=15, help='Most frequent confusions to show')
+
+    sub.add_parser('stats', help='Sentences, tokens and annotation rows per corpus and source')
+
+    p = sub.add_parser('sql', help='Run an ad-hoc SQL query')
+    p.add_argument('query')
+
+    args = parser.parse_args()
+    if args.command == 'import' and not (args.source or args.misc_source):
+        parser.error("import needs --source and/or --misc_source")
+    return args
+
+
+def main():
+    args = setup_args()
+    setup_tracing(args.trace)
+    logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+    logger = logging.getLogger(__name__)
+
+    conn = connect(args.db)
+
+    if args.command == 'import':
+        counts = import_conllu(conn, args.conllu_file, args.corpus, args.source, args.misc_source)
+        logger.info(f"✅ {args.conllu_file}: {counts['sentences']} sentences ({counts['new_sentences']} new, "
+                    f"{counts['skipped']} skipped), {counts['annotations']} annotation rows")
+
+    elif args.command == 'export':
+        n = export_conllu(conn, args.corpus, args.source, args.output_file)
+        logger.info(f"✅ Wrote {n} sentences to {args.output_file}")
+
+    elif args.command == 'mismatch':
+        with span("query"):
+            covered, annotated = coverage(conn, args.field, args.source, args.against, args.corpus)
+            logger.info(f"{args.field}: {args.source} annotates {covered}/{annotated} of the tokens "
+                        f"{args.against} annotates")
+            same, total = agreement(conn, args.field, args.source, args.against, args.corpus)
+            if total:
+                logger.info(f"{args.field}: {args.source} agrees with {args.against} on {same}/{total} "
+                            f"tokens ({same / total * 100:.2f}%)")
+            logger.info(f"\n{'corpus':<16} {'sent':>5} {'tok':>4}  {'form':<16} {args.against:<12} {args.source}")
+            for corpus, sent_index, token_index, form, gold, pred in mismatches(
+                    conn, args.field, args.source, args.against, args.corpus, args.limit):
+                logger.info(f"{corpus:<16} {sent_index:5d} {token_index:4d}  {form:<16} {str(gold):<12} {pred}")
+            logger.info(f"\nMost frequent confusions ({args.against} → {args.source}):")
+            for gold, pred, n in confusions(conn, args.field, args.source, args.against, args.corpus, args.top):
+                logger.info(f"  {str(gold):<12} → {str(pred):<12} {n}")
+
+    elif args.command == 'stats':
+        for corpus, n_sent, n_tok in conn.execute(
+                "SELECT s.corpus, COUNT(DISTINCT s.id), COUNT(*) FROM sentences s "
+                "JOIN tokens t ON t.sentence_id = s.id GROUP BY s.corpus"):
+            logger.info(f"📚 {corpus}: {n_sent} sentences, {n_tok} tokens")
+        for source, n in conn.execute("SELECT source, COUNT(*) FROM annotations GROUP BY source ORDER BY source"):
+            logger.info(f"  layer {source}: {n} token annotations")
+
+    elif args.command == 'sql':
+        cursor = conn.execute(args.query)
+        if cursor.description:
+            logger.info("\t".join(d[0] for d in cursor.description))
+            for row in cursor:
+                logger.info("\t".join("NULL" if v is None else str(v) for v in row))
+        conn.commit()
+
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
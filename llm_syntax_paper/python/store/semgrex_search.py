@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""Search a treebank with semgrex-style dependency patterns (see common/semgrex.py).
+
+Build the index once and query it as often as needed; a .conllu file can also
+be queried directly (the index is then built in memory first).
+
+Examples (run from llm_syntax_paper/):
+    python python/store/semgrex_search.py index big.conllu big.idx.npz
+    python python/store/semgrex_search.py query big.idx.npz '{upos:VERB}=v >obl ({}=n >case {upos:ADP}=p)'
+    python python/store/semgrex_search.py query data/input/preliminary/examples25.conllu \\
+        '{}=head >conj {}=c' --count
+    python python/store/semgrex_search.py query big.idx.npz '{upos:NOUN} >acl:relcl {}' --output_file relcl.conllu
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.conllu import read_conllu, write_sentence
+from common.semgrex import PatternError, Treebank, default_workers, parse_pattern, search
+from common.tracing import add_trace_argument, setup_tracing, span
+
+
+def setup_args():
+    parser = argparse.ArgumentParser(description='Semgrex-style dependency pattern search')
+    add_trace_argument(parser)
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('index', help='Build and save the index of a CoNLL-U file')
+    p.add_argument('conllu_file')
+    p.add_argument('index_file', help='Output .npz file')
+
+    p = sub.add_parser('query', help='Find the matches of a pattern')
+    p.add_argument('source', help='An index (.npz) or a CoNLL-U file')
+    p.add_argument('pattern')
+    p.add_argument('--workers', type=int, default=default_workers(),
+                   help='Processes matching candidate sentences in parallel (default: %(default)s)')
+    p.add_argument('--limit', type=int, help='Show at most this many matches')
+    p.add_argument('--count', action='store_true', help='Only print the number of matches and sentences')
+    p.add_argument('--output_file', help='Write the matching sentences as CoNLL-U (read back from the source file)')
+    return parser.parse_args()
+
+
+def highlight(tb: Treebank, s: int, bindings) -> str:
+    names = {token: name for name, token in bindings.items()}
+    words = []
+    for token in range(1, int(tb.offsets[s + 1] - tb.offsets[s]) + 1):
+        form = tb.form(s, token)
+        words.append(f"[{form}]={names[token]}" if token in names else form)
+    return " ".join(words)
+
+
+def main():
+    args = setup_args()
+    setup_tracing(args.trace)
+    logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+    logger = logging.getLogger(__name__)
+
+    if args.command == 'index':
+        start = time.perf_counter()
+        with span("index"):
+            tb = Treebank.from_conllu(args.conllu_file)
+            tb.save(args.index_file)
+        logger.info(f"✅ Indexed {tb.n_sentences} sentences ({tb.n_tokens} tokens) in "
+                    f"{time.perf_counter() - start:.1f}s -> {args.index_file}")
+        return
+
+    try:
+        pattern = parse_pattern(args.pattern)
+    except PatternError as e:
+        logger.error(f"❌ {e}")
+        sys.exit(1)
+
+    with span("load"):
+        tb = Treebank.open(args.source)
+    start = time.perf_counter()
+    with span("search"):
+        matches = search(tb, pattern, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    sentences = sorted({s for s, _ in matches})
+    logger.info(f"🔎 {len(matches)} matches in {len(sentences)}/{tb.n_sentences} sentences ({elapsed:.2f}s)")
+    if args.count:
+        return
+
+    for s, bindings in matches[:args.limit]:
+        logger.info(f"{s}: {highlight(tb, s, bindings)}")
+
+    if args.output_file:
+        wanted = set(sentences)
+        with open(args.output_file, 'w', encoding='utf-8') as f:
+            for s, (comments, tokens) in enumerate(read_conllu(tb.source)):
+                if s in wanted:
+                    write_sentence(f, comments, tokens)
+        logger.info(f"✅ Wrote {len(wanted)} sentences to {args.output_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from annotation_store import agreement, confusions, connect, coverage, import_conllu, mismatches
+
+GOLD = """# text = Dogs bark loudly
+1\tDogs\tdog\tNOUN\t_\t_\t2\tnsubj\t_\t_
+2\tbark\tbark\tVERB\t_\t_\t0\troot\t_\t_
+3\tloudly\tloudly\tADV\t_\t_\t2\tadvmod\t_\t_
+
+"""
+
+# A rels-style output: only the deprel layer is filled, from MISC.
+RELS = """# text = Dogs bark loudly
+1\tDogs\tdog\tNOUN\t_\t_\t2\tnsubj\t_\tChatGPTDeprel=nsubj
+2\tbark\tbark\tVERB\t_\t_\t0\troot\t_\tChatGPTDeprel=root
+3\tloudly\tloudly\tADV\t_\t_\t2\tadvmod\t_\tChatGPTDeprel=obl
+
+"""
+
+
+def make_store(tmp_path):
+    (tmp_path / "gold.conllu").write_text(GOLD)
+    (tmp_path / "rels.conllu").write_text(RELS)
+    conn = connect(str(tmp_path / "t.db"))
+    import_conllu(conn, str(tmp_path / "gold.conllu"), "c", source="gold")
+    import_conllu(conn, str(tmp_path / "rels.conllu"), "c", misc_source="gpt")
+    return conn
+
+
+def test_unannotated_field_is_not_a_disagreement(tmp_path):
+    conn = make_store(tmp_path)
+    assert agreement(conn, "upos", "gpt", "gold") == (0, 0)
+    assert list(mismatches(conn, "upos", "gpt", "gold")) == []
+    assert confusions(conn, "upos", "gpt", "gold") == []
+    assert coverage(conn, "upos", "gpt", "gold") == (0, 3)
+
+
+def test_annotated_field_is_compared(tmp_path):
+    conn = make_store(tmp_path)
+    assert agreement(conn, "deprel", "gpt", "gold") == (2, 3)
+    assert [row[3:] for row in mismatches(conn, "deprel", "gpt", "gold")] == [("loudly", "advmod", "obl")]
+    assert coverage(conn, "deprel", "gpt", "gold") == (3, 3)
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""K-fold heldout evaluation of Stanza and GPT on the systematic PP sets.
+
+Folds are the dataset's existing heldout files (<stem>.heldout1.json ...,
+found next to the dataset or listed with --folds), or, with --k, a seeded
+split of the dataset itself that is stratified by template (or by attachment
+when the examples carry no template).  Every (fold, system) pair is one job;
+the jobs run in parallel and all GPT requests draw from one shared --rpm /
+--tpm budget.  Stanza pipelines come from one shared PipelinePool (per
+language, from an example's "lang" field or --lang) and folds take turns parsing.
+
+Each job's results are cached as JSONL in --cache_dir under a key made from
+the fold's examples and the system's settings, so adding a fold (or rerunning
+after a crash) only evaluates what is missing.  A GPT job in which any API call
+failed is reported as failed and not cached, so an outage or a burst of 429s
+is retried on the next run instead of being kept as wrong answers.  The report gives per-fold
+accuracy, the mean and standard deviation over folds, and the pooled accuracy,
+all with 95% Wilson intervals.
+
+Without --live_run nothing is evaluated: the folds and cache hits are listed
+and the GPT requests still to be made are estimated.
+"""
+
+from __future__ import annotations
+
+import argparse
+import glob
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import re
+import statistics
+import sys
+import threading
+from collections import defaultdict
+from types import SimpleNamespace
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.estimate import add_estimate_arguments, make_estimator
+from common.pipelines import add_pipeline_arguments, make_pipeline_pool, parse_stream
+from common.ratelimit import BudgetedClient, RateBudget
+from common.tracing import add_trace_argument, setup_tracing, span
+from common.usage import TrackedClient
+from pp_data import iter_examples
+import gptapi_against_gpt as gptapi
+import stanza_against_gpt
+
+SYSTEMS = ("stanza", "gpt")
+Z_95 = 1.96
+
+logger = None
+
+
+def setup_args():
+    parser = argparse.ArgumentParser(description='Cross-validate Stanza and GPT PP attachment over heldout folds')
+    parser.add_argument('dataset', help='JSON or JSONL dataset; its <stem>.heldoutN files are the folds by default')
+    parser.add_argument('--live_run', action='store_true',
+                        help='If set, evaluate the uncached folds. Otherwise, list folds and estimate the cost')
+    parser.add_argument('--folds', help='Comma-separated fold files or globs (default: the dataset\'s heldout files)')
+    parser.add_argument('--k', type=int, help='Split the dataset itself into K folds instead of using heldout files')
+    parser.add_argument('--seed', type=int, default=0, help='Shuffle seed for --k (default: 0)')
+    parser.add_argument('--systems', default=','.join(SYSTEMS), help=f'Systems to evaluate (default: {",".join(SYSTEMS)})')
+    parser.add_argument('--workers', type=int, default=4, help='Folds evaluated at once (default: 4)')
+    parser.add_argument('--cache_dir', default='data/output/systematic_pp/crossval',
+                        help='Directory for per-fold result files (default: data/output/systematic_pp/crossval)')
+    parser.add_argument('--summary_file', help='Also write the aggregate report as JSON')
+    parser.add_argument('--pack_size', type=int, default=1,
+                        help='GPT: pack up to this many examples into one request (default: 1 = unpacked)')
+    parser.add_argument('--pack_token_budget', type=int, default=1500,
+                        help='GPT: close a pack early once its prompt would exceed this many tokens')
+    add_pipeline_arguments(parser)
+    add_trace_argument(parser)
+    add_estimate_arguments(parser)
+    args = parser.parse_args()
+
+    args.systems = [s.strip() for s in args.systems.split(',') if s.strip()]
+    unknown = [s for s in args.systems if s not in SYSTEMS]
+    if unknown:
+        parser.error(f"unknown system(s): {', '.join(unknown)}")
+    if args.k is not None and args.k < 2:
+        parser.error("--k must be at least 2")
+    if args.k is not None and args.folds:
+        parser.error("--k and --folds are mutually exclusive")
+    return args
+
+
+def heldout_files(dataset: str) -> List[str]:
+    """<stem>.heldoutN.json[l] files next to the dataset, in fold order."""
+    stem = re.sub(r"\.jsonl?$", "", dataset)
+    found = [p for p in glob.glob(f"{glob.escape(stem)}.heldout*.json*")
+             if re.search(r"\.heldout\d+\.jsonl?$", p)]
+    return sorted(found, key=lambda p: int(re.search(r"\.heldout(\d+)\.", p).group(1)))
+
+
+def split_folds(examples: List[Dict], k: int, seed: int) -> List[List[Dict]]:
+    """Seeded shuffle, then deal each stratum round-robin so folds share the template/attachment mix."""
+    strata = defaultdict(list)
+    for example in examples:
+        strata[example.get("template", example["correct_attachment"].lower())].append(example)
+    rng = random.Random(seed)
+    folds = [[] for _ in range(k)]
+    dealt = 0
+    for key in sorted(strata):
+        members = strata[key]
+        rng.shuffle(members)
+        for example in members:
+            folds[dealt % k].append(example)
+            dealt += 1
+    return folds
+
+
+def load_folds(args) -> List[Tuple[str, List[Dict]]]:
+    """(fold name, examples) pairs."""
+    if args.k:
+        examples = list(iter_examples(args.dataset))
+        stem = os.path.basename(re.sub(r"\.jsonl?$", "", args.dataset))
+        return [(f"{stem}.k{args.k}s{args.seed}.fold{i}", fold)
+                for i, fold in enumerate(split_folds(examples, args.k, args.seed), 1)]
+    if args.folds:
+        paths = []
+        for pattern in args.folds.split(','):
+            pattern = pattern.strip()
+            paths.extend(sorted(glob.glob(pattern)) or [pattern])
+    else:
+        paths = heldout_files(args.dataset)
+        if not paths:
+            raise SystemExit(f"No heldout files found for {args.dataset}; pass --folds or --k")
+    return [(re.sub(r"\.jsonl?$", "", os.path.basename(p)), list(iter_examples(p))) for p in paths]
+
+
+def system_settings(system: str, args) -> Dict:
+    """Everything besides the examples that changes a system's answers."""
+    if system == "gpt":
+        return {"model": "gpt-4", "system_prompt": gptapi.SYSTEM_PROMPT,
+                "prompt": gptapi.attachment_prompt("{sentence}", "{phrase}"),
+                "pack_header": gptapi.PACK_HEADER, "pack_size": args.pack_size,
+                "pack_token_budget": args.pack_token_budget}
+    return {"processors": "tokenize,pos,lemma,depparse", "lang": args.lang}
+
+
+def cache_path(cache_dir: str, fold: str, system: str, examples: List[Dict], settings: Dict) -> str:
+    digest = hashlib.sha1(json.dumps([examples, settings], sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{fold}.{system}.{digest}.jsonl")
+
+
+def read_results(path: str) -> List[Dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def write_results(path: str, results: List[Dict]):
+    tmp = path + ".tmp"
+    with open(tmp, 'w') as f:
+        for result in results:
+            json.dump(result, f)
+            f.write('\n')
+    os.replace(tmp, path)
+
+
+class StanzaRunner:
+    """One shared pipeline pool, loaded on first use; folds take turns parsing."""
+
+    def __init__(self, args):
+        self.args = args
+        self.pool = make_pipeline_pool(args)
+        self._lock = threading.Lock()
+
+    def evaluate(self, examples: List[Dict]) -> List[Dict]:
+        with self._lock:
+            parsed = parse_stream(self.pool, examples, lambda example: example.get("lang", self.args.lang),
+                                  lambda example: example["sentence"], self.args.parse_batch_size)
+            return [stanza_against_gpt.evaluate_parsed(example, sentences[0]) for example, sentences in parsed]
+
+
+class FailureCountingClient:
+    """Per-job client proxy counting API calls that raised (the gptapi helpers log and swallow them)."""
+
+    def __init__(self, client):
+        self._client = client
+        self.failures = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, **kwargs):
+        try:
+            return self._client.chat.completions.create(**kwargs)
+        except Exception:
+            self.failures += 1
+            raise
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def evaluate_gpt(client, examples: List[Dict], args) -> List[Dict]:
+    results = []
+    for pack in gptapi.pack_examples(examples, args.pack_size, args.pack_token_budget):
+        pack_results, _ = gptapi.evaluate_pack(client, pack)
+        results.extend(pack_results)
+    return results
+
+
+def run_job(fold: str, system: str, examples: List[Dict], path: str, client, stanza_runner: StanzaRunner,
+            args) -> List[Dict]:
+    with span("fold", fold=fold, system=system):
+        if system == "gpt":
+            counted = FailureCountingClient(client)
+            results = evaluate_gpt(counted, examples, args)
+            if counted.failures:
+                raise RuntimeError(f"{counted.failures} API call(s) failed; results not cached, rerun to retry")
+        else:
+            results = stanza_runner.evaluate(examples)
+    write_results(path, results)
+    return results
+
+
+def wilson(correct: int, total: int, z: float = Z_95) -> Tuple[float, float]:
+    if not total:
+        return 0.0, 0.0
+    p = correct / total
+    denominator = 1 + z * z / total
+    centre = (p + z * z / (2 * total)) / denominator
+    half = z * math.sqrt(p * (1 - p) / total + z * z / (4 * total * total)) / denominator
+    return max(0.0, centre - half), min(1.0, centre + half)
+
+
+def aggregate(results: Dict[Tuple[str, str], List[Dict]], folds: List[str], system: str) -> Optional[Dict]:
+    rows = []
+    for fold in folds:
+        fold_results = results.get((fold, system))
+        if fold_results is None:
+            continue
+        correct = sum(bool(r["correct"]) for r in fold_results)
+        total = len(fold_results)
+        rows.append({"fold": fold, "correct": correct, "total": total,
+                     "accuracy": correct / total if total else 0.0, "ci": wilson(correct, total)})
+    if not rows:
+        return None
+    accuracies = [row["accuracy"] for row in rows]
+    correct = sum(row["correct"] for row in rows)
+    total = sum(row["total"] for row in rows)
+    std = statistics.stdev(accuracies) if len(rows) > 1 else 0.0
+    # Normal approximation for the fold mean; with few folds the std is the more telling spread.
+    half = Z_95 * std / math.sqrt(len(rows))
+    return {"system": system, "folds": rows, "mean": statistics.mean(accuracies), "std": std,
+            "mean_ci": (max(0.0, statistics.mean(accuracies) - half), min(1.0, statistics.mean(accuracies) + half)),
+            "pooled": correct / total if total else 0.0, "pooled_ci": wilson(correct, total),
+            "correct": correct, "total": total}
+
+
+def report(summary: Dict) -> List[str]:
+    lines = [f"\n📊 {summary['system']}",
+             f"   {'fold':<40}{'correct':>10}{'accuracy':>10}{'95% CI':>18}"]
+    for row in summary["folds"]:
+        low, high = row["ci"]
+        lines.append(f"   {row['fold']:<40}{row['correct']:>5}/{row['total']:<4}{row['accuracy']:>10.2%}"
+                     f"   [{low:6.2%}, {high:6.2%}]")
+    low, high = summary["mean_ci"]
+    lines.append(f"   {'mean ± std over ' + str(len(summary['folds'])) + ' folds':<50}{summary['mean']:>10.2%}"
+                 f"   [{low:6.2%}, {high:6.2%}]   ± {summary['std']:.2%}")
+    low, high = summary["pooled_ci"]
+    lines.append(f"   {'pooled':<40}{summary['correct']:>5}/{summary['total']:<4}{summary['pooled']:>10.2%}"
+                 f"   [{low:6.2%}, {high:6.2%}]")
+    return lines
+
+
+def main():
+    global logger
+    args = setup_args()
+    setup_tracing(args.trace)
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(message)s',
+        handlers=[logging.StreamHandler(sys.stdout)]
+    )
+    logger = logging.getLogger(__name__)
+
+    folds = load_folds(args)
+    os.makedirs(args.cache_dir, exist_ok=True)
+    logger.info(f"{len(folds)} folds, {sum(len(examples) for _, examples in folds)} examples, "
+                f"systems: {', '.join(args.systems)}")
+
+    results = {}
+    pending = []
+    for fold, examples in folds:
+        for system in args.systems:
+            path = cache_path(args.cache_dir, fold, system, examples, system_settings(system, args))
+            if os.path.exists(path):
+                results[(fold, system)] = read_results(path)
+                logger.info(f"  ♻️  {fold} / {system}: cached ({path})")
+            else:
+                pending.append((fold, system, examples, path))
+                logger.info(f"  ⏳ {fold} / {system}: {len(examples)} examples to evaluate")
+
+    if not args.live_run:
+        logger.info("Running in DRY RUN mode - will only estimate the cost of the uncached folds")
+        estimator = make_estimator(args)
+        for fold, system, examples, path in pending:
+            if system != "gpt":
+                continue
+            for pack in gptapi.pack_examples(examples, args.pack_size, args.pack_token_budget):
+                if len(pack) == 1:
+                    estimator.add_prompt("gpt-4", gptapi.attachment_prompt(pack[0]["sentence"],
+                                                                           pack[0]["ambiguous_phrase"]),
+                                         gptapi.ANSWER_TOKENS, gptapi.SYSTEM_PROMPT)
+                else:
+                    estimator.add_prompt("gpt-4", gptapi.build_packed_prompt(pack),
+                                         gptapi.PACKED_ANSWER_TOKENS_PER_ITEM * len(pack), gptapi.SYSTEM_PROMPT)
+        for line in estimator.summary():
+            logger.info(line)
+    elif pending:
+        client = None
+        budget = RateBudget(args.rpm, args.tpm)
+        if any(system == "gpt" for _, system, _, _ in pending):
+            from openai import OpenAI
+            client = BudgetedClient(TrackedClient(OpenAI()), budget)
+        stanza_runner = StanzaRunner(args)
+        logger.info(f"Running in LIVE mode - {len(pending)} fold jobs on {args.workers} workers")
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            futures = {pool.submit(run_job, fold, system, examples, path, client, stanza_runner, args): (fold, system)
+                       for fold, system, examples, path in pending}
+            for future in as_completed(futures):
+                fold, system = futures[future]
+                try:
+                    results[(fold, system)] = future.result()
+                except Exception as e:
+                    logger.error(f"❌ {fold} / {system} failed: {e}")
+                    continue
+                correct = sum(bool(r["correct"]) for r in results[(fold, system)])
+                logger.info(f"✅ {fold} / {system}: {correct}/{len(results[(fold, system)])}")
+        if client is not None:
+            logger.info(budget.summary())
+            for line in client.usage.summary():
+                logger.info(line)
+        if stanza_runner.pool.loads:
+            logger.info(stanza_runner.pool.summary())
+
+    summaries = [s for s in (aggregate(results, [fold for fold, _ in folds], system) for system in args.systems) if s]
+    for summary in summaries:
+        for line in report(summary):
+            logger.info(line)
+    missing = len(folds) * len(args.systems) - len(results)
+    if missing:
+        logger.info(f"\n{missing} fold job(s) not evaluated yet; the aggregates cover the cached folds only")
+
+    if args.summary_file and summaries:
+        with open(args.summary_file, 'w') as f:
+            json.dump(summaries, f, indent=2)
+        logger.info(f"Summary written to {args.summary_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+"""Generate systematic PP-attachment examples from lexicons and templates.
+
+Each template fixes which word the prepositional phrase attaches to (the verb
+for instruments and locative arguments, the object noun for attributes and
+"of" phrases), and its slots are filled from small lexicons.  The combination
+space is walked in a scrambled order, rendered in parallel by a worker pool,
+deduplicated, and streamed out as JSONL records:
+
+    {"sentence": ..., "ambiguous_phrase": ..., "correct_attachment": ...,
+     "template": ..., "attachment_type": "verb" | "noun"}
+
+With --heldout_folds K the stream is split into a dev file plus K heldout
+files (<base>.heldout1.jsonl ...), round-robin within each template so every
+split has the same template/attachment mix.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import sys
+from collections import Counter
+from multiprocessing import Pool
+from typing import Dict, Iterator, List, Optional, Tuple
+
+AGENTS = ["boy", "girl", "man", "woman", "chef", "farmer", "teacher", "student", "doctor", "artist",
+          "pilot", "carpenter", "gardener", "soldier", "nurse", "baker", "tailor", "sailor", "painter", "mechanic"]
+AGENT_ADJECTIVES = ["", "young", "tired", "careful", "busy", "old", "happy", "quiet"]
+OBJECT_ADJECTIVES = ["", "old", "new", "small", "large", "red", "blue", "heavy", "wooden", "broken", "shiny", "dusty"]
+
+# verb -> (objects, instruments): "with the <instrument>" attaches to the verb.
+INSTRUMENT_FRAMES = {
+    "cut": (["bread", "rope", "paper", "cake", "cloth"], ["knife", "scissors", "blade"]),
+    "opened": (["door", "box", "letter", "jar", "window"], ["key", "knife", "crowbar"]),
+    "painted": (["fence", "wall", "chair", "door"], ["brush", "roller", "sponge"]),
+    "fixed": (["car", "bike", "clock", "radio", "sink"], ["wrench", "screwdriver", "hammer"]),
+    "ate": (["soup", "rice", "salad", "noodles"], ["spoon", "fork", "chopsticks"]),
+    "hit": (["ball", "nail", "drum"], ["bat", "hammer", "stick"]),
+    "watched": (["birds", "stars", "ship", "game"], ["telescope", "binoculars", "camera"]),
+    "wrote": (["letter", "note", "poem", "report"], ["pen", "pencil", "marker"]),
+    "cleaned": (["floor", "table", "window", "car"], ["mop", "cloth", "sponge"]),
+    "measured": (["room", "table", "board", "wall"], ["ruler", "tape", "laser"]),
+}
+
+# verb -> (objects, "prep place" goals): the locative is an argument of the verb.
+LOCATIVE_FRAMES = {
+    "put": (["vase", "book", "cup", "lamp", "plate"], ["on the table", "on the shelf", "in the box", "under the bed"]),
+    "placed": (["vase", "book", "cup", "lamp", "plate"], ["on the table", "on the shelf", "in the box", "near the door"]),
+    "hid": (["key", "letter", "money", "ring", "map"], ["under the bed", "in the drawer", "behind the sofa", "in the box"]),
+    "stored": (["tools", "files", "apples", "blankets"], ["in the garage", "in the cellar", "in the attic", "in the drawer"]),
+    "left": (["bag", "coat", "umbrella", "phone"], ["on the bus", "in the car", "at the station", "near the door"]),
+}
+
+# object -> attributes: "with the <attribute>" attaches to the object noun.
+ATTRIBUTE_FRAMES = {
+    "man": ["beard", "hat", "cane", "glasses"],
+    "woman": ["scarf", "necklace", "briefcase", "glasses"],
+    "house": ["garden", "chimney", "porch", "balcony"],
+    "dog": ["collar", "spots", "bandana"],
+    "car": ["sunroof", "spoiler", "dent"],
+    "book": ["cover", "map", "bookmark"],
+    "girl": ["braids", "backpack", "kite"],
+    "shirt": ["buttons", "stripes", "pocket"],
+}
+ATTRIBUTE_VERBS = ["saw", "liked", "met", "photographed", "admired", "noticed", "followed", "visited", "bought", "found"]
+
+# container -> contents: "of <content>" attaches to the container noun.
+CONTAINER_FRAMES = {
+    "bottle": ["water", "wine", "oil", "milk"],
+    "cup": ["tea", "coffee", "soup", "cocoa"],
+    "box": ["chocolates", "nails", "crayons", "matches"],
+    "bag": ["flour", "rice", "apples", "marbles"],
+    "jar": ["honey", "jam", "pickles", "coins"],
+    "basket": ["bread", "eggs", "flowers", "berries"],
+}
+CONTAINER_VERBS = ["carried", "opened", "dropped", "bought", "sold", "grabbed", "found", "emptied"]
+
+
+def subject(adj: str, agent: str) -> str:
+    return f"The {adj} {agent}" if adj else f"The {agent}"
+
+
+def noun_phrase(adj: str, noun: str) -> str:
+    return f"the {adj} {noun}" if adj else f"the {noun}"
+
+
+def _flatten(frames: Dict[str, Tuple[List[str], List[str]]]) -> List[Tuple[str, str, str]]:
+    return [(verb, obj, extra) for verb, (objs, extras) in frames.items() for obj in objs for extra in extras]
+
+
+def render_instrument(slots) -> Dict:
+    agent_adj, agent, obj_adj, (verb, obj, tool) = slots
+    phrase = f"with the {tool}"
+    return {"sentence": f"{subject(agent_adj, agent)} {verb} {noun_phrase(obj_adj, obj)} {phrase}.",
+            "ambiguous_phrase": phrase, "correct_attachment": verb}
+
+
+def render_locative(slots) -> Dict:
+    agent_adj, agent, obj_adj, (verb, obj, place) = slots
+    return {"sentence": f"{subject(agent_adj, agent)} {verb} {noun_phrase(obj_adj, obj)} {place}.",
+            "ambiguous_phrase": place, "correct_attachment": verb}
+
+
+def render_attribute(slots) -> Dict:
+    agent_adj, agent, verb, obj_adj, (obj, attribute) = slots
+    phrase = f"with the {attribute}"
+    return {"sentence": f"{subject(agent_adj, agent)} {verb} {noun_phrase(obj_adj, obj)} {phrase}.",
+            "ambiguous_phrase": phrase, "correct_attachment": obj}
+
+
+def render_container(slots) -> Dict:
+    agent_adj, agent, verb, obj_adj, (container, content) = slots
+    phrase = f"of {content}"
+    return {"sentence": f"{subject(agent_adj, agent)} {verb} {noun_phrase(obj_adj, container)} {phrase}.",
+            "ambiguous_phrase": phrase, "correct_attachment": container}
+
+
+# name -> (attachment type, renderer, slot option lists)
+TEMPLATES = {
+    "instrument": ("verb", render_instrument,
+                   [AGENT_ADJECTIVES, AGENTS, OBJECT_ADJECTIVES, _flatten(INSTRUMENT_FRAMES)]),
+    "locative": ("verb", render_locative,
+                 [AGENT_ADJECTIVES, AGENTS, OBJECT_ADJECTIVES, _flatten(LOCATIVE_FRAMES)]),
+    "attribute": ("noun", render_attribute,
+                  [AGENT_ADJECTIVES, AGENTS, ATTRIBUTE_VERBS, OBJECT_ADJECTIVES,
+                   [(o, a) for o, attrs in ATTRIBUTE_FRAMES.items() for a in attrs]]),
+    "container": ("noun", render_container,
+                  [AGENT_ADJECTIVES, AGENTS, CONTAINER_VERBS, OBJECT_ADJECTIVES,
+                   [(c, x) for c, xs in CONTAINER_FRAMES.items() for x in xs]]),
+}
+
+# Large prime used to visit each template's combination space in scrambled order.
+SCRAMBLE = 2_147_483_647
+
+
+def space_size(options: List[List]) -> int:
+    size = 1
+    for opts in options:
+        size *= len(opts)
+    return size
+
+
+def decode(index: int, options: List[List]) -> List:
+    """Mixed-radix decode of a combination index into one choice per slot."""
+    slots = []
+    for opts in reversed(options):
+        index, r = divmod(index, len(opts))
+        slots.append(opts[r])
+    return list(reversed(slots))
+
+
+def is_valid(record: Dict) -> bool:
+    """The attachment word must occur once, so the head-word answer is unambiguous."""
+    words = record["sentence"].rstrip(".").split()
+    return words.count(record["correct_attachment"]) == 1 and record["sentence"].count(record["ambiguous_phrase"]) == 1
+
+
+def render_chunk(task: Tuple[Tuple[str, ...], int, int, int]) -> List[Tuple[int, Dict]]:
+    """Worker: render local indices [start, end), interleaving the templates."""
+    templates, start, end, seed = task
+    sizes = [space_size(TEMPLATES[name][2]) for name in templates]
+    out = []
+    for i in range(start, end):
+        for name, size in zip(templates, sizes):
+            if i >= size:
+                continue
+            attachment_type, render, options = TEMPLATES[name]
+            record = render(decode((i * SCRAMBLE + seed) % size, options))
+            if not is_valid(record):
+                continue
+            record["template"] = name
+            record["attachment_type"] = attachment_type
+            key = int.from_bytes(hashlib.blake2b(record["sentence"].lower().encode(), digest_size=8).digest(), "little")
+            out.append((key, record))
+    return out
+
+
+def chunk_tasks(templates: List[str], chunk_size: int, seed: int) -> Iterator[Tuple[Tuple[str, ...], int, int, int]]:
+    longest = max(space_size(TEMPLATES[name][2]) for name in templates)
+    for start in range(0, longest, chunk_size):
+        yield (tuple(templates), start, min(start + chunk_size, longest), seed)
+
+
+def generate(templates: List[str], limit: Optional[int], workers: int, chunk_size: int, seed: int) -> Iterator[Dict]:
+    seen = set()
+    tasks = chunk_tasks(templates, chunk_size, seed)
+    produced = 0
+    with Pool(workers) as pool:
+        for chunk in pool.imap(render_chunk, tasks):
+            for key, record in chunk:
+                if key in seen:
+                    continue
+                seen.add(key)
+                yield record
+                produced += 1
+                if limit is not None and produced >= limit:
+                    pool.terminate()
+                    return
+
+
+def split_path(base: str, fold: int) -> str:
+    stem = base[:-len(".jsonl")] if base.endswith(".jsonl") else base
+    return f"{stem}.jsonl" if fold == 0 else f"{stem}.heldout{fold}.jsonl"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate systematic PP-attachment examples as JSONL')
+    parser.add_argument('output', help='Output JSONL path (base name when splitting into heldout folds)')
+    parser.add_argument('--n', type=int, help='Stop after this many unique examples (default: all combinations)')
+    parser.add_argument('--templates', default=','.join(TEMPLATES),
+                        help=f'Comma-separated templates to use (default: {",".join(TEMPLATES)})')
+    parser.add_argument('--heldout_folds', type=int, default=0,
+                        help='Also split into K heldout files, stratified by template')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--chunk_size', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0, help='Offset into the scrambled combination order')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s', handlers=[logging.StreamHandler(sys.stdout)])
+    logger = logging.getLogger(__name__)
+
+    templates = [t.strip() for t in args.templates.split(',') if t.strip()]
+    unknown = [t for t in templates if t not in TEMPLATES]
+    if unknown:
+        parser.error(f"unknown template(s) {unknown}; choose from {list(TEMPLATES)}")
+
+    for name in templates:
+        logger.info(f"Template {name}: {space_size(TEMPLATES[name][2])} combinations")
+
+    n_splits = args.heldout_folds + 1
+    outputs = [open(split_path(args.output, fold), 'w') for fold in range(n_splits)]
+    per_template = Counter()
+    per_split = Counter()
+    try:
+        for record in generate(templates, args.n, args.workers, args.chunk_size, args.seed):
+            fold = per_template[record["template"]] % n_splits
+            per_template[record["template"]] += 1
+            per_split[fold] += 1
+            outputs[fold].write(json.dumps(record) + '\n')
+    finally:
+        for f in outputs:
+            f.close()
+
+    logger.info(f"\n✅ Wrote {sum(per_split.values())} unique examples")
+    for fold in range(n_splits):
+        logger.info(f"  {split_path(args.output, fold)}: {per_split[fold]}")
+    for name, count in per_template.items():
+        logger.info(f"  template {name}: {count}")
+
+
+if __name__ == "__main__":
+    main()
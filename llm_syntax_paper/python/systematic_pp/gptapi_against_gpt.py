@@ -1,21 +1,54 @@
 #!/usr/bin/env python3
 
-from openai import OpenAI
+from __future__ import annotations
+
 import json
 import argparse
 import logging
+import re
 import sys
 import os
+from collections import defaultdict
 from pathlib import Path
-from typing import List, Dict
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    from openai import OpenAI
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.tracing import add_trace_argument, setup_tracing, span
+from common.router import add_router_arguments, make_router
+from common.tokens import count_tokens
+from common.dedup import add_dedup_arguments, plan_dedup
+from common.estimate import add_estimate_arguments, make_estimator
+from common.usage import TrackedClient
+from pp_data import iter_examples
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_PROMPT = "You are a linguist helping analyze syntactic attachments."
+
+PACK_HEADER = (
+    "For each numbered item below, give the word in the sentence that the quoted phrase attaches to syntactically.\n"
+    "Respond with only a JSON object mapping each item number to its head word, "
+    "e.g. {\"1\": \"saw\", \"2\": \"man\"}.\n"
+)
 
 def setup_args():
     parser = argparse.ArgumentParser(description='Evaluate GPT API dependency parsing on ambiguous attachments')
-    parser.add_argument('input_file', help='Input JSON file with examples')
+    parser.add_argument('input_file', help='Input JSON or JSONL file with examples')
     parser.add_argument('--live_run', action='store_true',
-                       help='If set, actually query OpenAI API. Otherwise, just print examples')
+                       help='If set, actually query OpenAI API. Otherwise, estimate the cost of the run')
     parser.add_argument('--output_base', 
                        help='Base directory for output files (required for live run)')
+    parser.add_argument('--pack_size', type=int, default=1,
+                       help='Pack up to this many examples into one request with a JSON answer (default: 1 = unpacked)')
+    parser.add_argument('--pack_token_budget', type=int, default=1500,
+                       help='Close a pack early once its prompt would exceed this many tokens')
+    add_router_arguments(parser, "pp_head")
+    add_dedup_arguments(parser)
+    add_trace_argument(parser)
+    add_estimate_arguments(parser)
     args = parser.parse_args()
     
     # Check if output_base is provided when doing a live run
@@ -36,49 +69,176 @@ def get_output_path(input_file: str, output_base: str) -> Path:
     output_filename = input_path.stem + '.jsonl'
     return output_dir / output_filename
 
-def get_llm_attachment_head(client: OpenAI, sentence: str, phrase: str) -> str:
-    """Query GPT to find the syntactic head that a phrase attaches to."""
-    prompt = (
+router = None
+pack_router = None
+
+# Expected answer lengths in tokens, for dry-run estimates: one head word, or a JSON object of them.
+ANSWER_TOKENS = 2
+PACKED_ANSWER_TOKENS_PER_ITEM = 6
+
+def attachment_prompt(sentence: str, phrase: str) -> str:
+    return (
         f"In the sentence: \"{sentence}\"\n"
         f"What word does the phrase \"{phrase}\" attach to syntactically?\n"
         f"Return only the head word."
     )
 
-    print(prompt)
+def get_llm_attachment_head(client: OpenAI, sentence: str, phrase: str) -> str:
+    """Query GPT to find the syntactic head that a phrase attaches to."""
+    with span("prompt"):
+        prompt = attachment_prompt(sentence, phrase)
+
+    logger.debug(f"Prompt:\n{prompt}")
+
+    if router is not None:
+        answer = router.ask(prompt, sentence)
+        logger.debug(f"Answer ({router.last_tier}): {answer}")
+        return answer.split()[0].lower() if answer and answer.split() else None
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4",
-            messages=[
-                {"role": "system", "content": "You are a linguist helping analyze syntactic attachments."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0,
-        )
+        with span("api", model="gpt-4"):
+            response = client.chat.completions.create(
+                model="gpt-4",
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0,
+            )
         answer = response.choices[0].message.content.strip()
-        print('--------------------------------')
-        print(answer)
-        print("================================================")
+        logger.debug(f"Answer: {answer}")
         return answer.split()[0].lower()
     except Exception as e:
         logging.error(f"Error calling OpenAI API: {e}")
         return None
 
-def evaluate_example(client: OpenAI, example: Dict) -> Dict:
-    """Evaluate a single example using GPT."""
-    predicted_head = get_llm_attachment_head(client, example["sentence"], example["ambiguous_phrase"])
-    expected_head = example["correct_attachment"].lower()
+def pack_item(n: int, example: Dict) -> str:
+    return f"{n}. Sentence: \"{example['sentence']}\"\n   Phrase: \"{example['ambiguous_phrase']}\"\n"
+
+
+def pack_examples(examples: Iterable[Dict], max_items: int, token_budget: int) -> Iterator[List[Dict]]:
+    """Group the example stream into packs of up to max_items that fit the prompt token budget."""
+    base = count_tokens(SYSTEM_PROMPT) + count_tokens(PACK_HEADER)
+    pack, used = [], base
+    for example in examples:
+        cost = count_tokens(pack_item(len(pack) + 1, example))
+        if pack and (len(pack) >= max_items or used + cost > token_budget):
+            yield pack
+            pack, used = [], base
+            cost = count_tokens(pack_item(1, example))
+        pack.append(example)
+        used += cost
+    if pack:
+        yield pack
+
+
+def build_packed_prompt(pack: List[Dict]) -> str:
+    return PACK_HEADER + "\n" + "".join(pack_item(n, ex) for n, ex in enumerate(pack, 1))
+
+
+def parse_packed_answer(answer: str, n_items: int) -> Dict[int, str]:
+    """Item number -> lowercased head word, for the items the JSON answer covers."""
+    match = re.search(r"\{.*\}", answer or "", re.S)
+    if not match:
+        return {}
+    try:
+        data = json.loads(match.group())
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(data, dict):
+        return {}
+    heads = {}
+    for key, value in data.items():
+        if str(key).strip().isdigit() and isinstance(value, str) and value.split():
+            n = int(key)
+            if 1 <= n <= n_items:
+                heads[n] = value.split()[0].strip(".,;:\"'").lower()
+    return heads
+
+
+def is_sentence_word(word: Optional[str], sentence: str) -> bool:
+    return bool(word) and word in re.findall(r"\w+", sentence.lower())
 
+
+def get_llm_packed_heads(client: OpenAI, pack: List[Dict]) -> Dict[int, str]:
+    """Query GPT once for a whole pack; returns the usable item answers."""
+    with span("prompt"):
+        prompt = build_packed_prompt(pack)
+
+    logger.debug(f"Packed prompt ({len(pack)} items):\n{prompt}")
+
+    if pack_router is not None:
+        answer = pack_router.ask(prompt, [example["sentence"] for example in pack])
+        logger.debug(f"Packed answer ({pack_router.last_tier}):\n{answer}")
+        return parse_packed_answer(answer, len(pack))
+
+    try:
+        with span("api", model="gpt-4", items=len(pack)):
+            response = client.chat.completions.create(
+                model="gpt-4",
+                messages=[
+                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0,
+            )
+        answer = response.choices[0].message.content.strip()
+        logger.debug(f"Packed answer:\n{answer}")
+        return parse_packed_answer(answer, len(pack))
+    except Exception as e:
+        logging.error(f"Error calling OpenAI API: {e}")
+        return {}
+
+
+def dedup_text(example: Dict) -> str:
+    """Two items are duplicates only if both the sentence and the questioned phrase match."""
+    return f"{example['sentence']} || {example['ambiguous_phrase']}"
+
+
+def make_result(example: Dict, predicted_head: Optional[str], pack_size: int, retried: bool) -> Dict:
+    expected_head = example["correct_attachment"].lower()
     return {
         "sentence": example["sentence"],
         "ambiguous_phrase": example["ambiguous_phrase"],
         "predicted_head": predicted_head,
         "expected_head": expected_head,
-        "correct": predicted_head == expected_head if predicted_head else False
+        "correct": predicted_head == expected_head if predicted_head else False,
+        "pack_size": pack_size,
+        "retried": retried
     }
 
+
+def evaluate_example(client: OpenAI, example: Dict) -> Dict:
+    """Evaluate a single example using GPT."""
+    predicted_head = get_llm_attachment_head(client, example["sentence"], example["ambiguous_phrase"])
+    return make_result(example, predicted_head, 1, False)
+
+
+def evaluate_pack(client: OpenAI, pack: List[Dict]) -> Tuple[List[Dict], int]:
+    """Evaluate a pack in one request, re-asking items whose answer is missing or not a word of the sentence.
+
+    Returns the results and the number of API calls made.
+    """
+    if len(pack) == 1:
+        return [evaluate_example(client, pack[0])], 1
+
+    heads = get_llm_packed_heads(client, pack)
+    calls = 1
+    results = []
+    for n, example in enumerate(pack, 1):
+        head = heads.get(n)
+        if is_sentence_word(head, example["sentence"]):
+            results.append(make_result(example, head, len(pack), False))
+        else:
+            head = get_llm_attachment_head(client, example["sentence"], example["ambiguous_phrase"])
+            calls += 1
+            results.append(make_result(example, head, len(pack), True))
+    return results, calls
+
 def main():
+    global router, pack_router
     args = setup_args()
+    setup_tracing(args.trace)
     
     logging.basicConfig(
         level=logging.INFO,
@@ -89,49 +249,125 @@ def main():
 
     # Load input data
     logger.info(f"Loading examples from {args.input_file}")
-    with open(args.input_file) as f:
-        examples = json.load(f)
+    examples = iter_examples(args.input_file)
+
+    dedup = None
+    if args.dedup_threshold is not None:
+        dedup = plan_dedup((dedup_text(e) for e in iter_examples(args.input_file)), args.dedup_threshold,
+                           num_perm=args.dedup_num_perm)
+        logger.info(dedup.summary(args.dedup_project, unit="unpacked queries"))
+        examples = (e for i, e in enumerate(examples) if dedup.is_representative(i))
 
     if args.live_run:
         logger.info("Running in LIVE mode - will query OpenAI API")
         # Initialize OpenAI client (assumes OPENAI_API_KEY is set in environment)
-        client = OpenAI()
+        from openai import OpenAI
+        client = TrackedClient(OpenAI())
+        router = make_router(args, client, "pp_head", SYSTEM_PROMPT)
+        if args.pack_size > 1:
+            pack_router = make_router(args, client, "pp_pack", SYSTEM_PROMPT)
         
         # Get output path
         output_file = get_output_path(args.input_file, args.output_base)
         logger.info(f"Will save results to {output_file}")
         
         correct = 0
-        total = len(examples)
+        total = 0
+        calls = 0
+        retried = 0
+        by_pack_size = defaultdict(lambda: [0, 0])
+        # Representatives whose results are projected to exact duplicates afterwards.
+        project_from = {}
+        if dedup is not None and args.dedup_project:
+            project_from = {dedup.representative[i]: None for i, exact in enumerate(dedup.exact) if exact}
+        representative_ids = (i for i in range(len(dedup.representative)) if dedup.is_representative(i)) \
+            if dedup is not None else None
 
         # Process examples and save results
         with open(output_file, 'w') as f:
-            for i, example in enumerate(examples, 1):
-                # Get prediction and evaluate
-                result = evaluate_example(client, example)
-                if result["correct"]:
-                    correct += 1
-                
-                # Print progress
-                logger.info(f"\nExample {i}/{total}:")
-                logger.info(f"Sentence: {result['sentence']}")
-                logger.info(f"→ Phrase: '{result['ambiguous_phrase']}' → predicted: '{result['predicted_head']}', expected: '{result['expected_head']}'")
-                
-                # Write result
-                json.dump(result, f)
-                f.write('\n')
+            for pack in pack_examples(examples, args.pack_size, args.pack_token_budget):
+                # Get predictions and evaluate
+                results, pack_calls = evaluate_pack(client, pack)
+                calls += pack_calls
+                for result in results:
+                    total += 1
+                    if result["correct"]:
+                        correct += 1
+                    retried += result["retried"]
+                    routed = router if result["pack_size"] == 1 else pack_router
+                    if routed is not None and not result["retried"]:
+                        routed.record(result["correct"])
+                    by_pack_size[result["pack_size"]][0] += result["correct"]
+                    by_pack_size[result["pack_size"]][1] += 1
+
+                    # Print progress
+                    logger.info(f"\nExample {total}:")
+                    logger.info(f"Sentence: {result['sentence']}")
+                    logger.info(f"→ Phrase: '{result['ambiguous_phrase']}' → predicted: '{result['predicted_head']}', expected: '{result['expected_head']}'")
+
+                    # Write result
+                    json.dump(result, f)
+                    f.write('\n')
+                    if representative_ids is not None:
+                        i = next(representative_ids)
+                        if i in project_from:
+                            project_from[i] = result
+
+            if project_from:
+                projected = 0
+                for i, example in enumerate(iter_examples(args.input_file)):
+                    if dedup.exact[i]:
+                        source = project_from[dedup.representative[i]]
+                        result = make_result(example, source["predicted_head"], source["pack_size"], source["retried"])
+                        result["projected_from"] = dedup.representative[i]
+                        json.dump(result, f)
+                        f.write('\n')
+                        projected += 1
+                logger.info(f"Projected {projected} results to exact duplicates")
         
         # Print final accuracy
-        accuracy = correct / total
+        accuracy = correct / total if total else 0.0
         logger.info(f"\nFinal Accuracy: {correct}/{total} = {accuracy:.2%}")
+        logger.info(f"API calls: {calls} ({calls / total if total else 0:.2f} per example, {retried} single re-asks)")
+        for routed in (router, pack_router):
+            if routed is not None:
+                for line in routed.summary():
+                    logger.info(line)
+        for line in client.usage.summary():
+            logger.info(line)
+        if args.pack_size > 1:
+            logger.info("Accuracy by pack size:")
+            for size in sorted(by_pack_size):
+                size_correct, size_total = by_pack_size[size]
+                logger.info(f"  {size:3d}: {size_correct}/{size_total} = {size_correct / size_total:.2%}")
             
     else:
-        logger.info("Running in DRY RUN mode - will only print examples")
-        for i, example in enumerate(examples, 1):
-            logger.info(f"\nExample {i}:")
-            logger.info(f"Sentence: {example['sentence']}")
-            logger.info(f"Ambiguous phrase: {example['ambiguous_phrase']}")
-            logger.info(f"Expected head: {example['correct_attachment']}")
+        logger.info("Running in DRY RUN mode - will only estimate the cost of the run")
+        estimator = make_estimator(args)
+        n_examples = 0
+        n_requests = 0
+        for pack in pack_examples(examples, args.pack_size, args.pack_token_budget):
+            n_examples += len(pack)
+            n_requests += 1
+            if len(pack) == 1:
+                example = pack[0]
+                if args.show_prompts:
+                    logger.info(f"\nExample {n_examples} (expected head: {example['correct_attachment']}):")
+                estimator.add_prompt("gpt-4", attachment_prompt(example["sentence"], example["ambiguous_phrase"]),
+                                     ANSWER_TOKENS, SYSTEM_PROMPT)
+            else:
+                if args.show_prompts:
+                    logger.info(f"\nPack {n_requests} ({len(pack)} examples):")
+                estimator.add_prompt("gpt-4", build_packed_prompt(pack),
+                                     PACKED_ANSWER_TOKENS_PER_ITEM * len(pack), SYSTEM_PROMPT)
+        if n_examples:
+            prompt_tokens = sum(stats["prompt_tokens"] for stats in estimator.models.values())
+            logger.info(f"\n{n_examples} examples in {n_requests} requests, "
+                        f"{prompt_tokens / n_examples:.1f} prompt tokens per example")
+        if args.pack_size > 1:
+            logger.info("Packed answers that miss items are re-asked singly; those re-asks are not counted.")
+        for line in estimator.summary():
+            logger.info(line)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,31 @@
+"""Reading systematic PP example files.
+
+The hand-made sets are JSON lists (chatgpt_generated_20*.json); the generated
+sets from generate_pp_dataset.py are JSONL with one record per line.
+iter_examples() reads either, and streams JSONL so large generated sets are
+never loaded into memory at once.
+"""
+
+import json
+from typing import Dict, Iterator
+
+
+def iter_examples(path: str) -> Iterator[Dict]:
+    with open(path) as f:
+        first = ""
+        while not first:
+            line = f.readline()
+            if not line:
+                return
+            first = line.strip()
+
+        if first.startswith("["):
+            f.seek(0)
+            yield from json.load(f)
+            return
+
+        yield json.loads(first)
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
@@ -1,19 +1,30 @@
 #!/usr/bin/env python3
 
-import json
-import stanza
+from __future__ import annotations
+
 import argparse
 import logging
+import os
 import sys
-from typing import List, Dict, Optional
+from typing import TYPE_CHECKING, List, Dict, Optional
+
+if TYPE_CHECKING:
+    import stanza
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common.tracing import add_trace_argument, setup_tracing, span, traced
+from common.pipelines import add_pipeline_arguments, make_pipeline_pool, parse_stream
+from pp_data import iter_examples
 
 def setup_args():
     parser = argparse.ArgumentParser(description='Evaluate Stanza dependency parsing on ambiguous attachments')
-    parser.add_argument('input_file', help='Input JSON file with examples')
+    parser.add_argument('input_file', help='Input JSON or JSONL file with examples')
     parser.add_argument('--live_run', action='store_true',
                         help='If set, download and run Stanza. Otherwise, just print examples')
     parser.add_argument('--output_file',
                         help='File to save CoNLL-U output (required for live run)')
+    add_pipeline_arguments(parser)
+    add_trace_argument(parser)
     args = parser.parse_args()
 
     if args.live_run and not args.output_file:
@@ -21,6 +32,7 @@ def setup_args():
 
     return args
 
+@traced("analyze")
 def analyze_phrase_attachment(phrase: str, sentence_tokens: List, full_sentence: str) -> Dict[str, Optional[str]]:
     phrase = phrase.strip()
     phrase_start = full_sentence.lower().find(phrase.lower())
@@ -55,9 +67,13 @@ def analyze_phrase_attachment(phrase: str, sentence_tokens: List, full_sentence:
 
 
 def evaluate_example(nlp: stanza.Pipeline, example: Dict) -> Dict:
-    doc = nlp(example["sentence"])
-    sentence = doc.sentences[0]
+    with span("stanza"):
+        doc = nlp(example["sentence"])
+    return evaluate_parsed(example, doc.sentences[0])
+
 
+def evaluate_parsed(example: Dict, sentence) -> Dict:
+    """Score the attachment Stanza chose in an already parsed sentence."""
     # analysis = analyze_phrase_attachment(example["ambiguous_phrase"], sentence.words)
     analysis = analyze_phrase_attachment(example["ambiguous_phrase"], sentence.words, example["sentence"])
     predicted_head = analysis["attachment_head"]
@@ -73,6 +89,7 @@ def evaluate_example(nlp: stanza.Pipeline, example: Dict) -> Dict:
 
 def main():
     args = setup_args()
+    setup_tracing(args.trace)
 
     logging.basicConfig(
         level=logging.INFO,
@@ -82,37 +99,38 @@ def main():
     logger = logging.getLogger(__name__)
 
     logger.info(f"Loading examples from {args.input_file}")
-    with open(args.input_file) as f:
-        examples = json.load(f)
+    examples = iter_examples(args.input_file)
 
     if args.live_run:
         logger.info("Running in LIVE mode - will download and run Stanza")
-        stanza.download('en')
-        nlp = stanza.Pipeline(lang='en', processors='tokenize,pos,lemma,depparse')
+        pool = make_pipeline_pool(args)
+        parsed = parse_stream(pool, examples, lambda example: example.get("lang", args.lang),
+                              lambda example: example["sentence"], args.parse_batch_size)
 
         correct = 0
-        total = len(examples)
+        total = 0
 
         with open(args.output_file, 'w') as f:
-            for i, example in enumerate(examples, 1):
-                result = evaluate_example(nlp, example)
+            for i, (example, sentences) in enumerate(parsed, 1):
+                result = evaluate_parsed(example, sentences[0])
+                total += 1
                 if result["correct"]:
                     correct += 1
 
-                logger.info(f"\nExample {i}/{total}:")
+                logger.info(f"\nExample {i}:")
                 logger.info(f"Sentence: {result['sentence']}")
                 logger.info(f"→ Phrase: '{result['ambiguous_phrase']}' → predicted: '{result['predicted_head']}', expected: '{result['expected_head']}'")
 
-                doc = nlp(example["sentence"])
-                for sentence in doc.sentences:
+                for sentence in sentences:
                     f.write(f"# text = {example['sentence']}\n")
                     f.write(f"# predicted_head = {result['predicted_head']}, expected_head = {result['expected_head']}\n")
                     for word in sentence.words:
                         f.write(f"{word.id}\t{word.text}\t{word.lemma}\t{word.upos}\t{word.xpos}\t_\t{word.head}\t{word.deprel}\t_\t_\n")
                     f.write("\n")
 
-        accuracy = correct / total
+        accuracy = correct / total if total else 0.0
         logger.info(f"\nFinal Accuracy: {correct}/{total} = {accuracy:.2%}")
+        logger.info(pool.summary())
 
     else:
         logger.info("Running in DRY RUN mode - will only print examples")
@@ -1,28 +1,42 @@
 #!/usr/bin/env python3
 
-from stanza.utils.conll import CoNLL
 import argparse
-from typing import List, Dict
+import heapq
+import math
+import os
+import sys
+from collections import Counter
+from typing import List, Dict, Iterator, Optional, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'python'))
+from common.pipelines import add_pipeline_arguments
 
 def load_conll_file(file_path: str):
     """Load a CoNLL file and return a list of documents."""
+    from stanza.utils.conll import CoNLL
     return CoNLL.conll2dict(input_file=file_path)
 
 def format_sentence(sentence: List[Dict]) -> str:
     """Format a sentence as plain text."""
     return ' '.join(token['text'] for token in sentence)
 
+def format_id(token_id) -> str:
+    """CoNLL-U id of a conll2dict token: (3,) -> 3, (1, 2) -> 1-2."""
+    if isinstance(token_id, tuple):
+        return '-'.join(str(i) for i in token_id)
+    return str(token_id)
+
 def save_sentence(sentence: List[Dict], output_file):
     """Save a sentence in CoNLL-U format."""
     for token in sentence:
         fields = [
-            str(token['id']).strip('(),'),
+            format_id(token['id']),
             token['text'],
             token.get('lemma', token.get('Lemma', '_')),
             token.get('upos', token.get('UPOS', '_')),
             token.get('xpos', token.get('XPOS', '_')),
             token.get('feats', token.get('Feats', '_')),
-            str(token['head']).strip('(),'),
+            str(token.get('head', '_')).strip('(),'),
             token.get('deprel', token.get('Deprel', '_')),
             token.get('deps', token.get('Deps', '_')),
             token.get('misc', token.get('Misc', '_'))
@@ -30,53 +44,243 @@ def save_sentence(sentence: List[Dict], output_file):
         output_file.write('\t'.join(fields) + '\n')
     output_file.write('\n')
 
+def words_by_id(sentence: List[Dict]) -> Dict[int, Dict]:
+    """Words of a conll2dict sentence by their id, without multiword ranges or empty nodes."""
+    words = {}
+    for token in sentence:
+        token_id = format_id(token['id'])
+        if token_id.isdigit():
+            words[int(token_id)] = token
+    return words
+
 def is_valid_sentence(sentence: List[Dict]) -> bool:
-    """Check that all required fields are present in all tokens."""
+    """Check that all required fields are present in all words (multiword ranges carry no head or deprel)."""
     required_fields = ['id', 'text', 'head', 'deprel']
-    return all(isinstance(tok, dict) and all(f in tok for f in required_fields) for tok in sentence)
+    if not all(isinstance(tok, dict) and 'id' in tok for tok in sentence):
+        return False
+    words = words_by_id(sentence).values()
+    return bool(words) and all(all(f in tok for f in required_fields) for tok in words)
+
+DEFAULT_WEIGHTS = {"rarity": 1.0, "ambiguity": 1.0, "nonprojectivity": 1.0, "length": 0.5, "disagreement": 2.0}
+
+def parse_weights(spec: str) -> Dict[str, float]:
+    weights = dict(DEFAULT_WEIGHTS)
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        name, _, value = item.partition('=')
+        if name not in weights:
+            raise ValueError(f"unknown signal {name!r} (signals: {', '.join(weights)})")
+        weights[name] = float(value)
+    return weights
+
+def word_tokens(tokens: List[Dict]) -> List[Dict]:
+    """Ordinary words of a sentence from common.conllu, without multiword ranges or empty nodes."""
+    return [t for t in tokens if isinstance(t['id'], int)]
+
+def arc_pattern(tokens: List[Dict], token: Dict) -> Tuple[str, str, str]:
+    head = token['head'] or 0
+    head_upos = tokens[head - 1]['upos'] if 0 < head <= len(tokens) else 'ROOT'
+    return head_upos, token['deprel'], token['upos']
+
+def count_arc_patterns(path: str) -> Counter:
+    """(head UPOS, deprel, dependent UPOS) counts over the corpus; bounded by the label inventories."""
+    from common.conllu import read_conllu
+    counts = Counter()
+    for _, tokens in read_conllu(path):
+        words = word_tokens(tokens)
+        counts.update(arc_pattern(words, t) for t in words)
+    return counts
+
+def crossing_arcs(heads: List[int]) -> int:
+    arcs = [(min(d, h), max(d, h)) for d, h in enumerate(heads, 1) if h]
+    return sum(1 for a, b in arcs for c, d in arcs if a < c < b < d)
+
+def attachment_ambiguities(tokens: List[Dict]) -> int:
+    """Case-marked nominals after both a verb and a noun (PP attachment sites), plus conjuncts."""
+    count = 0
+    for i, t in enumerate(tokens):
+        if t['deprel'] == 'conj':
+            count += 1
+        elif t['deprel'] == 'case' and t['upos'] == 'ADP':
+            before = {u['upos'] for u in tokens[:i]}
+            if 'VERB' in before and before & {'NOUN', 'PROPN'}:
+                count += 1
+    return count
+
+def sentence_signals(tokens: List[Dict], patterns: Counter, total: int, target_length: int,
+                     disagreement: Optional[float] = None) -> Dict[str, float]:
+    """Informativeness signals, each scaled to roughly [0, 1]."""
+    n = len(tokens)
+    if not n:
+        return {name: 0.0 for name in DEFAULT_WEIGHTS}
+    # Mean surprisal of the sentence's three rarest arc patterns, relative to a hapax.
+    surprisal = sorted((-math.log((patterns[arc_pattern(tokens, t)] + 1) / (total + 1)) for t in tokens), reverse=True)
+    rarity = sum(surprisal[:3]) / min(3, n) / math.log(total + 1) if total else 0.0
+    return {
+        "rarity": rarity,
+        "ambiguity": min(1.0, attachment_ambiguities(tokens) / 5),
+        "nonprojectivity": min(1.0, crossing_arcs([t['head'] or 0 for t in tokens]) / 2),
+        "length": math.exp(-((n - target_length) / target_length) ** 2),
+        "disagreement": disagreement or 0.0,
+    }
+
+def make_parser(args):
+    """Pretokenized Stanza pipelines per language, for the disagreement signal."""
+    from common.pipelines import make_pipeline_pool
+    return make_pipeline_pool(args, pretokenized=True)
+
+def parse_disagreement(tokens: List[Dict], parsed: List) -> float:
+    """1 - LAS of Stanza against the file's own trees, over the gold tokenization."""
+    if len(parsed) != len(tokens):
+        return 1.0
+    agree = sum(w.head == t['head'] and w.deprel == t['deprel'] for w, t in zip(parsed, tokens))
+    return 1 - agree / len(tokens)
+
+def score_corpus(path: str, weights: Dict[str, float], target_length: int, parser=None, lang: str = "en",
+                 batch_size: int = 32) -> Iterator[Tuple[int, float, Dict[str, float], List[str], List[Dict]]]:
+    """Stream (index, score, signals, comments, tokens) for every sentence of a CoNLL-U file.
+
+    With a parser (a PipelinePool), sentences are parsed in batches per language,
+    taken from a '# lang = xx' comment or lang.
+    """
+    from common.conllu import read_conllu
+    patterns = count_arc_patterns(path)
+    total = sum(patterns.values())
+    sentences = enumerate(read_conllu(path))
+    if parser is None:
+        parsed = ((item, None) for item in sentences)
+    else:
+        from common.pipelines import language_of_comments, parse_stream
+        parsed = parse_stream(parser, sentences,
+                              lambda item: language_of_comments(item[1][0], lang) if word_tokens(item[1][1]) else None,
+                              lambda item: [t['form'] for t in word_tokens(item[1][1])], batch_size)
+    for (index, (comments, tokens)), stanza_sentences in parsed:
+        words = word_tokens(tokens)
+        signals = sentence_signals(words, patterns, total, target_length,
+                                   parse_disagreement(words, stanza_sentences[0].words) if stanza_sentences else None)
+        yield index, sum(weights[name] * value for name, value in signals.items()), signals, comments, tokens
+
+def select_top(scored: Iterator, k: int) -> List[Tuple]:
+    """The k highest-scoring sentences from a stream, keeping only k in memory (earlier wins ties)."""
+    heap = []
+    for index, score, signals, comments, tokens in scored:
+        item = (score, -index, index, signals, comments, tokens)
+        if len(heap) < k:
+            heapq.heappush(heap, item)
+        elif item[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, item)
+    return sorted(heap, key=lambda item: item[2])
+
+def stanza_style(token: Dict) -> Dict:
+    """A common.conllu token in the conll2dict shape save_sentence expects."""
+    return {**token, 'text': token['form'], 'head': '_' if token['head'] is None else token['head']}
+
+def auto_select(args, weights: Dict[str, float], parser):
+    selected = select_top(score_corpus(args.input_file, weights, args.target_length, parser, args.lang,
+                                       args.parse_batch_size), args.num_examples)
+    with open(args.output_file, 'w') as out_f:
+        for score, _, index, signals, comments, tokens in selected:
+            save_sentence([stanza_style(t) for t in tokens], out_f)
+    print(f"{'sent':>6} {'score':>6}  " + " ".join(f"{name[:8]:>8}" for name in weights) + "  text")
+    for score, _, index, signals, comments, tokens in sorted(selected, key=lambda item: -item[0]):
+        text = format_sentence([stanza_style(t) for t in word_tokens(tokens)])
+        print(f"{index + 1:6d} {score:6.2f}  " + " ".join(f"{signals[name]:8.2f}" for name in weights)
+              + f"  {text[:80]}")
+    print(f"\n🎉 Done! Wrote the {len(selected)} highest-scoring sentences to {args.output_file}")
 
 def main():
-    parser = argparse.ArgumentParser(description='Interactively select sentences from a CoNLL file.')
+    parser = argparse.ArgumentParser(description='Select informative sentences from a CoNLL file, interactively or automatically.')
     parser.add_argument("input_file", help="Path to input .conllu file")
     parser.add_argument("output_file", help="Path to output .conllu file")
     parser.add_argument("num_examples", type=int, help="Number of interesting examples to collect")
+    parser.add_argument("--auto", action="store_true",
+                        help="Non-interactive: stream the corpus and keep the num_examples highest-scoring sentences")
+    parser.add_argument("--order", choices=["file", "score"], default="file",
+                        help="Interactive mode: present sentences in file order or by descending score")
+    parser.add_argument("--weights", default="",
+                        help="Score weights, e.g. 'rarity=1,ambiguity=2,disagreement=0' "
+                             f"(defaults: {', '.join(f'{k}={v}' for k, v in DEFAULT_WEIGHTS.items())})")
+    parser.add_argument("--target_length", type=int, default=20, help="Sentence length the length signal favours")
+    parser.add_argument("--stanza", action="store_true",
+                        help="Add the Stanza-vs-file parser disagreement signal (runs the Stanza parser)")
+    parser.add_argument("--pattern", help="Only show sentences matching this semgrex-style pattern, "
+                                          "e.g. '{upos:VERB} >obl ({} >case {upos:ADP})' (see python/common/semgrex.py)")
+    parser.add_argument("--workers", type=int, default=1, help="Processes used to match --pattern")
+    add_pipeline_arguments(parser)
     args = parser.parse_args()
 
+    try:
+        weights = parse_weights(args.weights)
+    except ValueError as e:
+        parser.error(str(e))
+    stanza_parser = make_parser(args) if args.stanza else None
+    if not args.stanza:
+        weights["disagreement"] = 0.0
+
+    if args.auto:
+        if args.pattern:
+            parser.error("--pattern is only supported in interactive mode")
+        auto_select(args, weights, stanza_parser)
+        return
+
+    matches = None
+    if args.pattern:
+        from common.semgrex import PatternError, Treebank, search
+        treebank = Treebank.from_conllu(args.input_file)
+        try:
+            found = search(treebank, args.pattern, workers=args.workers)
+        except PatternError as e:
+            print(f"❌ {e}")
+            return
+        matches = {}
+        for sent_index, bindings in found:
+            matches.setdefault(sent_index, []).append(bindings)
+        print(f"🔎 {len(matches)}/{treebank.n_sentences} sentences match the pattern")
+
     docs = load_conll_file(args.input_file)
-    total_sentences = 0
+    ordered = list(enumerate((sentence for doc in docs for sentence in doc), 1))
+    if args.order == "score":
+        scores = {index + 1: score for index, score, *_ in
+                  score_corpus(args.input_file, weights, args.target_length, stanza_parser, args.lang,
+                               args.parse_batch_size)}
+        ordered.sort(key=lambda item: -scores.get(item[0], 0.0))
     saved_sentences = 0
 
     with open(args.output_file, 'w') as out_f:
-        for doc in docs:
-            for sentence in doc:
-                total_sentences += 1
+        for total_sentences, sentence in ordered:
+            if matches is not None and total_sentences - 1 not in matches:
+                continue
+            
+            if not is_valid_sentence(sentence):
+                print(f"⚠️ Skipping malformed sentence {total_sentences}")
+                continue
                 
-                if not is_valid_sentence(sentence):
-                    print(f"⚠️ Skipping malformed sentence {total_sentences}")
-                    continue
-                    
-                print("\n" * 2)
-                print(f"Sentence {total_sentences}:")
-                print(format_sentence(sentence))
-                print()
-
-
-                while True:
-                    response = input("Is this interesting? (y/n): ").strip().lower()
-                    if response in ['y', 'n']:
-                        break
-                    print("Please answer 'y' or 'n'.")
-
-                if response == 'y':
-                    save_sentence(sentence, out_f)
-                    saved_sentences += 1
-                    print(f"✅ Saved ({saved_sentences}/{args.num_examples})")
-                else:
-                    print("⏩ Skipped.")
-
-                if saved_sentences >= args.num_examples:
-                    print(f"\n🎉 Done! Collected {saved_sentences} examples.")
-                    return
+            print("\n" * 2)
+            print(f"Sentence {total_sentences}:" + (f" (score {scores.get(total_sentences, 0.0):.2f})"
+                                                    if args.order == "score" else ""))
+            print(format_sentence(sentence))
+            if matches is not None:
+                words = words_by_id(sentence)
+                for bindings in matches[total_sentences - 1]:
+                    print("   " + ", ".join(f"{name}={words[token]['text']}" for name, token in bindings.items()))
+            print()
+
+
+            while True:
+                response = input("Is this interesting? (y/n): ").strip().lower()
+                if response in ['y', 'n']:
+                    break
+                print("Please answer 'y' or 'n'.")
+
+            if response == 'y':
+                save_sentence(sentence, out_f)
+                saved_sentences += 1
+                print(f"✅ Saved ({saved_sentences}/{args.num_examples})")
+            else:
+                print("⏩ Skipped.")
+
+            if saved_sentences >= args.num_examples:
+                print(f"\n🎉 Done! Collected {saved_sentences} examples.")
+                return
 
         print(f"\n⚠️ Reached end of file. Only saved {saved_sentences} examples.")
 
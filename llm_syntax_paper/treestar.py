@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Single entry point for the Tree-Star scripts.
+
+    python treestar.py <command> [script arguments]
+    python treestar.py eval <evaluator> [script arguments]
+    python treestar.py --profile-import tags data/input/preliminary/examples25.conllu
+
+Each command runs the existing script in this process with the remaining
+arguments, so every script keeps its own options (`treestar.py tags --help`).
+Only the standard library is imported here; the scripts load stanza and
+openai inside the code paths that need them, so dry runs, evaluations and
+--help start without paying for torch.
+
+--profile-import reruns the command under `python -X importtime` and prints
+the slowest top-level imports after the command's own output.
+"""
+
+import argparse
+import os
+import re
+import runpy
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+COMMANDS = {
+    "tags": "python/preliminary/ask_chatgpt_tags.py",
+    "arcs": "python/preliminary/ask_chatgpt_arcs.py",
+    "arcs-simple": "python/preliminary/ask_chatgpt_arcs_simple.py",
+    "rels": "python/preliminary/ask_chatgpt_rels.py",
+    "oneshot": "python/preliminary/ask_chatgpt_oneshot.py",
+    "main-verbs": "python/preliminary/ask_chatgpt_main_verbs.py",
+    "main-verbs-args": "python/preliminary/ask_chatgpt_main_verbs_with_arguments.py",
+    "pp-generate": "python/systematic_pp/generate_pp_dataset.py",
+    "pp-stanza": "python/systematic_pp/stanza_against_gpt.py",
+    "pp-gpt": "python/systematic_pp/gptapi_against_gpt.py",
+    "pp-crossval": "python/systematic_pp/crossval_pp.py",
+    "rerank": "python/reranker/gptapi_as_reranker.py",
+    "rerank-hint": "python/reranker/gptapi_with_hint.py",
+    "pick-best": "python/reranker/gptapi_pick_best.py",
+    "store": "python/store/annotation_store.py",
+    "semgrex": "python/store/semgrex_search.py",
+    "fol": "python/semantics/dep_to_fol.py",
+    "select": "select_interesting.py",
+    "check": "check_conll.py",
+}
+
+EVALUATORS = {
+    "tags": "eval/evluate_chatgpt_tags.py",
+    "tags-simple": "eval/evluate_chatgpt_tags_simple.py",
+    "deps": "eval/evluate_chatgpt_deps.py",
+    "arcs": "eval/evluate_chatgpt_arcs.py",
+    "reranker": "eval/evluate_chatgpt_as_reranker.py",
+    "gate-curves": "eval/evluate_chatgpt_gate_curves.py",
+    "run-diff": "eval/evluate_run_diff.py",
+}
+
+# "import time:   1234 |      56789 |     package.module" (nesting shown by the indentation of the name).
+IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def setup_args():
+    commands = ", ".join(COMMANDS)
+    evaluators = ", ".join(EVALUATORS)
+    parser = argparse.ArgumentParser(
+        description='Run a Tree-Star script',
+        epilog=f"commands: {commands}, eval <{evaluators}>")
+    parser.add_argument('--profile-import', action='store_true',
+                        help='Run the command under -X importtime and report where startup time goes')
+    parser.add_argument('--top', type=int, default=15, help='Imports to list with --profile-import (default: 15)')
+    parser.add_argument('command', choices=[*COMMANDS, "eval"], metavar='command')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='Arguments for the script')
+    return parser.parse_args()
+
+
+def resolve(parser_args) -> tuple:
+    """(script path, script arguments) for the parsed command line."""
+    if parser_args.command != "eval":
+        return COMMANDS[parser_args.command], parser_args.args
+    if not parser_args.args or parser_args.args[0] not in EVALUATORS:
+        print(f"❌ Usage: treestar.py eval <{'|'.join(EVALUATORS)}> [arguments]", file=sys.stderr)
+        sys.exit(2)
+    return EVALUATORS[parser_args.args[0]], parser_args.args[1:]
+
+
+def run_script(relative_path: str, argv: list):
+    path = os.path.join(ROOT, relative_path)
+    sys.argv = [path] + argv
+    # As when the script is run directly: its siblings (pp_data, risk_gate, ...) are importable.
+    sys.path.insert(0, os.path.dirname(path))
+    runpy.run_path(path, run_name="__main__")
+
+
+def profile_imports(argv: list, top: int) -> int:
+    """Rerun this command with -X importtime and summarize the import tree; returns its exit code."""
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", os.path.abspath(__file__)] + argv,
+                          stderr=subprocess.PIPE, text=True)
+    elapsed = time.perf_counter() - start
+
+    roots = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME.match(line)
+        if match is None:
+            if not line.startswith("import time:"):
+                print(line, file=sys.stderr)
+        elif len(match.group(3)) == 1:
+            roots.append((int(match.group(2)), int(match.group(1)), match.group(4)))
+
+    total = sum(cumulative for cumulative, _, _ in roots)
+    print(f"\n⏱️  Imports took {total / 1e6:.2f}s of {elapsed:.2f}s wall time ({len(roots)} top-level imports)",
+          file=sys.stderr)
+    print(f"{'cumulative':>12} {'self':>10}  module", file=sys.stderr)
+    for cumulative, own, name in sorted(roots, reverse=True)[:top]:
+        print(f"{cumulative / 1e3:10.1f}ms {own / 1e3:8.1f}ms  {name}", file=sys.stderr)
+    return proc.returncode
+
+
+def main():
+    args = setup_args()
+    if args.profile_import:
+        sys.exit(profile_imports([args.command] + args.args, args.top))
+    path, argv = resolve(args)
+    run_script(path, argv)
+
+
+if __name__ == "__main__":
+    main()